@@ -0,0 +1,251 @@
+# -*- coding: UTF-8 -*-
+"""Benchmark extract/enrich/load throughput on synthetic media libraries."""
+import datetime
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+import postgres_etl
+from db import cmd_args
+from db import json_stream
+from db import postgres_api
+from db import sinks
+from db import synthetic
+from db.enrichment import EnrichmentStage
+from db.spotify_cache import LookupCache
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+RESULTS_PATH = pathlib.Path(PARENT_PATH, 'data', 'output', 'benchmarks')
+# fresh interpreter timing the imports of one postgres_etl command
+STARTUP_CODE = ("import json, sys, time\n"
+                "start = time.perf_counter()\n"
+                "import postgres_etl\n"
+                "postgres_etl.import_engines({command!r})\n"
+                "print(json.dumps([time.perf_counter() - start, "
+                "len(sys.modules)]))")
+
+
+def run_stage(func, trace_memory: bool = False) -> dict:
+    """Run func() -> (rows, stage seconds or None[, extra fields])."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    rows, seconds, *extra = func()
+    elapsed = time.perf_counter() - start
+    seconds = elapsed if seconds is None else seconds
+    result = {'rows': rows, 'seconds': round(seconds, 4),
+              'rows_per_sec': round(rows / seconds, 1) if seconds else 0.0}
+    for fields in extra:
+        result.update(fields)
+    if trace_memory:
+        result['peak_traced_mb'] = round(
+            tracemalloc.get_traced_memory()[1] / 1048576, 1)
+        tracemalloc.stop()
+    return result
+
+
+def measure(stage: str, engine: str, tracks: int, func,
+            trace_memory: bool = False) -> dict:
+    """Record throughput and peak memory of func() in a forked child.
+
+    peak_rss_mb is the child's own peak (starting from what the parent
+    held at fork), so a stage does not report an earlier stage's peak.
+    """
+    sys.stdout.flush()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            with os.fdopen(write_fd, mode='w', encoding='utf-8') as pipe:
+                json.dump(run_stage(func, trace_memory), pipe)
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd, encoding='utf-8') as pipe:
+        output = pipe.read()
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        raise RuntimeError(f"{stage} {engine or ''} benchmark failed")
+    result = {'stage': stage, 'engine': engine, 'tracks': tracks,
+              **json.loads(output),
+              'peak_rss_mb': round(usage.ru_maxrss / 1024, 1)}
+    print(f"  {stage:8} {engine or '':7} {tracks:>9} tracks: "
+          f"{result['rows_per_sec']:>10.1f} rows/sec "
+          f"({result['seconds']:0.2f}s, {result['peak_rss_mb']} MB rss)")
+    return result
+
+
+def startup(command: str, runs: int = 3) -> dict:
+    """Median import seconds of a postgres_etl command in new processes.
+
+    process_seconds adds the interpreter start, i.e. the time before
+    the command can connect.
+    """
+    imports, processes, modules = [], [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_CODE.format(command=command)],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        processes.append(time.perf_counter() - start)
+        seconds, modules = json.loads(output.stdout.splitlines()[-1])
+        imports.append(seconds)
+    result = {'stage': 'startup', 'engine': command, 'tracks': 0,
+              'rows': 0, 'seconds': round(statistics.median(imports), 4),
+              'rows_per_sec': 0.0,
+              'process_seconds': round(statistics.median(processes), 4),
+              'modules': modules}
+    print(f"  {'startup':8} {command:7} imports: {result['seconds']:0.3f}s "
+          f"({result['process_seconds']:0.3f}s process, {modules} "
+          f"modules)")
+    return result
+
+
+def extract(json_paths: list) -> tuple:
+    """Stream every generated file, counting rows."""
+    rows = 0
+    for json_path in json_paths:
+        for df in json_stream.iter_split_chunks(json_path):
+            rows += len(df)
+    return rows, None
+
+
+def enrich(json_paths: list, stage: EnrichmentStage) -> tuple:
+    """Enrich every chunk, timing only the enrichment calls."""
+    rows, seconds = 0, 0.0
+    for json_path in json_paths:
+        for df in json_stream.iter_split_chunks(json_path):
+            start = time.perf_counter()
+            stage.enrich(df)
+            seconds += time.perf_counter() - start
+            rows += len(df)
+    return rows, seconds
+
+
+def load(pg_api, library_path: pathlib.Path, engine: str,
+         batch_size: int) -> tuple:
+    """Rebuild tables and load the library end to end with engine."""
+    pg_api.drop_tables()
+    pg_api.create_tables()
+    summary = pg_api.load_data(library_path, engine=engine,
+                               batch_size=batch_size)
+    return summary['rows'], None
+
+
+def sink_load(pg_api, library_path: pathlib.Path, sink,
+              batch_size: int) -> tuple:
+    """Load the library end to end into a sink instead of Postgres."""
+    summary = pg_api.load_data(library_path, engine='copy',
+                               batch_size=batch_size, sink=sink)
+    return summary['rows'], None, {
+        'sink_seconds': round(sink.seconds, 4),
+        'sink_rows_per_sec': round(sink.rate, 1)}
+
+
+def compare(results: list, compare_path: pathlib.Path) -> None:
+    """Print rows/sec change against an earlier results file."""
+    with open(compare_path, encoding='utf-8') as json_file:
+        earlier = {(r['stage'], r['engine'], r['tracks']): r
+                   for r in json.load(json_file)['results']}
+    print(f"\ncompared to '{compare_path.name}':")
+    for result in results:
+        key = (result['stage'], result['engine'], result['tracks'])
+        if key not in earlier:
+            continue
+        if result['stage'] == 'startup' and result['seconds']:
+            # faster startup reads as a speedup like rows/sec
+            ratio = earlier[key]['seconds'] / result['seconds']
+            print(f"  {key[0]:8} {key[1] or '':7} {'':>9}: {ratio:0.2f}x")
+        elif earlier[key]['rows_per_sec']:
+            ratio = result['rows_per_sec'] / earlier[key]['rows_per_sec']
+            print(f"  {key[0]:8} {key[1] or '':7} {key[2]:>9}: "
+                  f"{ratio:0.2f}x")
+
+
+def main():
+    """Generate synthetic libraries, benchmark each stage, save JSON."""
+    print(f"{MODULE_NAME} starting...")
+    args = cmd_args.get_benchmark_args(port_num=5432)
+    pg_api = postgres_api.PostgresMedia(hostname=args.server,
+                                        port_num=args.port_num,
+                                        username=args.username,
+                                        password=args.password,
+                                        db_name=args.database)
+    results = [startup(command, args.startup_runs)
+               for command in postgres_etl.COMMAND_MODULES
+               if args.startup_runs]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for tracks in [] if args.startup_only else args.tracks:
+            library_path = pathlib.Path(args.output_path,
+                                        f"tracks_{tracks}")
+            json_paths = synthetic.generate_library(
+                library_path, tracks=tracks, artists=args.artists,
+                albums_per_artist=args.albums_per_artist,
+                name_length=args.name_length,
+                tracks_per_file=args.tracks_per_file)
+            ids = synthetic.load_offline_ids(library_path)
+            cache = LookupCache(pathlib.Path(temp_dir, f"{tracks}.sqlite"))
+            cache.warm(ids['artist_ids'], ids['album_ids'],
+                       ids['album_artists'])
+            stage = EnrichmentStage(api=None, cache=cache)
+            results.append(measure('extract', None, tracks,
+                                   lambda: extract(json_paths),
+                                   args.trace_memory))
+            results.append(measure('enrich', None, tracks,
+                                   lambda: enrich(json_paths, stage),
+                                   args.trace_memory))
+            pg_api.enricher = stage
+            for name in args.sinks:
+                # whole pipeline rows/sec, plus the sink's own share
+                sink = sinks.create_sink(name)
+                result = measure('sink', name, tracks,
+                                 lambda: sink_load(pg_api, library_path,
+                                                   sink, args.batch_size),
+                                 args.trace_memory)
+                print(f"  {'':8} {name:7} {'':>9}  sink: "
+                      f"{result['sink_rows_per_sec']:>10.1f} rows/sec "
+                      f"({result['sink_seconds']:0.2f}s)")
+                results.append(result)
+                sink.close()
+            if pg_api.is_connected():
+                for engine in args.engines:
+                    results.append(measure(
+                        'load', engine, tracks,
+                        lambda: load(pg_api, library_path, engine,
+                                     args.batch_size),
+                        args.trace_memory))
+            cache.close()
+    if pg_api.is_connected():
+        pg_api.close()
+    RESULTS_PATH.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    results_path = pathlib.Path(RESULTS_PATH, f"etl_bench_{stamp}.json")
+    with open(results_path, mode='w', encoding='utf-8') as json_file:
+        json.dump({'timestamp': stamp, 'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'config': {key: str(value)
+                              for key, value in vars(args).items()
+                              if key != 'password'},
+                   'results': results}, json_file, indent=2)
+    print(f"\nresults: '{results_path}'")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
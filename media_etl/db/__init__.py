@@ -1,5 +1,19 @@
 __all__ = ['cmd_args',
+           'dedup',
+           'enrichment',
+           'export',
+           'json_stream',
+           'metrics',
            'postgres_api',
+           'postgres_async',
            'postgres_insert_queries',
            'postgres_select_queries',
-           'spotify']
\ No newline at end of file
+           'readers',
+           'records',
+           'search',
+           'sinks',
+           'spotify',
+           'spotify_cache',
+           'synthetic',
+           'transform',
+           'watch']
\ No newline at end of file
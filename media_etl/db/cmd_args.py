@@ -4,19 +4,22 @@ import argparse
 import inspect
 import os
 import pathlib
+import sys
 from pathvalidate.argparse import sanitize_filepath_arg
+from db import postgres_insert_queries as sql
+from db import postgres_select_queries as select_sql
+from db import sinks
 
 BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
 PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
 TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+COMMANDS = ['load', 'query', 'status', 'export', 'partition', 'search']
 
-__all__ = ['get_cmd_args']
+__all__ = ['COMMANDS', 'get_cmd_args', 'get_benchmark_args']
 
 
-def get_cmd_args(port_num: int = 5432) -> list:
-    """Command line input on directory to scan recursively for media files."""
-    def_name = inspect.currentframe().f_code.co_name
-    parser = argparse.ArgumentParser(description='media_db_parser')
+def _add_db_args(parser: argparse.ArgumentParser, port_num: int) -> None:
+    """Postgres connection options shared by the command line tools."""
     parser.add_argument("-s", "--server",
                         type=str, default='localhost',
                         help="server ip address or hostname")
@@ -27,23 +30,254 @@ def get_cmd_args(port_num: int = 5432) -> list:
     parser.add_argument("-d", "--database",
                         type=str, default='media_db',
                         help="database name")
-    parser.add_argument("-i", "--input_path",
-                        type=sanitize_filepath_arg,
-                        help="input file path")
     parser.add_argument("-u", "--username",
                         type=str, default='run_admin_run',
                         help="username")
     parser.add_argument("-w", "--password",
                         type=str, default='run_pass_run',
                         help="password")
-    args = parser.parse_args()
-    if args.input_path is None:
-        args.input_path = pathlib.Path(TWO_PARENT_PATH, 'data', 'input')
-    else:
-        args.input_path = pathlib.Path(args.input_path)
-        if args.input_path.exists() and args.file_path.is_dir():
-            print(f"{def_name}() dumping path:'{str(args.input_path)}'")
+
+
+def _add_load_args(parser: argparse.ArgumentParser) -> None:
+    """Options of the load command."""
+    parser.add_argument("-i", "--input_path",
+                        type=sanitize_filepath_arg,
+                        help="input file path")
+    parser.add_argument("-e", "--engine",
+                        type=str, default='insert',
+                        choices=['insert', 'copy'],
+                        help="load engine: row inserts or bulk COPY")
+    parser.add_argument("-b", "--batch_size",
+                        type=int, default=0,
+                        help="rows per COPY transaction (0: one per file)")
+    parser.add_argument("-j", "--workers",
+                        type=int, default=1,
+                        help="worker processes loading files in parallel")
+    parser.add_argument("--incremental",
+                        action='store_true',
+                        help="load only new/changed files (file manifest)")
+    parser.add_argument("--reset",
+                        action='store_true',
+                        help="with --incremental: first remove rows loaded "
+                             "without the manifest")
+    parser.add_argument("--resume",
+                        action='store_true',
+                        help="continue an interrupted load from checkpoints")
+    parser.add_argument("--watch",
+                        action='store_true',
+                        help="keep loading new/changed files as they land")
+    parser.add_argument("--debounce",
+                        type=float, default=2.0,
+                        help="seconds a watched file must stay unchanged")
+    parser.add_argument("--partitioned",
+                        action='store_true',
+                        help="create album/filedata partitioned by "
+                             "year/file_ext")
+    parser.add_argument("--concurrent_indexes",
+                        action='store_true',
+                        help="rebuild indexes CONCURRENTLY after bulk load")
+    parser.add_argument("--progress",
+                        type=float, default=0,
+                        help="seconds between progress lines (0: off)")
+    parser.add_argument("--metrics_path",
+                        type=pathlib.Path,
+                        default=pathlib.Path(TWO_PARENT_PATH, 'data',
+                                             'output', 'metrics'),
+                        help="directory for JSON and Prometheus metrics")
+    parser.add_argument("--sink",
+                        type=str, default='postgres',
+                        choices=sinks.SINKS,
+                        help="load target: memory/null time the stages "
+                             "before the database, sqlite runs locally")
+    parser.add_argument("--sqlite_path",
+                        type=sanitize_filepath_arg,
+                        default=pathlib.Path(TWO_PARENT_PATH, 'data',
+                                             'output', 'media_db.sqlite'),
+                        help="database file of the sqlite sink")
+
+
+def _add_export_args(parser: argparse.ArgumentParser) -> None:
+    """Options of the export command."""
+    parser.add_argument("-o", "--output_path",
+                        type=sanitize_filepath_arg,
+                        default=pathlib.Path(TWO_PARENT_PATH, 'data',
+                                             'output', 'export'),
+                        help="directory for exported part files")
+    parser.add_argument("-x", "--exports",
+                        type=str, nargs='+',
+                        help="tables and/or queries: join gain "
+                             "(default: all tables)")
+    parser.add_argument("-f", "--format",
+                        type=str, default='csv',
+                        choices=['csv', 'parquet'],
+                        help="gzip CSV or Parquet (needs pyarrow)")
+    parser.add_argument("-c", "--chunk_rows",
+                        type=int, default=250000,
+                        help="rows per part file")
+    parser.add_argument("--partition_by",
+                        type=str, choices=['genre', 'year'],
+                        help="one directory per column value")
+    parser.add_argument("--params",
+                        type=str, nargs='*',
+                        help="query params for join/gain")
+    parser.add_argument("-j", "--workers",
+                        type=int, default=1,
+                        help="exports running in parallel")
+
+
+def get_cmd_args(port_num: int = 5432, argv: list = None) -> list:
+    """Command line input: load (default) or one of the other COMMANDS."""
+    def_name = inspect.currentframe().f_code.co_name
+    db_parser = argparse.ArgumentParser(add_help=False)
+    _add_db_args(db_parser, port_num)
+    parser = argparse.ArgumentParser(description='media_db_parser')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    _add_load_args(commands.add_parser(
+        'load', parents=[db_parser],
+        help="scan input path recursively and load media files"))
+    query_parser = commands.add_parser(
+        'query', parents=[db_parser], help="run a named select query")
+    query_parser.add_argument("name",
+                              type=str, choices=list(select_sql.QUERIES),
+                              help="query name")
+    query_parser.add_argument("params",
+                              type=str, nargs='*',
+                              help="query parameter values")
+    commands.add_parser('status', parents=[db_parser],
+                        help="show tables, indexes and fresh views")
+    _add_export_args(commands.add_parser(
+        'export', parents=[db_parser],
+        help="export tables and queries to CSV/Parquet files"))
+    partition_parser = commands.add_parser(
+        'partition', parents=[db_parser],
+        help="list, drop or reload partitions one at a time")
+    partition_parser.add_argument("action",
+                                  type=str,
+                                  choices=['list', 'drop', 'reload'],
+                                  help="partition action")
+    partition_parser.add_argument("table",
+                                  type=str, nargs='?',
+                                  choices=list(sql.PARTITIONS),
+                                  help="partitioned table")
+    partition_parser.add_argument("value",
+                                  type=str, nargs='?',
+                                  help="file extension or year")
+    partition_parser.add_argument("-i", "--input_path",
+                                  type=sanitize_filepath_arg,
+                                  default=pathlib.Path(TWO_PARENT_PATH,
+                                                       'data', 'input'),
+                                  help="source files of a reload")
+    search_parser = commands.add_parser(
+        'search', parents=[db_parser],
+        help="fuzzy (or prefix) search of artist/album/track names")
+    search_parser.add_argument("text",
+                               type=str,
+                               help="name, misspelled or partial")
+    search_parser.add_argument("-k", "--kind",
+                               type=str, default='artist',
+                               choices=list(select_sql.SEARCH_COLUMNS),
+                               help="names to search")
+    search_parser.add_argument("-l", "--limit",
+                               type=int, default=select_sql.SEARCH_LIMIT,
+                               help="maximum results")
+    search_parser.add_argument("--prefix",
+                               action='store_true',
+                               help="autocomplete names starting with text")
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in COMMANDS + ['-h', '--help']:
+        # options without a command load, as before the commands existed
+        argv.insert(0, 'load')
+    args = parser.parse_args(argv)
+    if args.command == 'load':
+        if args.input_path is None:
+            args.input_path = pathlib.Path(TWO_PARENT_PATH, 'data', 'input')
         else:
-            parser.error(f"invalid path: '{str(args.input_path)}'")
-            args.input_path = None
-    return args
\ No newline at end of file
+            args.input_path = pathlib.Path(args.input_path)
+            if args.input_path.exists() and args.input_path.is_dir():
+                print(f"{def_name}() loading path:'{str(args.input_path)}'")
+            else:
+                parser.error(f"invalid path: '{str(args.input_path)}'")
+        args.sqlite_path = pathlib.Path(args.sqlite_path)
+        if args.sink != 'postgres' and (args.watch or args.incremental or
+                                        args.resume):
+            parser.error(f"--sink {args.sink} loads full files only, "
+                         f"without --watch/--incremental/--resume")
+        if args.reset and not args.incremental:
+            parser.error("--reset needs --incremental")
+    elif args.command == 'query':
+        param_count = select_sql.QUERIES[args.name][1]
+        if len(args.params) != param_count:
+            query_parser.error(f"query '{args.name}' takes {param_count} "
+                               f"params, got {len(args.params)}")
+    elif args.command == 'export':
+        args.output_path = pathlib.Path(args.output_path)
+    elif args.command == 'partition':
+        args.input_path = pathlib.Path(args.input_path)
+        if args.action != 'list':
+            if args.value is None:
+                partition_parser.error(f"{args.action} needs a table "
+                                       f"and a value")
+            if sql.PARTITIONS[args.table][0] == 'RANGE':
+                try:
+                    args.value = int(args.value)
+                except ValueError:
+                    partition_parser.error(f"invalid year: '{args.value}'")
+    elif args.command == 'search' and args.limit < 1:
+        search_parser.error(f"invalid limit: {args.limit}")
+    return args
+
+
+def get_benchmark_args(port_num: int = 5432) -> list:
+    """Command line input for the synthetic library ETL benchmark."""
+    parser = argparse.ArgumentParser(description='media_etl_benchmark')
+    _add_db_args(parser, port_num)
+    parser.add_argument("-t", "--tracks",
+                        type=int, nargs='+', default=[10000],
+                        help="library sizes to benchmark (10k..10M)")
+    parser.add_argument("-a", "--artists",
+                        type=int, default=500,
+                        help="distinct artists per library")
+    parser.add_argument("-l", "--albums_per_artist",
+                        type=int, default=4,
+                        help="distinct albums per artist")
+    parser.add_argument("-n", "--name_length",
+                        type=int, default=16,
+                        help="approximate artist/album/track name length")
+    parser.add_argument("-f", "--tracks_per_file",
+                        type=int, default=0,
+                        help="tracks per generated file (0: one file)")
+    parser.add_argument("-e", "--engines",
+                        type=str, nargs='+', default=['insert', 'copy'],
+                        choices=['insert', 'copy'],
+                        help="load engines to benchmark")
+    parser.add_argument("-b", "--batch_size",
+                        type=int, default=0,
+                        help="rows per COPY transaction (0: one per file)")
+    parser.add_argument("-k", "--sinks",
+                        type=str, nargs='*', default=['null', 'sqlite'],
+                        choices=[name for name in sinks.SINKS
+                                 if name != 'postgres'],
+                        help="sinks to load without Postgres")
+    parser.add_argument("-o", "--output_path",
+                        type=sanitize_filepath_arg,
+                        default=pathlib.Path(TWO_PARENT_PATH, 'data',
+                                             'synthetic'),
+                        help="directory for generated libraries")
+    parser.add_argument("-c", "--compare",
+                        type=sanitize_filepath_arg,
+                        help="earlier results JSON to compare against")
+    parser.add_argument("--trace_memory",
+                        action='store_true',
+                        help="tracemalloc peak per stage (slower)")
+    parser.add_argument("--startup_runs",
+                        type=int, default=3,
+                        help="processes timing each command's imports "
+                             "(0: skip)")
+    parser.add_argument("--startup_only",
+                        action='store_true',
+                        help="only benchmark command startup")
+    args = parser.parse_args()
+    args.output_path = pathlib.Path(args.output_path)
+    if args.compare:
+        args.compare = pathlib.Path(args.compare)
+    return args
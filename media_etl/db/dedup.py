@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+"""Content-hash deduplication of media rows ahead of a load."""
+import threading
+
+HASH_COLUMN = 'hash'
+
+__all__ = ['HashFilter', 'dedup_rows']
+
+
+class HashFilter:
+    """Thread safe set of filedata hashes already in the database.
+
+    Preloaded once from filedata, then every hash a load claims is
+    added before its rows are written, so concurrent loads in one
+    process never send the same track twice. Claims of a failed batch
+    are released again. A set (not a Bloom filter) keeps the check
+    exact: a false positive would silently drop a new track.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.__hashes = set()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__hashes)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self.__hashes
+
+    def preload(self, values) -> int:
+        """Add hashes read from the database, return the filter size."""
+        with self.__lock:
+            self.__hashes.update(value for value in values if value)
+            self.loaded = True
+            return len(self.__hashes)
+
+    def reset(self) -> None:
+        """Forget every hash, e.g. after filedata rows were deleted."""
+        with self.__lock:
+            self.__hashes.clear()
+            self.loaded = False
+
+    def claim(self, values: list) -> list:
+        """Per value True if new (and now claimed), False if known.
+
+        Missing hashes cannot be matched and are always new.
+        """
+        new = []
+        with self.__lock:
+            for value in values:
+                if not value:
+                    new.append(True)
+                elif value in self.__hashes:
+                    new.append(False)
+                else:
+                    self.__hashes.add(value)
+                    new.append(True)
+        return new
+
+    def release(self, values) -> None:
+        """Drop claims of rows that were not committed."""
+        with self.__lock:
+            self.__hashes.difference_update(values)
+
+
+def dedup_rows(hash_filter: HashFilter, batch) -> tuple:
+    """Drop rows whose filedata hash is known (or repeated in the batch).
+
+    batch is a records.ColumnBatch whose tables all project the same
+    source rows, so the hash decides for every table. Returns (new
+    batch, claimed hashes, duplicate count); blank hashes are loaded as
+    NULL since they do not identify the content.
+    """
+    hashes = list(batch.column(HASH_COLUMN))
+    new = hash_filter.claim(hashes)
+    duplicates = new.count(False)
+    if duplicates:
+        batch = batch.select(new)
+    if not all(hashes):
+        batch = batch.with_column(HASH_COLUMN, [
+            value or None for value in batch.column(HASH_COLUMN)])
+    claimed = [value for value, keep in zip(hashes, new) if keep and value]
+    return batch, claimed, duplicates
@@ -0,0 +1,315 @@
+# -*- coding: UTF-8 -*-
+"""Concurrent Spotify enrichment stage for batches of media rows."""
+import asyncio
+import base64
+import json
+import pathlib
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from db.spotify import (ConfigClient, LOW_CONFIDENCE, OFFLINE_ALBUM_IDS,
+                        OFFLINE_ARTIST_IDS, SCORE_CUTOFF, match_albums)
+
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+API_URL = 'https://api.spotify.com/v1'
+MAX_IN_FLIGHT = 8
+MAX_RETRIES = 5
+DEFAULT_RETRY_AFTER = 1.0
+ALBUM_PAGE_SIZE = 50
+
+__all__ = ['EnrichmentStage', 'RateLimitError', 'RateLimitScheduler',
+           'SpotifyWebApi']
+
+
+class RateLimitError(Exception):
+    """HTTP 429 from Spotify, retry_after holds the wait in seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SpotifyWebApi:
+    """Minimal Spotify Web API client (client credentials flow).
+
+    Base URLs are parameters so tests can point it at a local stub.
+    """
+
+    def __init__(self, client_id: str, client_secret: str,
+                 api_url: str = API_URL, token_url: str = TOKEN_URL,
+                 timeout: float = 10.0, metrics=None):
+        self.api_url = api_url.rstrip('/')
+        self.token_url = token_url
+        self.timeout = timeout
+        self.calls = 0
+        self.metrics = metrics
+        self.__credentials = base64.b64encode(
+            f"{client_id}:{client_secret}".encode('utf-8')).decode('ascii')
+        self.__token = None
+        self.__expires = 0.0
+        self.__lock = threading.Lock()
+        self.__calls_lock = threading.Lock()
+
+    def __access_token(self) -> str:
+        """Cached bearer token, refreshed shortly before expiry."""
+        with self.__lock:
+            if self.__token is None or time.time() >= self.__expires:
+                body = urllib.parse.urlencode(
+                    {'grant_type': 'client_credentials'}).encode('ascii')
+                request = urllib.request.Request(
+                    self.token_url, data=body, method='POST',
+                    headers={'Authorization': f"Basic {self.__credentials}"})
+                with urllib.request.urlopen(request,
+                                            timeout=self.timeout) as resp:
+                    token = json.loads(resp.read().decode('utf-8'))
+                self.__token = token['access_token']
+                self.__expires = time.time() + token.get('expires_in',
+                                                         3600) - 60
+            return self.__token
+
+    @staticmethod
+    def __retry_after(headers) -> float:
+        """Seconds to wait from the Retry-After header."""
+        try:
+            return float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return DEFAULT_RETRY_AFTER
+
+    def get(self, path: str, params: dict) -> dict:
+        """GET an API path, raising RateLimitError on HTTP 429."""
+        url = f"{self.api_url}{path}?{urllib.parse.urlencode(params)}"
+        request = urllib.request.Request(url, headers={
+            'Authorization': f"Bearer {self.__access_token()}"})
+        with self.__calls_lock:
+            self.calls += 1
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request,
+                                        timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as exc:
+            if exc.code == 429:
+                raise RateLimitError(
+                    self.__retry_after(exc.headers)) from exc
+            if exc.code == 401:
+                self.__token = None
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.observe('api', time.perf_counter() - start)
+
+    def search_artist(self, artist_name: str) -> str:
+        """Spotify ID of the best matching artist, '' if none."""
+        results = self.get('/search', {'q': f"artist:{artist_name}",
+                                       'type': 'artist'})
+        items = results['artists']['items']
+        return items[0]['id'] if len(items) > 0 else ''
+
+    def artist_albums(self, artist_id: str) -> list:
+        """Every album ({'id', 'name'}) of artist, following pages."""
+        albums = []
+        while True:
+            results = self.get(f"/artists/{artist_id}/albums",
+                               {'limit': ALBUM_PAGE_SIZE,
+                                'offset': len(albums)})
+            albums.extend(results['items'])
+            if not results.get('next') or not results['items']:
+                return albums
+
+
+class RateLimitScheduler:
+    """Run blocking calls concurrently with bounded in-flight requests.
+
+    A 429 pauses every caller until its Retry-After has elapsed, then
+    the call is retried up to max_retries times.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_retries: int = MAX_RETRIES):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.throttled = 0
+        self.__resume_at = 0.0
+
+    async def __wait_backoff(self) -> None:
+        """Sleep while a Retry-After window is open."""
+        delay = self.__resume_at - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.__resume_at - time.monotonic()
+
+    async def __call(self, semaphore, executor, func, *args):
+        """Run one call, honouring shared backoff and retrying on 429."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.__wait_backoff()
+            async with semaphore:
+                # a 429 may have arrived while waiting for a slot
+                await self.__wait_backoff()
+                try:
+                    return await loop.run_in_executor(executor, func, *args)
+                except RateLimitError as exc:
+                    self.throttled += 1
+                    self.__resume_at = max(self.__resume_at,
+                                           time.monotonic() +
+                                           exc.retry_after)
+                    if attempt == self.max_retries:
+                        raise
+
+    async def __gather(self, func, args_list: list) -> list:
+        """Run func over args_list with at most max_in_flight at once."""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            return await asyncio.gather(
+                *[self.__call(semaphore, executor, func, *args)
+                  for args in args_list], return_exceptions=True)
+
+    def map(self, func, args_list: list) -> list:
+        """Results (or raised exceptions) of func(*args) in input order."""
+        if not args_list:
+            return []
+        return asyncio.run(self.__gather(func, args_list))
+
+
+class EnrichmentStage:
+    """Resolve artist/album IDs for a batch of rows before loading.
+
+    Distinct artist names and (artist ID, album title) pairs are looked
+    up once per batch: lookup cache first, then the Spotify API through
+    the rate limit aware scheduler, or the offline IDs if there is no
+    API client. Only API answers are cached, so an offline run never
+    hides IDs from a later run with credentials. Album titles are
+    matched per artist against its cached discography; matches below
+    LOW_CONFIDENCE are kept in flagged. Resolved IDs are joined back
+    onto the batch.
+    """
+
+    def __init__(self, api: SpotifyWebApi = None, cache=None,
+                 max_in_flight: int = MAX_IN_FLIGHT,
+                 max_retries: int = MAX_RETRIES,
+                 score_cutoff: float = SCORE_CUTOFF):
+        self.api = api
+        self.cache = cache
+        self.scheduler = RateLimitScheduler(max_in_flight, max_retries)
+        self.score_cutoff = score_cutoff
+        self.errors = 0
+        self.flagged = []
+
+    @classmethod
+    def from_config(cls, config_path: pathlib.Path, cache=None,
+                    online: bool = True, metrics=None, **kwargs):
+        """Stage using spotify.cfg credentials, or offline IDs."""
+        api = None
+        if online:
+            config = ConfigClient(config_path)
+            if config.is_config_valid():
+                api = SpotifyWebApi(config.get_client_id(),
+                                    config.get_client_secret(),
+                                    metrics=metrics)
+        return cls(api=api, cache=cache, **kwargs)
+
+    def __cached(self, keys: list, cache_get) -> tuple:
+        """Split keys into ({key: cached value}, [missing keys])."""
+        found, missing = {}, []
+        for key in keys:
+            value = cache_get(*key) if self.cache else None
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        return found, missing
+
+    def __resolve(self, func, keys: list, offline) -> dict:
+        """Resolve missing keys via API (concurrently) or offline IDs."""
+        resolved = {}
+        if self.api is None:
+            return {key: offline(*key) for key in keys}
+        results = self.scheduler.map(func, keys)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                self.errors += 1
+                print(f"   enrich error: {key} {result!r}")
+            else:
+                resolved[key] = result
+        return resolved
+
+    def __discography(self, artist_id: str) -> list:
+        """Albums of artist from the lookup cache, else the API."""
+        albums = self.cache.get_albums(artist_id) if self.cache else None
+        if albums is None:
+            albums = self.api.artist_albums(artist_id)
+            if self.cache:
+                self.cache.put_albums(artist_id, albums)
+        return albums
+
+    def __match_albums(self, artist_id: str, album_titles: tuple) -> dict:
+        """Score every title of one artist against its discography."""
+        albums = self.__discography(artist_id) if artist_id else []
+        return match_albums(album_titles, albums, self.score_cutoff)
+
+    def resolve_artists(self, artist_names: list) -> dict:
+        """Map each distinct artist name to a Spotify artist ID."""
+        keys = [(name,) for name in dict.fromkeys(artist_names)]
+        artist_ids, missing = self.__cached(
+            keys, self.cache.get_artist_id if self.cache else None)
+        resolved = self.__resolve(
+            self.api.search_artist if self.api else None, missing,
+            lambda name: OFFLINE_ARTIST_IDS.get(name, ''))
+        for (name,), artist_id in resolved.items():
+            if self.cache and self.api:
+                self.cache.put_artist_id(name, artist_id)
+        artist_ids.update(resolved)
+        return {name: artist_ids.get((name,), '') for (name,) in keys}
+
+    def resolve_album_matches(self, pairs: list) -> dict:
+        """Map distinct (artist ID, album title) to (album ID, score).
+
+        The score is None for IDs from the lookup cache or offline IDs.
+        """
+        keys = list(dict.fromkeys(pairs))
+        album_ids, missing = self.__cached(
+            keys, self.cache.get_album_id if self.cache else None)
+        matches = {key: (album_id, None) for key, album_id
+                   in album_ids.items()}
+        artist_titles = {}
+        for artist_id, title in missing:
+            artist_titles.setdefault(artist_id, []).append(title)
+        resolved = self.__resolve(
+            self.__match_albums if self.api else None,
+            [(artist_id, tuple(titles)) for artist_id, titles
+             in artist_titles.items()],
+            lambda artist_id, titles: {
+                title: (OFFLINE_ALBUM_IDS.get(title, ''), None)
+                for title in titles})
+        for (artist_id, titles), title_matches in resolved.items():
+            for title, (album_id, score) in title_matches.items():
+                matches[(artist_id, title)] = (album_id, score)
+                if score and score < LOW_CONFIDENCE:
+                    self.flagged.append((artist_id, title, album_id, score))
+                if self.cache and self.api:
+                    self.cache.put_album_id(artist_id, title, album_id)
+        return {key: matches.get(key, ('', None)) for key in keys}
+
+    def resolve_albums(self, pairs: list) -> dict:
+        """Map each distinct (artist ID, album title) to an album ID."""
+        return {key: album_id for key, (album_id, score)
+                in self.resolve_album_matches(pairs).items()}
+
+    def enrich(self, df):
+        """Fill 'artist_id' and 'album_id' columns of a DataFrame batch."""
+        start = time.perf_counter()
+        calls = self.api.calls if self.api else 0
+        artist_ids = self.resolve_artists(list(df['artist_name']))
+        df['artist_id'] = df['artist_name'].map(artist_ids)
+        pairs = list(zip(df['artist_id'], df['album_title']))
+        album_ids = self.resolve_albums(pairs)
+        df['album_id'] = [album_ids[pair] for pair in pairs]
+        calls = (self.api.calls if self.api else 0) - calls
+        print(f"  enrich: {len(artist_ids)} artists, {len(album_ids)} "
+              f"albums, {calls} api calls, {self.scheduler.throttled} "
+              f"throttled, {len(self.flagged)} low confidence in "
+              f"{time.perf_counter() - start:0.3f}s")
+        return df
@@ -0,0 +1,318 @@
+# -*- coding: UTF-8 -*-
+"""Stream media_db tables and queries to chunked CSV/Parquet files."""
+import gzip
+import io
+import os
+import pathlib
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from db import postgres_insert_queries as sql
+from db import postgres_select_queries as select_sql
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+EXPORT_PATH = pathlib.Path(TWO_PARENT_PATH, 'data', 'output', 'export')
+FORMATS = ['csv', 'parquet']
+CHUNK_ROWS = 250000
+PARTITION_COLUMNS = ['genre', 'year']
+TABLES = list(sql.HEADERS)
+QUERIES = {'join': select_sql.JOIN_SELECT, 'gain': select_sql.GAIN_SELECT}
+# Postgres type OIDs of Parquet columns, other types are exported as text
+ARROW_TYPES = {16: 'bool', 20: 'int64', 21: 'int16', 23: 'int32',
+               700: 'float', 701: 'double', 1082: 'date32',
+               1114: 'timestamp[us]'}
+NUMERIC_OID = 1700
+COPY_QUERY = "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+__all__ = ['EXPORT_PATH', 'FORMATS', 'QUERIES', 'TABLES', 'ChunkWriter',
+           'PartitionWriter', 'export_all', 'export_query']
+
+
+def connect(db_kwargs: dict):
+    """New connection from PostgresMedia.get_connection_kwargs()."""
+    return psycopg2.connect(host=db_kwargs['hostname'],
+                            port=db_kwargs['port_num'],
+                            dbname=db_kwargs['db_name'],
+                            user=db_kwargs['username'],
+                            password=db_kwargs['password'],
+                            connect_timeout=1)
+
+
+def arrow_schema(description):
+    """Arrow schema for a cursor description (NUMERIC kept as decimal)."""
+    fields = []
+    for column in description:
+        if column.type_code == NUMERIC_OID and column.precision and \
+                column.precision <= 38:
+            arrow_type = pyarrow.decimal128(column.precision, column.scale)
+        elif column.type_code == NUMERIC_OID:
+            arrow_type = pyarrow.float64()
+        else:
+            arrow_type = pyarrow.type_for_alias(
+                ARROW_TYPES.get(column.type_code, 'string'))
+        fields.append(pyarrow.field(column.name, arrow_type))
+    return pyarrow.schema(fields)
+
+
+class ChunkWriter:
+    """COPY TO target that rotates part files every chunk_rows rows.
+
+    The server sends one CSV row per CopyData message and psycopg2
+    calls write() once per message, so files always end on a row
+    boundary. CSV parts are gzip compressed with the header repeated,
+    Parquet parts are parsed from the buffered CSV by pyarrow.
+    """
+
+    def __init__(self, output_dir: pathlib.Path, fmt: str = 'csv',
+                 chunk_rows: int = CHUNK_ROWS, schema=None):
+        self.output_dir = pathlib.Path(output_dir)
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.schema = schema
+        self.header = None
+        self.rows = 0
+        self.bytes = 0
+        self.files = []
+        self.__chunk = []
+        self.__csv_file = None
+
+    def __part_path(self) -> pathlib.Path:
+        """Path of the next part file."""
+        suffix = 'csv.gz' if self.fmt == 'csv' else 'parquet'
+        return pathlib.Path(self.output_dir,
+                            f"part-{len(self.files):05d}.{suffix}")
+
+    def write(self, data: bytes) -> None:
+        """Take one row (the first call is the header)."""
+        if self.header is None:
+            self.header = data
+            return
+        self.rows += 1
+        if self.fmt == 'csv':
+            if self.__csv_file is None:
+                self.__open_csv()
+            self.__csv_file.write(data)
+        else:
+            self.__chunk.append(data)
+        if self.rows % self.chunk_rows == 0:
+            self.flush()
+
+    def __open_csv(self) -> None:
+        """Start a gzip CSV part with the header row."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        part_path = self.__part_path()
+        self.files.append(part_path)
+        self.__csv_file = gzip.open(part_path, mode='wb', compresslevel=6)
+        self.__csv_file.write(self.header or b'')
+
+    def flush(self) -> None:
+        """Close the current part file."""
+        if self.fmt == 'csv':
+            if self.__csv_file is not None:
+                self.__csv_file.close()
+                self.__csv_file = None
+                self.bytes += self.files[-1].stat().st_size
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        convert = pyarrow.csv.ConvertOptions(
+            column_types=self.schema, strings_can_be_null=True,
+            quoted_strings_can_be_null=False)
+        table = pyarrow.csv.read_csv(
+            io.BytesIO((self.header or b'') + b''.join(self.__chunk)),
+            parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True),
+            convert_options=convert)
+        self.__chunk = []
+        part_path = self.__part_path()
+        pyarrow.parquet.write_table(table.cast(self.schema), part_path)
+        self.files.append(part_path)
+        self.bytes += part_path.stat().st_size
+
+    def close(self) -> None:
+        """Flush the last part, or write an empty one if there were none."""
+        if self.fmt == 'csv':
+            if self.__csv_file is None and not self.files:
+                self.__open_csv()
+            self.flush()
+        elif self.__chunk or not self.files:
+            self.flush()
+
+
+def _partition_dir(column: str, value) -> str:
+    """Hive style directory name of one partition value.
+
+    Values changed by the sanitizing get a checksum suffix, so distinct
+    values (e.g. 'Rock/Pop' and 'Rock_Pop') never share a directory.
+    """
+    if value is None:
+        return f"{column}=__HIVE_DEFAULT_PARTITION__"
+    slug = re.sub(r'[^\w.-]+', '_', str(value))
+    if slug != str(value):
+        slug = f"{slug}_{zlib.crc32(str(value).encode('utf-8')):08x}"
+    return f"{column}={slug}"
+
+
+def _split_first(row: bytes) -> tuple:
+    """(first field, None if NULL, rest of the row) of a COPY CSV row."""
+    if row.startswith(b'"'):
+        end = row.index(b'"', 1)
+        while row[end + 1:end + 2] == b'"':
+            end = row.index(b'"', end + 2)
+        return (row[1:end].replace(b'""', b'"').decode('utf-8'),
+                row[end + 2:])
+    field, _, rest = row.partition(b',')
+    return (field.decode('utf-8') if field else None), rest
+
+
+class PartitionWriter:
+    """COPY target splitting rows ordered by their first column.
+
+    Each run of equal first-column values goes to the ChunkWriter of
+    its own '<column>=<value>' directory, without that column; only
+    one partition's part file is open at a time.
+    """
+
+    def __init__(self, output_dir: pathlib.Path, column: str,
+                 fmt: str = 'csv', chunk_rows: int = CHUNK_ROWS,
+                 schema=None):
+        self.output_dir = pathlib.Path(output_dir)
+        self.column = column
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.schema = schema
+        self.writers = []
+        self.__header = None
+        self.__value = None
+
+    def write(self, data: bytes) -> None:
+        """Take one row (the first call is the header)."""
+        value, row = _split_first(data)
+        if self.__header is None:
+            self.__header = row
+            return
+        if not self.writers or value != self.__value:
+            self.__start(value)
+        self.writers[-1].write(row)
+
+    def __start(self, value) -> None:
+        """Close the previous partition, start the one of value."""
+        if self.writers:
+            self.writers[-1].close()
+        writer = ChunkWriter(
+            pathlib.Path(self.output_dir,
+                         _partition_dir(self.column, value)),
+            self.fmt, self.chunk_rows, self.schema)
+        writer.write(self.__header)
+        self.writers.append(writer)
+        self.__value = value
+
+    def close(self) -> None:
+        """Close the last partition."""
+        if self.writers:
+            self.writers[-1].close()
+
+
+def _copy_out(cursor, query: str, writer) -> list:
+    """COPY one query into writer, return its ChunkWriters."""
+    cursor.copy_expert(COPY_QUERY.format(query=query), writer)
+    writer.close()
+    return getattr(writer, 'writers', [writer])
+
+
+def export_query(db_kwargs: dict, name: str, query: str,
+                 output_path: pathlib.Path = EXPORT_PATH, fmt: str = 'csv',
+                 chunk_rows: int = CHUNK_ROWS, partition_by: str = None,
+                 params: list = None) -> dict:
+    """Export one table or query on its own connection, return stats.
+
+    With partition_by, and if the query has that column, the rows are
+    copied once ordered by it, each value into its own '<column>=<value>'
+    directory without the column.
+    """
+    stats = {'export': name, 'status': False, 'rows': 0, 'files': 0,
+             'bytes': 0, 'seconds': 0.0, 'partitions': 0}
+    start = time.perf_counter()
+    db_conn = None
+    try:
+        if fmt == 'parquet' and pyarrow is None:
+            raise ValueError("parquet export needs pyarrow "
+                             "(pip install pyarrow)")
+        if '%s' in query and not params:
+            raise ValueError("query needs params")
+        db_conn = connect(db_kwargs)
+        cursor = db_conn.cursor()
+        if params:
+            query = cursor.mogrify(query, params).decode('utf-8')
+        cursor.execute(f"SELECT * FROM ({query}) q LIMIT 0;")
+        description = cursor.description
+        columns = [column.name for column in description]
+        output_dir = pathlib.Path(output_path, name)
+        for stale_path in output_dir.rglob('part-*'):
+            stale_path.unlink()
+        if partition_by and partition_by in columns and len(columns) > 1:
+            # the partition column lives in the directory name only
+            description = [column for column in description
+                           if column.name != partition_by]
+            schema = arrow_schema(description) if fmt == 'parquet' \
+                else None
+            select_list = ', '.join(column.name for column in description)
+            writers = _copy_out(
+                cursor, f"SELECT {partition_by}, {select_list} "
+                f"FROM ({query}) q ORDER BY {partition_by}",
+                PartitionWriter(output_dir, partition_by, fmt, chunk_rows,
+                                schema))
+            stats['partitions'] = len(writers)
+        else:
+            schema = arrow_schema(description) if fmt == 'parquet' \
+                else None
+            writers = _copy_out(cursor, query,
+                                ChunkWriter(output_dir, fmt, chunk_rows,
+                                            schema))
+        stats['rows'] = sum(writer.rows for writer in writers)
+        stats['files'] = sum(len(writer.files) for writer in writers)
+        stats['bytes'] = sum(writer.bytes for writer in writers)
+        stats['status'] = True
+    except (OSError, ValueError, psycopg2.Error) as exc:
+        print(f"~!ERROR!~ export '{name}': {exc}")
+    finally:
+        if db_conn is not None:
+            db_conn.close()
+    stats['seconds'] = time.perf_counter() - start
+    print(f"  export {name}: {stats['rows']} rows, {stats['files']} files "
+          f"({stats['bytes'] / 1048576:0.2f} MiB) in "
+          f"{stats['seconds']:0.2f}s")
+    return stats
+
+
+def export_all(db_kwargs: dict, exports: list = None,
+               output_path: pathlib.Path = EXPORT_PATH, fmt: str = 'csv',
+               chunk_rows: int = CHUNK_ROWS, partition_by: str = None,
+               params: list = None, workers: int = 1) -> list:
+    """Export tables and named QUERIES, workers at a time.
+
+    Each export runs on its own connection and thread; COPY and the
+    Parquet conversion release the GIL while they wait or parse.
+    """
+    jobs = []
+    for name in exports or TABLES:
+        if name in QUERIES:
+            jobs.append((name, QUERIES[name], params))
+        elif name in sql.TABLES:
+            jobs.append((name, f"SELECT * FROM {name}", None))
+        else:
+            print(f"~!ERROR!~ unknown export: '{name}' "
+                  f"{sql.TABLES + list(QUERIES)}")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(export_query, db_kwargs, name, query,
+                                   output_path, fmt, chunk_rows,
+                                   partition_by, query_params)
+                   for name, query, query_params in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+"""Streaming reader for pandas orient='split' JSON media files."""
+import json
+import pathlib
+import pandas
+
+# files at least this size are streamed instead of pandas.read_json()
+STREAM_THRESHOLD = 64 * 1024 * 1024
+CHUNK_SIZE = 5000
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+__all__ = ['SplitJsonReader', 'iter_split_chunks', 'is_streamed']
+
+
+class SplitJsonReader:
+    """Incremental decoder for the 'columns' / 'index' / 'data' layout.
+
+    Only one read buffer and the current row are held in memory, the
+    'index' array is skipped element by element and 'data' rows are
+    yielded as they are decoded.
+    """
+
+    def __init__(self, input_path: pathlib.Path, read_size: int = READ_SIZE):
+        self.input_path = input_path
+        self.read_size = read_size
+        self.columns = None
+        self.__decoder = json.JSONDecoder()
+        self.__stream = None
+        self.__text = ''
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self) -> bool:
+        """Read the next block, dropping text already consumed."""
+        if self.__eof:
+            return False
+        block = self.__stream.read(self.read_size)
+        if not block:
+            self.__eof = True
+            return False
+        self.__text = self.__text[self.__pos:] + block
+        self.__pos = 0
+        return True
+
+    def __peek(self) -> str:
+        """Return next non-whitespace character without consuming it."""
+        while True:
+            while self.__pos < len(self.__text) and \
+                    self.__text[self.__pos] in WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__text):
+                return self.__text[self.__pos]
+            if not self.__fill():
+                return ''
+
+    def __expect(self, chars: str) -> str:
+        """Consume one of the expected structural characters."""
+        char = self.__peek()
+        if not char or char not in chars:
+            raise ValueError(f"'{self.input_path.name}' expected "
+                             f"{chars!r} at offset {self.__pos}, "
+                             f"found {char!r}")
+        self.__pos += 1
+        return char
+
+    def __decode(self):
+        """Decode one complete JSON value, reading more text as needed."""
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__text,
+                                                       self.__pos)
+                # a number at the buffer edge may continue in next block
+                if end < len(self.__text) or self.__eof:
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            self.__fill()
+
+    def __iter_array(self):
+        """Yield elements of the array at the current position."""
+        self.__expect('[')
+        if self.__peek() == ']':
+            self.__pos += 1
+            return
+        while True:
+            yield self.__decode()
+            if self.__expect(',]') == ']':
+                return
+
+    def iter_rows(self):
+        """Yield each 'data' row as a list ordered like 'columns'."""
+        with open(self.input_path, mode='r', encoding='utf-8') as stream:
+            self.__stream = stream
+            self.__expect('{')
+            if self.__peek() == '}':
+                return
+            while True:
+                key = self.__decode()
+                self.__expect(':')
+                if key == 'data':
+                    if self.columns is None:
+                        raise ValueError(f"'{self.input_path.name}' "
+                                         f"'columns' must precede 'data'")
+                    yield from self.__iter_array()
+                elif key == 'index' and self.__peek() == '[':
+                    for _ in self.__iter_array():
+                        pass
+                else:
+                    value = self.__decode()
+                    if key == 'columns':
+                        self.columns = value
+                if self.__expect(',}') == '}':
+                    return
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE):
+        """Yield DataFrames of at most chunk_size rows."""
+        rows = []
+        for row in self.iter_rows():
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield pandas.DataFrame(rows, columns=self.columns)
+                rows = []
+        if rows:
+            yield pandas.DataFrame(rows, columns=self.columns)
+
+
+def is_streamed(input_path: pathlib.Path) -> bool:
+    """Files at or above STREAM_THRESHOLD bytes are read as a stream."""
+    return input_path.stat().st_size >= STREAM_THRESHOLD
+
+
+def iter_split_chunks(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """Yield DataFrame chunks from an orient='split' JSON file."""
+    return SplitJsonReader(input_path).iter_chunks(chunk_size)
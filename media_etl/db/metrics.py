@@ -0,0 +1,253 @@
+# -*- coding: UTF-8 -*-
+"""Per-stage timings, counters and latency histograms of an ETL run."""
+import bisect
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import threading
+import time
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+METRICS_PATH = pathlib.Path(TWO_PARENT_PATH, 'data', 'output', 'metrics')
+METRICS_PREFIX = 'media_etl'
+# histogram upper bounds in seconds, +Inf is implied
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+              0.5, 1.0, 2.5, 5.0)
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTERS = ['files', 'rows', 'duplicates', 'bytes', 'api_calls',
+            'cache_hits', 'cache_misses', 'errors']
+
+__all__ = ['Histogram', 'RunMetrics']
+
+
+class Histogram:
+    """Fixed bucket latency histogram (Prometheus style)."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        """Add one latency sample."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given quantile."""
+        rank, seen = fraction * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def to_dict(self) -> dict:
+        """Plain (picklable, JSON) form of the histogram."""
+        return {'buckets': list(self.buckets), 'counts': list(self.counts),
+                'sum': self.sum, 'count': self.count}
+
+    def merge(self, other: dict) -> None:
+        """Add the samples of another histogram's to_dict()."""
+        for idx, count in enumerate(other['counts']):
+            self.counts[idx] += count
+        self.sum += other['sum']
+        self.count += other['count']
+
+
+class RunMetrics:
+    """Thread safe collector for one ETL run.
+
+    Stages accumulate wall seconds and call counts, counters hold rows,
+    bytes, API calls, cache hits and errors, and the 'db' and 'api'
+    histograms record per call latency. Worker processes send their
+    snapshot() back to be merged into the parent run.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__progress = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear every stage, counter and histogram."""
+        with self.__lock:
+            self.started = time.perf_counter()
+            self.stages = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.histograms = {'db': Histogram(DB_BUCKETS),
+                               'api': Histogram(API_BUCKETS)}
+
+    def record(self, stage: str, seconds: float, calls: int = 1) -> None:
+        """Add seconds spent in stage."""
+        with self.__lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+
+    def observe(self, histogram: str, seconds: float) -> None:
+        """Add a latency sample to the 'db' or 'api' histogram."""
+        with self.__lock:
+            self.histograms[histogram].observe(seconds)
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """Increment counter by value."""
+        with self.__lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, histogram: str = None):
+        """Time the with block as stage (and a histogram sample)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.record(stage, seconds)
+            if histogram:
+                self.observe(histogram, seconds)
+
+    def iter_stage(self, stage: str, iterable):
+        """Yield from iterable, timing each step as stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(stage):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def snapshot(self) -> dict:
+        """Stages, counters and histograms as plain data."""
+        with self.__lock:
+            return {'stages': {stage: list(totals) for stage, totals
+                               in self.stages.items()},
+                    'counters': dict(self.counters),
+                    'histograms': {name: hist.to_dict() for name, hist
+                                   in self.histograms.items()}}
+
+    def merge(self, snapshot: dict) -> None:
+        """Add a worker process snapshot() to this run."""
+        for stage, (seconds, calls) in snapshot['stages'].items():
+            self.record(stage, seconds, calls)
+        for counter, value in snapshot['counters'].items():
+            self.count(counter, value)
+        with self.__lock:
+            for name, hist in snapshot['histograms'].items():
+                self.histograms[name].merge(hist)
+
+    def summary(self) -> dict:
+        """JSON summary with elapsed time and rows per second."""
+        summary = self.snapshot()
+        seconds = time.perf_counter() - self.started
+        summary.update({
+            'timestamp': datetime.datetime.now().isoformat(
+                timespec='seconds'),
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(summary['counters']['rows'] / seconds, 1)
+            if seconds else 0.0})
+        summary['stages'] = {stage: {'seconds': round(seconds, 6),
+                                     'calls': calls}
+                             for stage, (seconds, calls)
+                             in sorted(summary['stages'].items())}
+        for name, hist in self.histograms.items():
+            summary['histograms'][name].update(
+                {'p50': hist.quantile(0.5), 'p99': hist.quantile(0.99)})
+        return summary
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Prometheus text exposition format of the run."""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_seconds_total "
+                 f"Wall seconds spent per ETL stage.",
+                 f"# TYPE {prefix}_stage_seconds_total counter"]
+        for stage, (seconds, calls) in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} '
+                         f'{seconds:.6f}')
+        lines += [f"# HELP {prefix}_stage_calls_total "
+                  f"Timed calls per ETL stage.",
+                  f"# TYPE {prefix}_stage_calls_total counter"]
+        for stage, (seconds, calls) in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_calls_total{{stage="{stage}"}} '
+                         f'{calls}')
+        for counter, value in snapshot['counters'].items():
+            lines += [f"# TYPE {prefix}_{counter}_total counter",
+                      f"{prefix}_{counter}_total {value}"]
+        for name, hist in snapshot['histograms'].items():
+            metric = f"{prefix}_{name}_latency_seconds"
+            lines += [f"# HELP {metric} {name.upper()} call latency.",
+                      f"# TYPE {metric} histogram"]
+            cumulative = 0
+            for bound, count in zip(hist['buckets'] + ['+Inf'],
+                                    hist['counts']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} '
+                             f'{cumulative}')
+            lines += [f"{metric}_sum {hist['sum']:.6f}",
+                      f"{metric}_count {hist['count']}"]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, output_path: pathlib.Path = METRICS_PATH,
+              prefix: str = METRICS_PREFIX) -> tuple:
+        """Write <prefix>_metrics.json and <prefix>.prom, return paths."""
+        output_path = pathlib.Path(output_path)
+        output_path.mkdir(parents=True, exist_ok=True)
+        json_path = pathlib.Path(output_path, f"{prefix}_metrics.json")
+        with open(json_path, mode='w', encoding='utf-8') as json_file:
+            json.dump(self.summary(), json_file, indent=2)
+        # rename so a textfile collector never reads a partial file
+        prom_path = pathlib.Path(output_path, f"{prefix}.prom")
+        temp_path = prom_path.with_suffix('.prom.tmp')
+        temp_path.write_text(self.to_prometheus(prefix), encoding='utf-8')
+        os.replace(temp_path, prom_path)
+        return json_path, prom_path
+
+    def progress_line(self) -> str:
+        """One line of rows, rate, API calls and errors so far."""
+        seconds = time.perf_counter() - self.started
+        counters = self.counters
+        rate = counters['rows'] / seconds if seconds else 0.0
+        return (f"  progress: {counters['files']} files, {counters['rows']} "
+                f"rows ({rate:0.1f} rows/sec), {counters['api_calls']} api "
+                f"calls, {counters['errors']} errors in {seconds:0.1f}s")
+
+    def start_progress(self, interval: float) -> None:
+        """Print progress_line() every interval seconds until stopped."""
+        if interval <= 0 or self.__progress:
+            return
+        stopped = threading.Event()
+
+        def show_progress():
+            while not stopped.wait(interval):
+                print(self.progress_line(), flush=True)
+        thread = threading.Thread(target=show_progress, daemon=True)
+        self.__progress = (thread, stopped)
+        thread.start()
+
+    def stop_progress(self) -> None:
+        """Stop the periodic progress line."""
+        if self.__progress:
+            thread, stopped = self.__progress
+            stopped.set()
+            thread.join()
+            self.__progress = None
+
+    def report(self) -> None:
+        """Print stage timings, counters and latency percentiles."""
+        summary = self.summary()
+        print(f"metrics: {summary['seconds']:0.2f}s, "
+              f"{summary['rows_per_sec']} rows/sec")
+        for stage, totals in summary['stages'].items():
+            print(f"   {stage:18} {totals['seconds']:10.3f}s "
+                  f"{totals['calls']:>9} calls")
+        print(f"   {summary['counters']}")
+        for name, hist in summary['histograms'].items():
+            if hist['count']:
+                print(f"   {name} latency: {hist['count']} calls, "
+                      f"p50 <= {hist['p50']}s, p99 <= {hist['p99']}s")
@@ -2,77 +2,228 @@
 """Media driver module to insert JSON media tags into PostgreSQL."""
 import os
 import sys
+import hashlib
+import time
 import pathlib
 import inspect
+import itertools
+import threading
+import sqlite3
 import traceback
+import contextlib
+import multiprocessing
 import psycopg2
-import pandas
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from db.spotify import SpotifyClient
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from db.metrics import RunMetrics
+from db import dedup
+from db import records
+from db import sinks
 from db import postgres_insert_queries as sql
+from db import postgres_select_queries as select_sql
+# readers/transform (pandas, pyarrow), enrichment (spotipy, rapidfuzz),
+# export and watch are imported by the methods using them, so queries
+# and status checks start without them
 
 BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
 PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
 TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+# load engines: row-by-row INSERT (autocommit) or per-table COPY FROM STDIN
+ENGINES = ['insert', 'copy']
+ITERSIZE = 2000
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 8
+# pooled connections idle for longer are pinged before they are lent
+HEALTH_CHECK_SECONDS = 30.0
+_CURSOR_IDS = itertools.count()
+_WORKER = None
+
+
+def _init_worker(db_kwargs: dict) -> None:
+    """Pool initializer: one single-connection client per worker process."""
+    global _WORKER
+    _WORKER = PostgresMedia(**db_kwargs, max_conn=1)
+
+
+def _load_worker_file(task: tuple) -> dict:
+    """Pool task: load one file on the worker process connection."""
+    input_path, engine = task[:2]
+    if _WORKER is None or not _WORKER.is_connected():
+        return {'file': str(input_path), 'engine': engine,
+                'status': False, 'rows': 0, 'duplicates': 0,
+                'seconds': 0.0}
+    # metrics of this file only, merged into the parent run
+    _WORKER.metrics.reset()
+    stats = _WORKER.load_file(*task)
+    stats['metrics'] = _WORKER.metrics.snapshot()
+    return stats
 
 
 class PostgresMedia:
-    """Class to add/remove media tags to Postgres backend."""
+    """Class to add/remove media tags to Postgres backend.
+
+    Each instance owns a thread-safe pool of min_conn to max_conn
+    connections. Queries and loads borrow a connection per call, so one
+    instance can be shared by a thread pool. Without connect no pool is
+    opened, e.g. to load files into another sink than Postgres.
+    """
 
-    @classmethod
-    def __init__(cls, hostname: str = 'localhost',
+    def __init__(self, hostname: str = 'localhost',
                  port_num: int = 5432,
                  db_name: str = 'media_db',
                  username: str = 'run_admin_run',
                  password: str = 'run_pass_run',
-                 private_cfg=False):
-        try:
-            cls.__is_connected = False
-            cls.__hostname = hostname
-            cls.__port_num = port_num
-            cls.__db_name = db_name
-            cls.__username = username
-            cls.__password = password
-            cls.__private_cfg = private_cfg
-            cls.db_conn = psycopg2.connect(f"host={hostname} "
-                                           f"port={port_num} "
-                                           f"dbname={db_name} "
-                                           f"user={username} "
-                                           f"password={password}",
-                                           connect_timeout=1)
-            cls.db_conn.set_session(autocommit=True)
-            cls.db_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-            cls.conn_status = cls.is_connected()
-            cls.db_cur = cls.db_conn.cursor()
-            if cls.__private_cfg:
-                config_path = pathlib.Path(TWO_PARENT_PATH, 'private_cfg',
-                                           'spotify.cfg')
-            else:
-                config_path = pathlib.Path(TWO_PARENT_PATH, 'spotify.cfg')
-            cls.spotify = SpotifyClient(config_path)
+                 private_cfg=False,
+                 min_conn: int = MIN_CONNECTIONS,
+                 max_conn: int = MAX_CONNECTIONS,
+                 connect: bool = True):
+        self.metrics = RunMetrics()
+        self.pool = None
+        self.conn_status = False
+        self.__hostname = hostname
+        self.__port_num = port_num
+        self.__db_name = db_name
+        self.__username = username
+        self.__password = password
+        self.__private_cfg = private_cfg
+        # getconn() fails on an exhausted pool, borrowers wait here instead
+        self.__slots = threading.BoundedSemaphore(max_conn)
+        self.__last_used = {}
+        self.hash_filter = dedup.HashFilter()
+        # partitioned tables (None: not read yet) and their partitions,
+        # name -> True once rows can be copied into it directly
+        self.__partitioned = None
+        self.__partition_names = {}
+        self.__partition_lock = threading.Lock()
+        # tables whose upsert key exists (after a sync), read per file
+        self.__skip_tables = set()
+        # Spotify clients are created by the first load that enriches
+        self.__spotify = None
+        self.__enricher = None
+        self.__client_lock = threading.RLock()
+        # pg_trgm installed (None: not checked yet), else fuzzy search
+        # runs on in-process indexes {kind: (table state, NameIndex)}
+        self.__trigram = None
+        self.__name_indexes = {}
+        self.__search_lock = threading.Lock()
+        if not connect:
+            return
+        try:
+            self.pool = psycopg2.pool.ThreadedConnectionPool(
+                min(min_conn, max_conn), max_conn, host=hostname,
+                port=port_num, dbname=db_name, user=username,
+                password=password, connect_timeout=1)
+            self.conn_status = self.is_connected()
         except (OSError, psycopg2.OperationalError):
-            cls.db_conn = None
-            cls.__show_exception()
-            print(f"hostname: {cls.__hostname}\n"
-                  f"port: {cls.__port_num}\n"
-                  f"db_name: {cls.__db_name}\n"
-                  f"username: {cls.__username}\n"
-                  f"password: {cls.__password}")
-
-    @classmethod
-    def is_connected(cls) -> bool:
+            self.pool = None
+            self.__show_exception()
+            print(f"hostname: {self.__hostname}\n"
+                  f"port: {self.__port_num}\n"
+                  f"db_name: {self.__db_name}\n"
+                  f"username: {self.__username}\n"
+                  f"password: {self.__password}")
+
+    def __config_path(self) -> pathlib.Path:
+        """Spotify credentials file (private_cfg: outside the repo)."""
+        if self.__private_cfg:
+            return pathlib.Path(TWO_PARENT_PATH, 'private_cfg',
+                                'spotify.cfg')
+        return pathlib.Path(TWO_PARENT_PATH, 'spotify.cfg')
+
+    @property
+    def spotify(self):
+        """SpotifyClient, created (and its login checked) on first use."""
+        with self.__client_lock:
+            if self.__spotify is None:
+                from db.spotify import SpotifyClient
+                self.__spotify = SpotifyClient(self.__config_path())
+            return self.__spotify
+
+    @property
+    def enricher(self):
+        """EnrichmentStage of the loads, created on first use."""
+        with self.__client_lock:
+            if self.__enricher is None:
+                from db.enrichment import EnrichmentStage
+                self.__enricher = EnrichmentStage.from_config(
+                    self.__config_path(), cache=self.spotify.cache,
+                    online=self.spotify.run_spotify(),
+                    metrics=self.metrics)
+            return self.__enricher
+
+    @enricher.setter
+    def enricher(self, stage) -> None:
+        with self.__client_lock:
+            self.__enricher = stage
+
+    def get_connection_kwargs(self) -> dict:
+        """Keyword arguments to open an equivalent PostgresMedia client."""
+        return {'hostname': self.__hostname, 'port_num': self.__port_num,
+                'db_name': self.__db_name, 'username': self.__username,
+                'password': self.__password,
+                'private_cfg': self.__private_cfg}
+
+    def is_connected(self) -> bool:
         """Checks for valid connection (either postgres or media_db)."""
-        try:
-            if cls.db_conn:
-                return True
-        except psycopg2.OperationalError as exc:
-            print("ERROR: not connected", exc)
-        return False
+        return self.pool is not None
+
+    def __is_healthy(self, db_conn) -> bool:
+        """Open, idle, and answering a ping if unused for a while."""
+        if db_conn.closed or \
+                db_conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        last_used = self.__last_used.get(id(db_conn), time.monotonic())
+        if time.monotonic() - last_used > HEALTH_CHECK_SECONDS:
+            try:
+                with db_conn.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                return False
+        return True
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a pooled autocommit connection, waiting while all are lent.
+
+        Unhealthy connections are replaced when borrowed, connections
+        that raise OperationalError/InterfaceError are discarded, and
+        open transactions are rolled back before a connection is returned.
+        """
+        with self.__slots:
+            db_conn = self.pool.getconn()
+            while not self.__is_healthy(db_conn):
+                self.__last_used.pop(id(db_conn), None)
+                self.pool.putconn(db_conn, close=True)
+                db_conn = self.pool.getconn()
+            db_conn.autocommit = True
+            broken = False
+            try:
+                yield db_conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                broken = broken or bool(db_conn.closed)
+                if not broken and db_conn.get_transaction_status() != \
+                        TRANSACTION_STATUS_IDLE:
+                    db_conn.rollback()
+                    db_conn.autocommit = True
+                if broken:
+                    self.__last_used.pop(id(db_conn), None)
+                else:
+                    self.__last_used[id(db_conn)] = time.monotonic()
+                self.pool.putconn(db_conn, close=broken)
 
-    @classmethod
-    def get_connection(cls):
-        """Return client connection to 'media_db' database."""
-        return cls.db_conn
+    @contextlib.contextmanager
+    def cursor(self):
+        """Cursor on a borrowed connection, both returned on exit."""
+        with self.connection() as db_conn:
+            with db_conn.cursor() as cursor:
+                yield cursor
+
+    def get_connection(self):
+        """Borrow a client connection to 'media_db' (context manager)."""
+        return self.connection()
 
     @staticmethod
     def __show_exception():
@@ -81,60 +232,177 @@ class PostgresMedia:
         traceback.print_exception(exc_type, exc_value, exc_traceback,
                                   limit=2, file=sys.stdout)
 
-    @classmethod
-    def show_database_status(cls) -> list:
+    def show_database_status(self) -> list:
         """Displays current list of Postgres databases on host."""
         def_name = inspect.currentframe().f_code.co_name
-        if cls.is_connected():
-            pg_ver = str(cls.db_conn.server_version)
+        if self.is_connected():
+            with self.connection() as db_conn:
+                pg_ver = str(db_conn.server_version)
             dot_ver = f"{pg_ver[0:1]}.{pg_ver[1:3]}.{pg_ver[-2:]}"
             print(f"{def_name}()\n   postgres version: {dot_ver}"
-                  f"\n   database: {cls.__db_name}")
-            cls.get_tables()
+                  f"\n   database: {self.__db_name}")
+            self.get_tables()
+            indexes = self.get_indexes()
+            missing = [name for name in sql.INDEXES if name not in indexes]
+            unique = [name for name in sql.UNIQUE_INDEXES if name in indexes]
+            print(f"   indexes: {len(sql.INDEXES) - len(missing)}/"
+                  f"{len(sql.INDEXES)} present, missing: {missing}"
+                  f"\n   unique keys: {unique}")
+            print(f"   fresh views: "
+                  f"{[name for name in sql.VIEWS if self.is_fresh(name)]}")
+            print(f"   fuzzy search: "
+                  f"{'pg_trgm' if self.has_trigram() else 'in-process'}")
+            if self.is_partitioned():
+                print(f"   partitions: "
+                      f"{[row[1] for row in self.get_partitions()]}")
 
-    @classmethod
-    def get_tables(cls) -> list:
+    def get_tables(self) -> list:
         """Display current list of media_lib tables."""
-        cls.db_cur.execute("select relname from pg_class "
-                           "where relkind='r' and "
+        with self.cursor() as cursor:
+            cursor.execute("select relname from pg_class "
+                           "where relkind IN ('r', 'p') and "
+                           "not relispartition and "
                            "relname !~ '^(pg_|sql_)';")
-        result_set = cls.db_cur.fetchall()
+            result_set = cursor.fetchall()
         print(f"   tables: {result_set}")
         return result_set
 
-    @classmethod
-    def query(cls, query: str, params: list = []) -> list:
-        """Query media database for result set based on params."""
+    def get_indexes(self) -> list:
+        """Names of the indexes in the current schema."""
+        with self.cursor() as cursor:
+            cursor.execute(sql.INDEX_SELECT)
+            return [row[0] for row in cursor.fetchall()]
+
+    def is_partitioned(self) -> bool:
+        """True if album/filedata were created partitioned."""
+        if self.__partitioned is None:
+            # connection before lock, like the loads creating partitions
+            with self.cursor() as cursor, self.__partition_lock:
+                self.__read_partitions(cursor)
+        return bool(self.__partitioned)
+
+    def get_partitions(self, tables: list = None) -> list:
+        """(table, partition, bound, estimated rows) of partitioned tables."""
+        with self.cursor() as cursor:
+            cursor.execute(sql.PARTITIONS_SELECT,
+                           [tables or list(sql.PARTITIONS)])
+            return cursor.fetchall()
+
+    def query(self, query: str, params: list = [],
+              verbose: bool = True) -> list:
+        """Query media database for result set based on params.
+
+        A connection lost mid-query is discarded and the query retried
+        once on a new connection.
+        """
         result_set = []
         try:
             if isinstance(query, str) and query:
                 if isinstance(params, list) or params:
-                    if len(params) == 0:
-                        pq_query = f"{query};"
-                    else:
-                        pq_query = f"{query} VALUES {params};"
-                    print(f"\n{pq_query}")
-                    cls.db_cur.execute(query, params)
-                    result_set = cls.db_cur.fetchall()
-                    for result in result_set:
-                        print(result)
+                    for attempt in range(2):
+                        try:
+                            with self.cursor() as cursor:
+                                query = self.__prefer_view(cursor, query)
+                                if verbose and not attempt:
+                                    self.__show_query(query, params)
+                                cursor.execute(query, params)
+                                result_set = cursor.fetchall()
+                            break
+                        except psycopg2.OperationalError:
+                            if attempt:
+                                raise
+                    if verbose:
+                        for result in result_set:
+                            print(result)
         except (TypeError, ValueError, psycopg2.errors.UndefinedTable,
                 psycopg2.errors.SyntaxError):
-            cls.__show_exception()
+            self.__show_exception()
         return result_set
 
-    @classmethod
-    def create_role(cls, username: str, password: str) -> str:
+    @staticmethod
+    def __view_fresh(cursor, view_name: str) -> bool:
+        """Freshness of a summary view read on cursor."""
+        try:
+            cursor.execute(sql.VIEW_FRESH_SELECT, [view_name])
+            row = cursor.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            return False
+        return bool(row and row[0])
+
+    def __prefer_view(self, cursor, query: str) -> str:
+        """Read a reporting query from its summary view while fresh."""
+        view_name, view_query = select_sql.VIEW_SELECTS.get(query,
+                                                            (None, query))
+        if view_name and self.__view_fresh(cursor, view_name):
+            return view_query
+        return query
+
+    def is_fresh(self, view_name: str) -> bool:
+        """True if no load changed the view's tables since its refresh."""
+        with self.cursor() as cursor:
+            return self.__view_fresh(cursor, view_name)
+
+    @staticmethod
+    def __show_query(query: str, params: list) -> None:
+        """Print query with its parameter values."""
+        if len(params) == 0:
+            pq_query = f"{query};"
+        else:
+            pq_query = f"{query} VALUES {params};"
+        print(f"\n{pq_query}")
+
+    def iter_query(self, query: str, params: list = [],
+                   itersize: int = ITERSIZE, batch_size: int = 0,
+                   verbose: bool = False):
+        """Lazily yield result rows through a server-side cursor.
+
+        Rows are fetched itersize at a time from a named cursor inside
+        a transaction, so client memory stays constant. With batch_size
+        lists of up to batch_size rows are yielded instead of rows. The
+        connection stays borrowed until the generator is exhausted or
+        closed.
+        """
+        if not isinstance(query, str) or not query:
+            return
+        if verbose:
+            self.__show_query(query, params)
+        with self.connection() as db_conn:
+            db_conn.autocommit = False
+            try:
+                with db_conn.cursor(
+                        name=f"media_stream_{next(_CURSOR_IDS)}") as cursor:
+                    cursor.itersize = itersize
+                    cursor.execute(query, params)
+                    if batch_size:
+                        rows = cursor.fetchmany(batch_size)
+                        while rows:
+                            yield rows
+                            rows = cursor.fetchmany(batch_size)
+                    else:
+                        for row in cursor:
+                            if verbose:
+                                print(row)
+                            yield row
+            except (TypeError, ValueError, psycopg2.errors.UndefinedTable,
+                    psycopg2.errors.SyntaxError):
+                self.__show_exception()
+            finally:
+                if not db_conn.closed:
+                    db_conn.rollback()
+                    db_conn.autocommit = True
+
+    def create_role(self, username: str, password: str) -> str:
         """Create new admin role to access media database."""
         def_name = inspect.currentframe().f_code.co_name
         # run_pass_run = 'md5239b17d24927a16de2aba75c9bde23e2'
         try:
-            check_user_query = (f"SELECT rolname FROM pg_roles "
-                                f"WHERE rolname IN ('{username}');")
-            cls.db_cur.execute(check_user_query)
-            db_user = cls.db_cur.fetchone()
-            if not db_user:
-                cls.db_cur.execute(f"CREATE ROLE {username} WITH "
+            with self.cursor() as cursor:
+                check_user_query = (f"SELECT rolname FROM pg_roles "
+                                    f"WHERE rolname IN ('{username}');")
+                cursor.execute(check_user_query)
+                db_user = cursor.fetchone()
+                if not db_user:
+                    cursor.execute(f"CREATE ROLE {username} WITH "
                                    f"LOGIN PASSWORD '{password}' "
                                    f"CREATEDB CREATEROLE NOINHERIT "
                                    f"CONNECTION LIMIT -1 "
@@ -146,15 +414,15 @@ class PostgresMedia:
         print(status)
         return status
 
-    @classmethod
-    def recreate_database(cls, db_name: str, owner: str) -> str:
+    def recreate_database(self, db_name: str, owner: str) -> str:
         """Create media Postgres database."""
         def_name = inspect.currentframe().f_code.co_name
         if isinstance(db_name, str) and db_name:
             if isinstance(owner, str) and owner:
                 try:
-                    cls.db_cur.execute(f"DROP DATABASE IF EXISTS {db_name};")
-                    cls.db_cur.execute(f"CREATE DATABASE {db_name} "
+                    with self.cursor() as cursor:
+                        cursor.execute(f"DROP DATABASE IF EXISTS {db_name};")
+                        cursor.execute(f"CREATE DATABASE {db_name} "
                                        f"WITH ENCODING = 'UTF8' "
                                        f"OWNER = {owner} "
                                        f"CONNECTION LIMIT = -1;")
@@ -167,83 +435,1089 @@ class PostgresMedia:
                 print(status)
                 return status
 
-    @classmethod
-    def drop_tables(cls) -> str:
+    def drop_tables(self) -> str:
         """Remove tables from Postgres media database."""
         def_name = inspect.currentframe().f_code.co_name
         try:
             print(f"{def_name}() {len(sql.TABLES)} tables:")
-            for table in sql.TABLES:
-                query = f"DROP TABLE IF EXISTS {table}"
-                print(f"   {query}")
-                cls.db_cur.execute(query)
+            with self.cursor() as cursor:
+                # summary views depend on the tables
+                print(f"   {sql.DROP_VIEWS_QUERY}")
+                cursor.execute(sql.DROP_VIEWS_QUERY)
+                for table in sql.TABLES:
+                    query = f"DROP TABLE IF EXISTS {table}"
+                    print(f"   {query}")
+                    cursor.execute(query)
+            self.hash_filter.reset()
+            self.__reset_partitions()
             status = f"SUCCESS! {def_name}()"
         except (OSError, psycopg2.OperationalError) as e:
             status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{e}"
         return status
 
-    @classmethod
-    def create_tables(cls) -> str:
-        """Create tables into Postgres database."""
+    def create_tables(self, partitioned: bool = False) -> str:
+        """Create tables into Postgres database.
+
+        With partitioned, new album and filedata tables are partitioned
+        by sql.PARTITIONS; existing tables keep their layout.
+        """
         def_name = inspect.currentframe().f_code.co_name
         try:
             print(f"{def_name}() {len(sql.TABLES)} tables:")
-            for query in sql.CREATE_TABLES_QUERIES:
-                print(f"   {query}")
-                cls.db_cur.execute(query)
+            self.__reset_partitions()
+            with self.cursor() as cursor:
+                for table, query in sql.CREATE_QUERIES.items():
+                    if partitioned and table in sql.PARTITIONS:
+                        query = sql.create_partitioned_query(table)
+                    print(f"   {query}")
+                    cursor.execute(query)
+                if partitioned:
+                    for query in sql.CREATE_DEFAULT_PARTITIONS_QUERIES:
+                        print(f"   {query}")
+                        cursor.execute(query)
+                with self.__partition_lock:
+                    partitioned = self.__read_partitions(cursor)
+                for name in sql.VIEWS:
+                    print(f"   summary view: {name}")
+                    for query in sql.create_view_queries(name):
+                        cursor.execute(query)
+                try:
+                    cursor.execute(sql.create_index_query(
+                        sql.HASH_KEY, partitioned=partitioned))
+                except psycopg2.IntegrityError:
+                    print(f"~!ERROR!~ {def_name}() duplicate hashes in "
+                          f"{sql.FILE_META}, {sql.HASH_KEY} not created")
             status = f"SUCCESS! {def_name}()"
         except (OSError, psycopg2.OperationalError):
-            cls.__show_exception()
+            self.__show_exception()
             status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{e}"
         return status
 
-    @classmethod
-    def process_file(cls, input_path: pathlib.Path) -> bool:
-        """Driver to parse JSON file and commit to Postgres database."""
-        query_status = []
-        inserts_ok = False
+    def create_indexes(self, concurrently: bool = False,
+                       unique: bool = False) -> str:
+        """Build catalog indexes (and upsert unique keys if unique)."""
+        def_name = inspect.currentframe().f_code.co_name
+        names = list(sql.INDEXES) + (list(sql.UNIQUE_INDEXES)
+                                     if unique else [])
+        try:
+            if self.has_trigram():
+                names += list(sql.TRIGRAM_INDEXES)
+            start = time.perf_counter()
+            partitioned = self.is_partitioned()
+            with self.cursor() as cursor:
+                for name in names:
+                    cursor.execute(sql.create_index_query(
+                        name, concurrently, partitioned))
+            status = (f"SUCCESS! {def_name}() {len(names)} indexes in "
+                      f"{time.perf_counter() - start:0.2f}s")
+        except (OSError, psycopg2.OperationalError,
+                psycopg2.errors.UndefinedTable,
+                psycopg2.errors.UndefinedColumn,
+                psycopg2.IntegrityError) as exc:
+            status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{exc}"
+        print(status)
+        return status
+
+    def drop_indexes(self, concurrently: bool = False,
+                     unique: bool = False) -> str:
+        """Drop catalog indexes, e.g. ahead of a bulk load."""
+        def_name = inspect.currentframe().f_code.co_name
+        names = list(sql.INDEXES) + list(sql.TRIGRAM_INDEXES) + (
+            list(sql.UNIQUE_INDEXES) if unique else [])
+        try:
+            partitioned = self.is_partitioned()
+            with self.cursor() as cursor:
+                for name in names:
+                    cursor.execute(sql.drop_index_query(name, concurrently,
+                                                        partitioned))
+            status = f"SUCCESS! {def_name}() {len(names)} indexes"
+        except (OSError, psycopg2.OperationalError) as exc:
+            status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{exc}"
+        print(status)
+        return status
+
+    def has_trigram(self) -> bool:
+        """True if pg_trgm is installed, so search() runs in SQL."""
+        if self.__trigram is None:
+            with self.cursor() as cursor:
+                cursor.execute(select_sql.TRIGRAM_SELECT)
+                self.__trigram = cursor.fetchone() is not None
+        return self.__trigram
+
+    def create_search_indexes(self) -> str:
+        """Install pg_trgm if the server ships it, then build indexes.
+
+        Without the extension (or the privilege to create it) only the
+        prefix indexes are built and search() scores names in process.
+        """
+        def_name = inspect.currentframe().f_code.co_name
+        try:
+            with self.cursor() as cursor:
+                cursor.execute(sql.CREATE_TRIGRAM_QUERY)
+            self.__trigram = True
+        except (psycopg2.errors.FeatureNotSupported,
+                psycopg2.errors.UndefinedFile,
+                psycopg2.errors.InsufficientPrivilege) as exc:
+            self.__trigram = False
+            print(f"~!ERROR!~ {def_name}() pg_trgm unavailable, "
+                  f"in-process fuzzy search\n{exc}")
+        return self.create_indexes()
+
+    def __name_index(self, kind: str):
+        """In-process NameIndex of kind, rebuilt once its table changed."""
+        from db import search
+        table = select_sql.SEARCH_COLUMNS[kind][0]
+        with self.cursor() as cursor:
+            cursor.execute(sql.SEARCH_STATE_SELECT,
+                           [table, sql.views_of([table])])
+            state = cursor.fetchone()
+        # no connection is held while waiting: the build borrows one
+        with self.__search_lock:
+            cached = self.__name_indexes.get(kind)
+            if cached is None or cached[0] != state:
+                names = (row[0] for row in
+                         self.iter_query(select_sql.names_query(kind)))
+                cached = (state, search.NameIndex(names))
+                self.__name_indexes[kind] = cached
+        return cached[1]
+
+    def search(self, text: str, kind: str = 'artist',
+               limit: int = select_sql.SEARCH_LIMIT) -> list:
+        """(name, score) of the kind names most similar to text.
+
+        Scores run from 0 to 1, best first: pg_trgm word_similarity
+        if the extension is installed, else search.NameIndex.score()
+        (partial_ratio/ratio and token_sort_ratio) of the cached
+        in-process index, built on the first search after a load.
+        Typos and missing words still match.
+        """
+        try:
+            if self.has_trigram():
+                with self.cursor() as cursor:
+                    cursor.execute(select_sql.search_query(kind),
+                                   [text, text, limit])
+                    return [(name, round(score, 4))
+                            for name, score in cursor.fetchall()]
+            return self.__name_index(kind).fuzzy(text, limit)
+        except (KeyError, psycopg2.errors.UndefinedTable):
+            self.__show_exception()
+        return []
+
+    def autocomplete(self, text: str, kind: str = 'artist',
+                     limit: int = select_sql.SEARCH_LIMIT) -> list:
+        """Up to limit distinct kind names starting with text, any case."""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute(select_sql.prefix_query(kind),
+                               [select_sql.like_prefix(text), limit])
+                return [row[0] for row in cursor.fetchall()]
+        except (KeyError, psycopg2.errors.UndefinedTable):
+            self.__show_exception()
+        return []
+
+    @staticmethod
+    def __mark_changed(cursor, tables: list) -> None:
+        """Count a change of tables against the views reading them."""
+        cursor.execute(sql.VIEW_CHANGED, [sql.views_of(tables)])
+
+    def refresh_views(self, tables: list = None,
+                      concurrently: bool = True) -> str:
+        """Refresh the summary views reading tables (None: all views).
+
+        Views are refreshed CONCURRENTLY by default so readers are not
+        blocked: the full view query is still recomputed, only writing
+        the rows that differ is saved (not incremental maintenance).
+        Each view is marked fresh for the changes counted before its
+        refresh started.
+        """
+        def_name = inspect.currentframe().f_code.co_name
+        names = list(sql.VIEWS) if tables is None else sql.views_of(tables)
+        try:
+            start = time.perf_counter()
+            with self.metrics.stage('refresh'), self.cursor() as cursor:
+                for name in names:
+                    cursor.execute(sql.VIEW_CHANGES_SELECT, [name])
+                    changes = cursor.fetchone()[0]
+                    cursor.execute(sql.refresh_view_query(name,
+                                                          concurrently))
+                    cursor.execute(sql.VIEW_REFRESHED, [changes, name])
+            status = (f"SUCCESS! {def_name}() {len(names)} views in "
+                      f"{time.perf_counter() - start:0.2f}s")
+        except (OSError, TypeError, psycopg2.OperationalError,
+                psycopg2.errors.UndefinedTable,
+                psycopg2.errors.ObjectNotInPrerequisiteState) as exc:
+            status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{exc}"
+        print(status)
+        return status
+
+    def __insert_rows(self, cursor, table_rows: dict, upsert: bool) -> int:
+        """Insert buffered rows one statement at a time."""
+        skips = {table: sql.SKIP_INSERTS[table]
+                 for table in self.__skip_tables}
+        queries = {**sql.INSERTS, **skips}
+        if upsert:
+            queries = (sql.PARTITION_UPSERTS if self.__partitioned
+                       else sql.UPSERTS)
+        for table, rows in table_rows.items():
+            for data in rows:
+                with self.metrics.stage(f"insert.{table}", 'db'):
+                    cursor.execute(queries[table], data)
+        return len(table_rows[sql.ARTIST])
+
+    def __copy_rows(self, cursor, table_rows: dict, upsert: bool) -> int:
+        """Stream buffered rows per table via COPY.
+
+        Upserts COPY into a temporary staging table and merge from there,
+        as do plain rows of tables with an upsert key, skipping the keys
+        loaded already. Rows are encoded to CSV while the server reads
+        them. Other rows of partitioned tables are copied straight into
+        their partitions.
+        """
+        merges = sql.PARTITION_MERGES if self.__partitioned else sql.MERGES
+        for table, rows in table_rows.items():
+            if rows:
+                with self.metrics.stage(f"insert.{table}", 'db'):
+                    if upsert:
+                        cursor.execute(sql.STAGES[table])
+                        cursor.copy_expert(sql.STAGE_COPIES[table],
+                                           records.CsvStream(rows),
+                                           size=records.COPY_READ_SIZE)
+                        cursor.execute(merges[table])
+                    elif table in self.__skip_tables:
+                        cursor.execute(sql.STAGES[table])
+                        cursor.copy_expert(sql.SKIP_COPIES[table],
+                                           records.CsvStream(rows),
+                                           size=records.COPY_READ_SIZE)
+                        cursor.execute(sql.SKIP_MERGES[table])
+                    else:
+                        for query, part in self.__copy_targets(table, rows):
+                            cursor.copy_expert(query,
+                                               records.CsvStream(part),
+                                               size=records.COPY_READ_SIZE)
+        return len(table_rows[sql.ARTIST])
+
+    def __copy_targets(self, table: str, rows) -> list:
+        """(COPY statement, rows) per partition, or the table's COPY.
+
+        Rows without a partition of their own (or whose partition could
+        not be created) are copied through the table to DEFAULT.
+        """
+        if not self.__partitioned or table not in sql.PARTITIONS:
+            return [(sql.COPIES[table], rows)]
+        targets = []
+        for name, batch in rows.batch.split(
+                sql.PARTITIONS[table][1],
+                lambda value: sql.partition_name(table, value)).items():
+            if self.__partition_names.get(name):
+                query = sql.copy_partition_query(table, name)
+            else:
+                query = sql.COPIES[table]
+            targets.append((query, batch[table]))
+        return targets
+
+    def __read_partitions(self, cursor) -> bool:
+        """Read (once) whether tables are partitioned, and partitions."""
+        if self.__partitioned is None:
+            cursor.execute(sql.PARTITIONED_SELECT)
+            tables = {row[0] for row in cursor.fetchall()}
+            names = {}
+            if tables & set(sql.PARTITIONS):
+                cursor.execute(sql.PARTITIONS_SELECT, [list(sql.PARTITIONS)])
+                names = {row[1]: True for row in cursor.fetchall()}
+            self.__partition_names = names
+            self.__partitioned = bool(tables & set(sql.PARTITIONS))
+        return self.__partitioned
+
+    def __reset_partitions(self) -> None:
+        """Forget partitions, e.g. after tables were dropped."""
+        with self.__partition_lock:
+            self.__partitioned = None
+            self.__partition_names = {}
+
+    def __create_partition(self, db_conn, table: str, value) -> bool:
+        """Create the partition of value, True if rows can be copied in.
+
+        If DEFAULT already holds rows of value they are moved into the
+        new partition in one transaction.
+        """
+        def_name = inspect.currentframe().f_code.co_name
+        try:
+            with db_conn.cursor() as cursor:
+                cursor.execute(sql.create_partition_query(table, value))
+            return True
+        except (psycopg2.errors.DuplicateTable,
+                psycopg2.errors.UniqueViolation):
+            # created by another client meanwhile
+            return True
+        except psycopg2.errors.CheckViolation:
+            pass
+        db_conn.autocommit = False
+        try:
+            with db_conn.cursor() as cursor:
+                for query in sql.move_partition_queries(table, value):
+                    cursor.execute(query)
+            db_conn.commit()
+            return True
+        except psycopg2.Error as exc:
+            db_conn.rollback()
+            print(f"~!ERROR!~ {def_name}() {table} {value!r}: {exc}")
+            return False
+        finally:
+            db_conn.autocommit = True
+
+    def __create_partitions(self, db_conn, batch) -> None:
+        """Create missing partitions of the batch rows (partitioned only)."""
+        with self.__partition_lock:
+            with db_conn.cursor() as cursor:
+                if not self.__read_partitions(cursor):
+                    return
+            for table, (_, column) in sql.PARTITIONS.items():
+                if column not in batch.columns:
+                    continue
+                for value in set(batch.column(column)):
+                    name = sql.partition_name(table, value)
+                    if name is not None and \
+                            name not in self.__partition_names:
+                        self.__partition_names[name] = \
+                            self.__create_partition(db_conn, table, value)
+
+    def __load_rows(self, db_conn, table_rows: dict, engine: str,
+                    upsert: bool = False, checkpoint: list = None) -> int:
+        """Load per-table row buffers with the selected engine.
+
+        'copy' batches, and 'insert' batches with a checkpoint, run in
+        one transaction that also upserts the checkpoint row
+        [file_path, row_offset, mtime, file_size, complete].
+        """
+        cursor = db_conn.cursor()
+        if engine == 'insert' and checkpoint is None:
+            return self.__insert_rows(cursor, table_rows, upsert)
+        db_conn.autocommit = False
+        try:
+            if engine == 'copy':
+                rows = self.__copy_rows(cursor, table_rows, upsert)
+            else:
+                rows = self.__insert_rows(cursor, table_rows, upsert)
+            if checkpoint is not None:
+                cursor.execute(sql.CHECKPOINT_UPSERT, checkpoint)
+            with self.metrics.stage('commit', 'db'):
+                db_conn.commit()
+        except psycopg2.Error:
+            db_conn.rollback()
+            raise
+        finally:
+            db_conn.autocommit = True
+        return rows
+
+    def __preload_hashes(self, db_conn) -> None:
+        """Fill the hash filter from filedata through a named cursor."""
+        db_conn.autocommit = False
+        try:
+            with self.metrics.stage('dedup'), db_conn.cursor(
+                    name=f"media_hashes_{next(_CURSOR_IDS)}") as cursor:
+                cursor.itersize = ITERSIZE * 10
+                cursor.execute(sql.HASH_SELECT)
+                size = self.hash_filter.preload(row[0] for row in cursor)
+            print(f"  dedup: {size} known hashes")
+        finally:
+            db_conn.rollback()
+            db_conn.autocommit = True
+
+    def prepare_load(self, db_conn, dedup_rows: bool = True) -> None:
+        """Ready db_conn for load_batch() calls of one file.
+
+        Preloads the hash filter (dedup_rows, first load only), reads
+        the upsert keys a sync left in place (plain rows conflicting
+        with them are skipped) and counts a change against every
+        summary view.
+        """
+        if dedup_rows and not self.hash_filter.loaded:
+            self.__preload_hashes(db_conn)
+        with db_conn.cursor() as cursor:
+            cursor.execute(sql.INDEX_SELECT)
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.__skip_tables = {table for name, table in sql.SKIP_KEYS.items()
+                              if name in indexes}
+        self.__mark_changed(db_conn.cursor(), list(sql.HEADERS))
+
+    def load_batch(self, db_conn, table_rows, engine: str = 'copy',
+                   upsert: bool = False, checkpoint: list = None,
+                   dedup_rows: bool = True) -> int:
+        """Load one batch, skipping rows with known hashes if dedup_rows.
+
+        Returns the rows written, the others were duplicates. A unique
+        violation on the hash (another process loaded the same track
+        meanwhile) re-reads those hashes and retries the batch once;
+        autocommit inserts cannot be retried and re-raise.
+        """
+        duplicates, claimed = 0, []
+        for attempt in range(2):
+            batch = table_rows
+            if dedup_rows:
+                with self.metrics.stage('dedup'):
+                    batch, claimed, duplicates = dedup.dedup_rows(
+                        self.hash_filter, table_rows)
+            try:
+                self.__create_partitions(db_conn, batch)
+                self.__load_rows(db_conn, batch, engine, upsert, checkpoint)
+                break
+            except psycopg2.errors.UniqueViolation:
+                self.hash_filter.release(claimed)
+                if not dedup_rows or attempt or \
+                        (engine == 'insert' and checkpoint is None):
+                    raise
+                with db_conn.cursor() as cursor:
+                    cursor.execute(sql.HASH_EXISTS_SELECT, [claimed])
+                    self.hash_filter.preload(row[0] for row in cursor)
+            except psycopg2.Error:
+                self.hash_filter.release(claimed)
+                raise
+        self.metrics.count('duplicates', duplicates)
+        return len(batch[sql.ARTIST])
+
+    def __enrich(self, df):
+        """Enrich a batch, counting API calls, cache hits and errors."""
+        api, cache = self.enricher.api, self.enricher.cache
+        calls, errors = api.calls if api else 0, self.enricher.errors
+        hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+        with self.metrics.stage('enrich'):
+            df = self.enricher.enrich(df)
+        self.metrics.count('api_calls', (api.calls if api else 0) - calls)
+        self.metrics.count('errors', self.enricher.errors - errors)
+        if cache:
+            self.metrics.count('cache_hits', cache.hits - hits)
+            self.metrics.count('cache_misses', cache.misses - misses)
+        return df
+
+    @staticmethod
+    def __prepare_upsert(df):
+        """Fill natural keys: blank track_id from hash, other blanks NULL."""
+        df['track_id'] = df['track_id'].where(df['track_id'] != '',
+                                              df['hash'])
+        for table_keys in sql.UPSERT_KEYS.values():
+            for key in table_keys:
+                df[key] = df[key].where(df[key] != '', None)
+        return df
+
+    @staticmethod
+    def __read_chunks(input_path: pathlib.Path):
+        """Yield DataFrames from the reader for the file extension."""
+        from db import readers
+        yield from readers.iter_chunks(input_path)
+
+    def __flush(self, sink, batch, checkpoint: list, stats: dict) -> None:
+        """Hand a batch to the sink, adding rows/duplicates to stats."""
+        start = time.perf_counter()
+        rows = sink.load(batch, checkpoint)
+        self.metrics.record(f"sink.{sink.name}", time.perf_counter() - start)
+        stats['rows'] += rows
+        stats['duplicates'] += len(batch) - rows
+
+    def load_file(self, input_path: pathlib.Path, engine: str = 'insert',
+                  batch_size: int = 0, source_id: int = None,
+                  checkpoint: tuple = None, sink: sinks.Sink = None) -> dict:
+        """Parse JSON file, load rows with engine and return load stats.
+
+        'insert' executes one statement per table per row (autocommit),
+        'copy' buffers rows and streams them through COPY with one
+        transaction per batch_size rows (0: one transaction per file).
+        Sources are read in chunks by extension (readers.READERS): split
+        JSON above json_stream.STREAM_THRESHOLD and JSON Lines are
+        streamed, Parquet/Arrow IPC are memory-mapped and projected to
+        the HEADERS columns. Each chunk is enriched as one batch.
+        With a manifest source_id, rows are upserted on natural keys.
+        With a ((mtime, size), row_offset) checkpoint, rows before
+        row_offset are skipped and every batch (insert batches too)
+        commits together with the file's new checkpoint row. The file
+        is loaded on one connection borrowed from the pool. Rows whose
+        content hash is already in filedata (or earlier in the file) are
+        skipped before any SQL and counted as duplicates; the hash
+        filter is preloaded from filedata on the first load.
+        Batches go to sink (default: sinks.PostgresSink of engine), e.g.
+        a MemorySink or SqliteSink to run without Postgres; the sink's
+        own seconds are timed as stage 'sink.<name>'.
+        """
+        from db import transform
+        stats = {'file': str(input_path), 'engine': engine,
+                 'status': False, 'rows': 0, 'duplicates': 0,
+                 'seconds': 0.0}
         if isinstance(input_path, pathlib.Path) and input_path:
+            if engine not in ENGINES:
+                print(f"invalid engine: '{engine}' {ENGINES}")
+                return stats
+            upsert = source_id is not None
+            if sink is None:
+                sink = sinks.PostgresSink(self, engine, upsert)
+            stats['sink'] = sink.name
+            flush_size = sink.flush_size(batch_size, checkpoint)
+            headers_map = sql.UPSERT_HEADERS if upsert else sql.HEADERS
+            version, skip = checkpoint or ((None, None), 0)
+
+            def position(rows: int, complete: bool = False) -> list:
+                """Checkpoint row once rows more rows are committed."""
+                if checkpoint is None:
+                    return None
+                return [str(input_path), checkpoint[1] + stats['rows'] +
+                        stats['duplicates'] + rows, *version, complete]
+            start = time.perf_counter()
+            sink_seconds = sink.seconds
             try:
-                df = pandas.read_json(input_path, lines=False,
-                                      encoding='utf-8',
-                                      orient='split')
-                for column, series in df.iterrows():
-                    series['artist_id'] = cls.spotify.get_artist_id(
-                        series['artist_name'])
-                    series['album_id'] = cls.spotify.get_album_id(
-                        series['artist_id'], series['album_title'])
-                    for table, headers in sql.HEADERS.items():
-                        data = series[headers]
-                        cls.db_cur.execute(sql.INSERTS[table], data)
-                        # returns 1 if query was successful
-                        query_status.append(cls.db_cur.rowcount)
-                inserts_ok = next((q for q in query_status if q == 1), True)
-            except (IndexError, KeyError, PermissionError,
-                    psycopg2.OperationalError):
-                cls.__show_exception()
-        return inserts_ok
-
-    @classmethod
-    def process_data(cls, input_path: pathlib.Path) -> bool:
-        """Locates source JSON files recursively from input path."""
-        status = False
+                with sink.session():
+                    table_rows = records.ColumnBatch.empty(headers_map)
+                    for df in self.metrics.iter_stage(
+                            'read', self.__read_chunks(input_path)):
+                        if skip >= len(df):
+                            skip -= len(df)
+                            continue
+                        if skip:
+                            df, skip = df.iloc[skip:].copy(), 0
+                        df = self.__enrich(df)
+                        with self.metrics.stage('transform'):
+                            if upsert:
+                                df = self.__prepare_upsert(df)
+                                df[sql.SOURCE_COLUMN] = source_id
+                            table_rows.extend(
+                                transform.column_batch(df, headers_map))
+                        del df
+                        pending, offset = len(table_rows), 0
+                        while flush_size and pending - offset >= flush_size:
+                            self.__flush(
+                                sink,
+                                table_rows.slice(offset, offset + flush_size),
+                                position(flush_size), stats)
+                            offset += flush_size
+                        if offset:
+                            table_rows = table_rows.slice(offset)
+                    self.__flush(sink, table_rows,
+                                 position(len(table_rows), complete=True),
+                                 stats)
+                stats['status'] = True
+                self.metrics.count('bytes', input_path.stat().st_size)
+            except (IndexError, KeyError, ValueError, PermissionError,
+                    psycopg2.OperationalError, psycopg2.DataError,
+                    psycopg2.IntegrityError,
+                    psycopg2.errors.UndefinedTable, sqlite3.Error):
+                self.metrics.count('errors')
+                self.__show_exception()
+            stats['seconds'] = time.perf_counter() - start
+            stats['sink_seconds'] = sink.seconds - sink_seconds
+            self.metrics.count('files')
+            self.metrics.count('rows', stats['rows'])
+            rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+            sink_rate = (stats['rows'] / stats['sink_seconds']
+                         if stats['sink_seconds'] else 0)
+            print(f"  {engine}: {stats['rows']} rows in "
+                  f"{stats['seconds']:0.3f}s ({rate:0.1f} rows/sec, "
+                  f"{stats['duplicates']} duplicates)\n"
+                  f"  sink {sink.name}: {stats['sink_seconds']:0.3f}s "
+                  f"({sink_rate:0.1f} rows/sec)")
+        return stats
+
+    def process_file(self, input_path: pathlib.Path, engine: str = 'insert',
+                     batch_size: int = 0, sink: sinks.Sink = None) -> bool:
+        """Driver to parse JSON file and commit to Postgres database."""
+        return self.load_file(input_path, engine, batch_size,
+                              sink=sink)['status']
+
+    def __load_parallel(self, tasks: list, workers: int) -> list:
+        """Load files on a pool of worker processes, one connection each."""
+        results = []
+        # spawn: forked children must not inherit the parent's sockets
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes=min(workers, len(tasks)),
+                          initializer=_init_worker,
+                          initargs=(self.get_connection_kwargs(),)) as pool:
+            for idx, stats in enumerate(
+                    pool.imap_unordered(_load_worker_file, tasks), 0):
+                if 'metrics' in stats:
+                    self.metrics.merge(stats.pop('metrics'))
+                results.append(stats)
+                print(f"  processing: file_{idx:02d}: "
+                      f"{pathlib.Path(stats['file']).name}")
+        return sorted(results, key=lambda stats: stats['file'])
+
+    def __load_files(self, tasks: list, workers: int) -> list:
+        """Load (path, engine, batch_size, source_id, checkpoint) tasks."""
+        if workers > 1 and len(tasks) > 1:
+            return self.__load_parallel(tasks, workers)
+        results = []
+        for idx, task in enumerate(tasks, 0):
+            results.append(self.load_file(*task))
+            print(f"  processing: file_{idx:02d}: {task[0].name}")
+        return results
+
+    def __find_files(self, input_path: pathlib.Path) -> list:
+        """Source files (readers.EXTENSIONS) found under input path."""
+        from db import readers
+        with self.metrics.stage('scan'):
+            file_path_list = [p.absolute() for p in
+                              sorted(input_path.rglob("*"))
+                              if p.is_file() and readers.is_source(p)]
+        print(f"{len(file_path_list)} files found in "
+              f"'{os.sep.join(input_path.parts[-3:])}'")
+        return file_path_list
+
+    @staticmethod
+    def __summarize(summary: dict, results: list) -> dict:
+        """Combine per-file load stats into the run summary."""
+        summary['results'] = results
+        summary['loaded'] = sum(1 for r in results if r['status'])
+        summary['failed'] = [r['file'] for r in results if not r['status']]
+        summary['rows'] = sum(r['rows'] for r in results)
+        summary['duplicates'] = sum(r.get('duplicates', 0) for r in results)
+        return summary
+
+    def __checkpoint_tasks(self, file_path_list: list, engine: str,
+                           batch_size: int, resume: bool) -> tuple:
+        """Load tasks resuming from checkpoints, plus skipped/failed stats.
+
+        Without resume the checkpoints of these files are reset. Files
+        whose mtime or size moved since their checkpoint (the manifest's
+        unchanged test, no hashing) cannot resume and are failed.
+        """
+        checkpoints = {}
+        with self.cursor() as cursor:
+            cursor.execute(sql.CREATE_CHECKPOINT_QUERY)
+            if resume:
+                cursor.execute(sql.CHECKPOINT_SELECT)
+                checkpoints = {row[0]: row for row in cursor.fetchall()}
+            else:
+                cursor.execute(sql.CHECKPOINT_DELETE,
+                               [[str(p) for p in file_path_list]])
+        tasks, skipped, failed = [], 0, []
+        for json_path in file_path_list:
+            file_stat = json_path.stat()
+            version = (file_stat.st_mtime, file_stat.st_size)
+            row = checkpoints.get(str(json_path))
+            if row and tuple(row[2:4]) != version:
+                print(f"~!ERROR!~ '{json_path.name}' changed since its "
+                      f"checkpoint, reload without resume")
+                failed.append({'file': str(json_path), 'engine': engine,
+                               'status': False, 'rows': 0, 'duplicates': 0,
+                               'seconds': 0.0})
+            elif row and row[4]:
+                skipped += 1
+            else:
+                tasks.append((json_path, engine, batch_size, None,
+                              (version, row[1] if row else 0)))
+        return tasks, skipped, failed
+
+    def load_data(self, input_path: pathlib.Path, engine: str = 'insert',
+                  batch_size: int = 0, workers: int = 1,
+                  concurrent_indexes: bool = False,
+                  resume: bool = False, sink: sinks.Sink = None) -> dict:
+        """Load every JSON file under input path and combine file stats.
+
+        With workers > 1 the files are spread over a process pool where
+        each worker holds its own database connection. Catalog indexes
+        are dropped before the load and rebuilt afterwards, then the
+        summary views are refreshed. Each batch is checkpointed, so
+        resume continues after the last committed batch of every file
+        and skips files already complete. Tracks whose content hash is
+        already loaded are skipped and reported as duplicates.
+        Another sink loads the files one by one into itself, without
+        checkpoints, indexes or views (no Postgres needed).
+        """
+        summary = {'status': False, 'files': 0, 'loaded': 0, 'failed': [],
+                   'skipped': 0, 'rows': 0, 'duplicates': 0, 'seconds': 0.0,
+                   'results': []}
         if isinstance(input_path, pathlib.Path) and input_path:
+            start = time.perf_counter()
             try:
-                file_path_list = [p.absolute() for p in
-                                  sorted(input_path.rglob("*.json"))
-                                  if p.is_file()]
-                print(f"{len(file_path_list)} files found in "
-                      f"'{os.sep.join(input_path.parts[-3:])}'")
-                for idx, json_path in enumerate(file_path_list, 0):
-                    cls.process_file(json_path)
-                    print(f"  processing: file_{idx:02d}: {json_path.name}")
+                file_path_list = self.__find_files(input_path)
+                if sink is not None:
+                    self.__summarize(summary, [
+                        self.load_file(json_path, engine, batch_size,
+                                       sink=sink)
+                        for json_path in file_path_list])
+                else:
+                    tasks, summary['skipped'], failed = \
+                        self.__checkpoint_tasks(file_path_list, engine,
+                                                batch_size, resume)
+                    if tasks:
+                        with self.metrics.stage('index'):
+                            self.drop_indexes(concurrent_indexes)
+                    self.__summarize(summary, failed +
+                                     self.__load_files(tasks, workers))
+                    if tasks:
+                        with self.metrics.stage('index'):
+                            self.create_indexes(concurrent_indexes)
+                        self.refresh_views(list(sql.HEADERS))
+                summary['files'] = len(file_path_list)
                 if len(file_path_list) > 0:
-                    status = True
+                    summary['status'] = True
             except (OSError, PermissionError, KeyError):
-                cls.__show_exception()
+                self.__show_exception()
+            summary['seconds'] = time.perf_counter() - start
+            print(f"  loaded {summary['loaded']}/{summary['files']} files, "
+                  f"{summary['rows']} rows in {summary['seconds']:0.2f}s "
+                  f"({summary['duplicates']} duplicates, "
+                  f"{summary['skipped']} skipped, "
+                  f"{len(summary['failed'])} failed)")
+        return summary
+
+    @staticmethod
+    def __hash_file(input_path: pathlib.Path) -> str:
+        """SHA-256 hex digest of file contents."""
+        digest = hashlib.sha256()
+        with open(input_path, mode='rb') as input_file:
+            for block in iter(lambda: input_file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def __prepare_manifest(self, reset: bool = False) -> dict:
+        """Create manifest/upsert indexes, check rows of full loads.
+
+        On the first sync rows of earlier full loads have no source
+        file to track (nor unique upsert keys): with reset the data
+        tables are emptied, the checkpoint and view_state tables kept,
+        else ValueError.
+        """
+        with self.cursor() as cursor:
+            cursor.execute(sql.CREATE_MANIFEST_QUERY)
+            cursor.execute(sql.MANIFEST_SELECT)
+            manifest = {row[1]: row for row in cursor.fetchall()}
+            untracked = 0
+            if not manifest:
+                cursor.execute(sql.UNTRACKED_SELECT)
+                untracked = cursor.fetchone()[0]
+            if untracked and reset:
+                print(f"  manifest: reset, {untracked} rows loaded "
+                      f"without it removed")
+                self.__mark_changed(cursor, list(sql.HEADERS))
+                cursor.execute(sql.DATA_TRUNCATE)
+                self.hash_filter.reset()
+            elif untracked:
+                raise ValueError(f"{untracked} rows were loaded without "
+                                 f"the manifest, sync with reset=True "
+                                 f"(load --incremental --reset) to "
+                                 f"replace them")
+        partitioned = self.is_partitioned()
+        with self.cursor() as cursor:
+            for name in sql.UNIQUE_INDEXES:
+                cursor.execute(sql.create_index_query(
+                    name, partitioned=partitioned))
+        return manifest
+
+    def __remove_source(self, cursor, source_id: int) -> None:
+        """Delete track/filedata rows loaded from a manifest file."""
+        self.__mark_changed(cursor, list(sql.HEADERS))
+        for query in sql.SOURCE_DELETES:
+            cursor.execute(query, [source_id])
+        self.hash_filter.reset()
+
+    def __sync_task(self, cursor, json_path: pathlib.Path, row: tuple,
+                    engine: str, batch_size: int, pending: dict) -> tuple:
+        """Load task of a new/changed file (None: unchanged, skip it).
+
+        Unchanged content only refreshes the manifest mtime/size; a load
+        registers the file and removes its previous rows first, its
+        manifest values are kept in pending until the load succeeds.
+        """
+        file_stat = json_path.stat()
+        if row and row[4] and row[2] == file_stat.st_mtime and \
+                row[3] == file_stat.st_size:
+            return None
+        content_hash = self.__hash_file(json_path)
+        if row and row[4] == content_hash:
+            cursor.execute(sql.MANIFEST_UPDATE,
+                           [file_stat.st_mtime, file_stat.st_size,
+                            content_hash, row[0]])
+            return None
+        cursor.execute(sql.MANIFEST_REGISTER, [str(json_path)])
+        source_id = cursor.fetchone()[0]
+        self.__remove_source(cursor, source_id)
+        pending[str(json_path)] = [file_stat.st_mtime, file_stat.st_size,
+                                   content_hash, source_id]
+        return json_path, engine, batch_size, source_id, None
+
+    def sync_data(self, input_path: pathlib.Path, engine: str = 'insert',
+                  batch_size: int = 0, workers: int = 1,
+                  reset: bool = False) -> dict:
+        """Incrementally load new/changed files, drop rows of removed ones.
+
+        Files whose mtime and size (or content hash) match the manifest
+        are skipped, changed files replace their previous rows through
+        upserts and files missing from input path are deleted together
+        with artist/album/genre rows no track refers to any more. Summary
+        views are refreshed only if a file was loaded or removed. Rows of
+        earlier full loads stop the first sync, unless reset empties the
+        data tables.
+        """
+        def_name = inspect.currentframe().f_code.co_name
+        summary = {'status': False, 'files': 0, 'loaded': 0, 'failed': [],
+                   'skipped': 0, 'removed': 0, 'rows': 0, 'seconds': 0.0,
+                   'results': []}
+        if isinstance(input_path, pathlib.Path) and input_path:
+            start = time.perf_counter()
+            try:
+                file_path_list = self.__find_files(input_path)
+                manifest = self.__prepare_manifest(reset)
+                tasks, pending = [], {}
+                with self.cursor() as cursor:
+                    for json_path in file_path_list:
+                        task = self.__sync_task(
+                            cursor, json_path, manifest.pop(str(json_path),
+                                                            None),
+                            engine, batch_size, pending)
+                        if task is None:
+                            summary['skipped'] += 1
+                        else:
+                            tasks.append(task)
+                    for row in manifest.values():
+                        self.__remove_source(cursor, row[0])
+                        cursor.execute(sql.MANIFEST_DELETE, [row[0]])
+                        summary['removed'] += 1
+                results = self.__load_files(tasks, workers)
+                with self.cursor() as cursor:
+                    for stats in results:
+                        if stats['status']:
+                            cursor.execute(sql.MANIFEST_UPDATE,
+                                           pending[stats['file']])
+                    if tasks or summary['removed']:
+                        for query in sql.ORPHAN_DELETES:
+                            cursor.execute(query)
+                with self.metrics.stage('index'):
+                    self.create_indexes()
+                if tasks or summary['removed']:
+                    self.refresh_views(list(sql.HEADERS))
+                self.__summarize(summary, results)
+                summary['files'] = len(file_path_list)
+                summary['status'] = True
+            except ValueError as exc:
+                print(f"~!ERROR!~ {def_name}() {exc}")
+            except (OSError, PermissionError, KeyError,
+                    psycopg2.OperationalError, psycopg2.IntegrityError):
+                self.__show_exception()
+            summary['seconds'] = time.perf_counter() - start
+            print(f"{def_name}() loaded {summary['loaded']}, skipped "
+                  f"{summary['skipped']}, removed {summary['removed']} of "
+                  f"{summary['files']} files, {summary['rows']} rows in "
+                  f"{summary['seconds']:0.2f}s "
+                  f"({len(summary['failed'])} failed)")
+        return summary
+
+    def sync_file(self, json_path: pathlib.Path, engine: str = 'copy',
+                  batch_size: int = 0) -> dict:
+        """Incrementally load one file through the manifest.
+
+        Same rules as sync_data() for a single file, without index or
+        view maintenance; the manifest must exist (sync_data() first).
+        Rows of an earlier version of the file are replaced and stats
+        of an unchanged file report status True with 0 rows.
+        """
+        stats = {'file': str(json_path), 'engine': engine,
+                 'status': False, 'rows': 0, 'duplicates': 0,
+                 'seconds': 0.0}
+        json_path = pathlib.Path(json_path).absolute()
+        start = time.perf_counter()
+        try:
+            pending = {}
+            with self.cursor() as cursor:
+                cursor.execute(sql.MANIFEST_FILE_SELECT, [str(json_path)])
+                row = cursor.fetchone()
+                task = self.__sync_task(cursor, json_path, row, engine,
+                                        batch_size, pending)
+            if task is None:
+                stats['status'] = True
+            else:
+                stats = self.load_file(*task)
+            if task is not None and stats['status']:
+                with self.cursor() as cursor:
+                    cursor.execute(sql.MANIFEST_UPDATE,
+                                   pending[str(json_path)])
+                    if row:
+                        for query in sql.ORPHAN_DELETES:
+                            cursor.execute(query)
+        except (OSError, KeyError, psycopg2.OperationalError,
+                psycopg2.IntegrityError, psycopg2.errors.UndefinedTable):
+            self.__show_exception()
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+
+    def watch_data(self, input_path: pathlib.Path, engine: str = 'copy',
+                   batch_size: int = 0, workers: int = None,
+                   debounce: float = None, poll_interval: float = None,
+                   stop_event=None, max_files: int = None,
+                   timeout: float = None) -> dict:
+        """Sync input path, then keep loading files as they land.
+
+        Changes come from inotify (optional inotify_simple package) or
+        polling, and a file is loaded once it stayed unchanged for
+        debounce seconds. Loader threads take settled files from a
+        bounded queue, so scanning, parsing and loading overlap; see
+        watch.Watcher.run() for the stop conditions. None options take
+        the watch module defaults.
+        """
+        from db import watch
+        def_name = inspect.currentframe().f_code.co_name
+        watcher = watch.Watcher(
+            self, input_path, engine, batch_size,
+            watch.WORKERS if workers is None else workers,
+            watch.DEBOUNCE_SECONDS if debounce is None else debounce,
+            watch.POLL_SECONDS if poll_interval is None else poll_interval)
+        summary = watcher.run(stop_event, max_files, timeout)
+        print(f"{def_name}() loaded {summary['loaded']}, skipped "
+              f"{summary['skipped']} files, {summary['rows']} rows in "
+              f"{summary['seconds']:0.2f}s (max latency "
+              f"{summary['latency']:0.2f}s, {len(summary['failed'])} "
+              f"failed)")
+        return summary
+
+    def process_data(self, input_path: pathlib.Path, engine: str = 'insert',
+                     batch_size: int = 0, workers: int = 1,
+                     concurrent_indexes: bool = False,
+                     resume: bool = False) -> bool:
+        """Locates source JSON files recursively from input path."""
+        return self.load_data(input_path, engine, batch_size, workers,
+                              concurrent_indexes, resume)['status']
+
+    def export_data(self, output_path: pathlib.Path = None,
+                    exports: list = None, fmt: str = 'csv',
+                    chunk_rows: int = None,
+                    partition_by: str = None, params: list = None,
+                    workers: int = 1) -> dict:
+        """Stream tables and named queries out with COPY TO STDOUT.
+
+        Every export (default: the media tables, or export.QUERIES such
+        as 'join'/'gain' with params) is written as gzip CSV or Parquet
+        part files of chunk_rows rows under output_path/<export>, split
+        into <column>=<value> directories with partition_by. None
+        options take the export module defaults.
+        """
+        from db import export
+        def_name = inspect.currentframe().f_code.co_name
+        summary = {'status': False, 'exports': 0, 'rows': 0, 'files': 0,
+                   'bytes': 0, 'seconds': 0.0, 'failed': [], 'results': []}
+        if fmt not in export.FORMATS:
+            print(f"invalid format: '{fmt}' {export.FORMATS}")
+            return summary
+        start = time.perf_counter()
+        results = export.export_all(
+            self.get_connection_kwargs(), exports,
+            export.EXPORT_PATH if output_path is None else output_path,
+            fmt, export.CHUNK_ROWS if chunk_rows is None else chunk_rows,
+            partition_by, params, workers)
+        summary['results'] = results
+        summary['exports'] = sum(1 for r in results if r['status'])
+        summary['failed'] = [r['export'] for r in results
+                             if not r['status']]
+        for key in ['rows', 'files', 'bytes']:
+            summary[key] = sum(r[key] for r in results)
+        summary['status'] = bool(results) and not summary['failed']
+        summary['seconds'] = time.perf_counter() - start
+        print(f"{def_name}() {summary['exports']} exports, "
+              f"{summary['rows']} rows in {summary['files']} files "
+              f"({summary['bytes'] / 1048576:0.2f} MiB) in "
+              f"{summary['seconds']:0.2f}s ({len(summary['failed'])} failed)")
+        return summary
+
+    def drop_partition(self, table: str, value) -> str:
+        """Drop the partition of table holding value, e.g. '.wma' or 1990.
+
+        Only that partition is locked; its rows are gone until it is
+        reloaded and the views reading the table are refreshed.
+        """
+        def_name = inspect.currentframe().f_code.co_name
+        name = (sql.partition_name(table, value)
+                if table in sql.PARTITIONS else None)
+        if name is None or not self.is_partitioned():
+            status = f"~!ERROR!~ {def_name}() no partition: {table} {value!r}"
+            print(status)
+            return status
+        try:
+            with self.cursor() as cursor:
+                self.__mark_changed(cursor, [table])
+                cursor.execute(f"DROP TABLE IF EXISTS {name};")
+            with self.__partition_lock:
+                self.__partition_names.pop(name, None)
+            if table == sql.FILE_META:
+                self.hash_filter.reset()
+            self.refresh_views([table])
+            status = f"SUCCESS! {def_name}() {name}"
+        except (OSError, psycopg2.OperationalError) as exc:
+            status = f"~!ERROR!~ {def_name}() {sys.exc_info()[0]}\n{exc}"
+        print(status)
         return status
 
-    @classmethod
-    def close(cls):
-        cls.db_cur.close()
-        cls.db_conn.close()
+    def reload_partition(self, table: str, value,
+                         input_path: pathlib.Path) -> dict:
+        """Replace the rows of one partition with those of input path.
+
+        The partition is truncated and refilled by COPY in one
+        transaction, so readers of other partitions are not blocked.
+        Source rows are deduplicated by content hash within input path;
+        a filedata partition, like a plain load, also skips the hashes
+        stored in its other partitions.
+        """
+        from db import transform
+        def_name = inspect.currentframe().f_code.co_name
+        stats = {'table': table, 'partition': None, 'status': False,
+                 'rows': 0, 'duplicates': 0, 'seconds': 0.0}
+        name = (sql.partition_name(table, value)
+                if table in sql.PARTITIONS else None)
+        if name is None or not self.is_partitioned():
+            print(f"~!ERROR!~ {def_name}() no partition: {table} {value!r}")
+            return stats
+        stats['partition'] = name
+        column = sql.PARTITIONS[table][1]
+        hash_filter = dedup.HashFilter()
+        start = time.perf_counter()
+        try:
+            file_path_list = self.__find_files(input_path)
+            with self.connection() as db_conn:
+                with self.__partition_lock:
+                    if not self.__partition_names.get(name):
+                        self.__partition_names[name] = \
+                            self.__create_partition(db_conn, table, value)
+                db_conn.autocommit = False
+                try:
+                    cursor = db_conn.cursor()
+                    cursor.execute(f"TRUNCATE {name};")
+                    self.__mark_changed(cursor, [table])
+                    if table == sql.FILE_META:
+                        # truncated above: only other partitions' hashes
+                        with db_conn.cursor(
+                                name=f"media_hashes_{next(_CURSOR_IDS)}"
+                        ) as hash_cursor:
+                            hash_cursor.itersize = ITERSIZE * 10
+                            hash_cursor.execute(sql.HASH_SELECT)
+                            hash_filter.preload(row[0]
+                                                for row in hash_cursor)
+                    for json_path in file_path_list:
+                        for df in self.__read_chunks(json_path):
+                            df = self.__enrich(df)
+                            rows = transform.column_batch(df).split(
+                                column,
+                                lambda v: sql.partition_name(table, v))
+                            if name in rows:
+                                batch, _, duplicates = dedup.dedup_rows(
+                                    hash_filter, rows[name])
+                                stats['duplicates'] += duplicates
+                                cursor.copy_expert(
+                                    sql.copy_partition_query(table, name),
+                                    records.CsvStream(batch[table]),
+                                    size=records.COPY_READ_SIZE)
+                                stats['rows'] += len(batch)
+                    db_conn.commit()
+                except psycopg2.Error:
+                    db_conn.rollback()
+                    raise
+                finally:
+                    db_conn.autocommit = True
+            if table == sql.FILE_META:
+                self.hash_filter.reset()
+            self.refresh_views([table])
+            stats['status'] = True
+        except (OSError, KeyError, psycopg2.Error):
+            self.__show_exception()
+        stats['seconds'] = time.perf_counter() - start
+        print(f"{def_name}() {name}: {stats['rows']} rows in "
+              f"{stats['seconds']:0.2f}s ({stats['duplicates']} "
+              f"duplicates)")
+        return stats
+
+    def close(self):
+        """Close every pooled connection."""
+        if self.pool is not None and not self.pool.closed:
+            self.pool.closeall()
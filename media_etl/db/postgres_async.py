@@ -0,0 +1,314 @@
+# -*- coding: UTF-8 -*-
+"""Asyncio query and bulk load API for PostgreSQL (psycopg 3)."""
+import asyncio
+import itertools
+import os
+import pathlib
+import time
+from db.metrics import RunMetrics
+from db import dedup
+from db import readers
+from db import records
+from db import transform
+from db import postgres_insert_queries as sql
+from db import postgres_select_queries as select_sql
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except ImportError:
+    psycopg = None
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+ITERSIZE = 2000
+MIN_CONNECTIONS = 1
+MAX_CONNECTIONS = 16
+_CURSOR_IDS = itertools.count()
+
+__all__ = ['AsyncPostgresMedia']
+
+
+class AsyncPostgresMedia:
+    """Coroutine counterpart of PostgresMedia over an async pool.
+
+    Every coroutine borrows a connection for its own duration, so one
+    event loop can serve many concurrent lookups. Use as
+    'async with AsyncPostgresMedia(...) as pg_api:' or call open() and
+    close(). Needs the optional psycopg 3 and psycopg_pool packages.
+    The enrichment stage (Spotify login check, lookup cache) is only
+    set up by the first load.
+    """
+
+    def __init__(self, hostname: str = 'localhost',
+                 port_num: int = 5432,
+                 db_name: str = 'media_db',
+                 username: str = 'run_admin_run',
+                 password: str = 'run_pass_run',
+                 private_cfg=False,
+                 min_conn: int = MIN_CONNECTIONS,
+                 max_conn: int = MAX_CONNECTIONS,
+                 enricher=None):
+        if psycopg is None:
+            raise ImportError("AsyncPostgresMedia needs psycopg 3 "
+                              "(pip install 'psycopg[binary,pool]')")
+        self.metrics = RunMetrics()
+        self.__db_name = db_name
+        self.conninfo = psycopg.conninfo.make_conninfo(
+            host=hostname, port=port_num, dbname=db_name, user=username,
+            password=password, connect_timeout=1)
+        self.pool = AsyncConnectionPool(
+            self.conninfo, min_size=min(min_conn, max_conn),
+            max_size=max_conn, open=False, kwargs={'autocommit': True},
+            check=AsyncConnectionPool.check_connection)
+        self.__private_cfg = private_cfg
+        self.__enricher = enricher
+        self.hash_filter = dedup.HashFilter()
+        self.conn_status = False
+
+    def __config_path(self) -> pathlib.Path:
+        """Spotify credentials file (private_cfg: outside the repo)."""
+        if self.__private_cfg:
+            return pathlib.Path(TWO_PARENT_PATH, 'private_cfg',
+                                'spotify.cfg')
+        return pathlib.Path(TWO_PARENT_PATH, 'spotify.cfg')
+
+    @property
+    def enricher(self):
+        """EnrichmentStage of the loads, created on first use.
+
+        Online only if SpotifyClient logged in with the credentials,
+        else offline IDs, like PostgresMedia.enricher.
+        """
+        if self.__enricher is None:
+            from db.enrichment import EnrichmentStage
+            from db.spotify import SpotifyClient
+            spotify = SpotifyClient(self.__config_path())
+            self.__enricher = EnrichmentStage.from_config(
+                self.__config_path(), cache=spotify.cache,
+                online=spotify.run_spotify(), metrics=self.metrics)
+        return self.__enricher
+
+    @enricher.setter
+    def enricher(self, stage) -> None:
+        self.__enricher = stage
+
+    async def open(self, timeout: float = 5.0) -> bool:
+        """Open the pool, waiting for min_conn connections."""
+        try:
+            await self.pool.open(wait=True, timeout=timeout)
+            self.conn_status = True
+        except (PoolTimeout, psycopg.OperationalError) as exc:
+            print(f"~!ERROR!~ open() '{self.__db_name}': {exc}")
+            await self.pool.close()
+        return self.conn_status
+
+    async def close(self) -> None:
+        """Close the pool and its connections."""
+        await self.pool.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def is_connected(self) -> bool:
+        """True once the pool is open."""
+        return self.conn_status
+
+    @staticmethod
+    async def __view_fresh(cursor, view_name: str) -> bool:
+        """Freshness of a summary view read on cursor."""
+        try:
+            await cursor.execute(sql.VIEW_FRESH_SELECT, [view_name])
+            row = await cursor.fetchone()
+        except psycopg.errors.UndefinedTable:
+            return False
+        return bool(row and row[0])
+
+    async def is_fresh(self, view_name: str) -> bool:
+        """True if no load changed the view's tables since its refresh."""
+        async with self.pool.connection() as db_conn:
+            return await self.__view_fresh(db_conn.cursor(), view_name)
+
+    async def query(self, query: str, params: list = [],
+                    verbose: bool = False) -> list:
+        """Query media database for result set based on params.
+
+        Reporting queries read their summary view while it is fresh.
+        """
+        result_set = []
+        if not isinstance(query, str) or not query:
+            return result_set
+        try:
+            async with self.pool.connection() as db_conn:
+                cursor = db_conn.cursor()
+                view_name, view_query = select_sql.VIEW_SELECTS.get(
+                    query, (None, query))
+                if view_name and await self.__view_fresh(cursor, view_name):
+                    query = view_query
+                with self.metrics.stage('query', 'db'):
+                    await cursor.execute(query, params or None)
+                    result_set = await cursor.fetchall()
+        except (TypeError, ValueError, psycopg.errors.UndefinedTable,
+                psycopg.errors.SyntaxError) as exc:
+            print(f"~!ERROR!~ query() {type(exc).__name__}: {exc}")
+        if verbose:
+            print(f"\n{query} VALUES {params};")
+            for result in result_set:
+                print(result)
+        return result_set
+
+    async def iter_query(self, query: str, params: list = [],
+                         itersize: int = ITERSIZE, batch_size: int = 0):
+        """Async generator of rows from a server-side cursor.
+
+        Rows are fetched itersize at a time inside a transaction; with
+        batch_size lists of up to batch_size rows are yielded instead.
+        """
+        async with self.pool.connection() as db_conn:
+            async with db_conn.transaction(force_rollback=True):
+                async with db_conn.cursor(
+                        name=f"media_stream_{next(_CURSOR_IDS)}") as cursor:
+                    cursor.itersize = itersize
+                    await cursor.execute(query, params or None)
+                    if batch_size:
+                        rows = await cursor.fetchmany(batch_size)
+                        while rows:
+                            yield rows
+                            rows = await cursor.fetchmany(batch_size)
+                    else:
+                        async for row in cursor:
+                            yield row
+
+    def __iter_chunks(self, input_path: pathlib.Path):
+        """Read, enrich and transform a file chunk by chunk."""
+        for df in self.metrics.iter_stage('read',
+                                          readers.iter_chunks(input_path)):
+            with self.metrics.stage('enrich'):
+                df = self.enricher.enrich(df)
+            with self.metrics.stage('transform'):
+                yield transform.column_batch(df)
+
+    async def __preload_hashes(self, db_conn) -> None:
+        """Fill the hash filter from filedata through a named cursor."""
+        async with db_conn.transaction(force_rollback=True):
+            async with db_conn.cursor(
+                    name=f"media_hashes_{next(_CURSOR_IDS)}") as cursor:
+                cursor.itersize = ITERSIZE * 10
+                await cursor.execute(sql.HASH_SELECT)
+                self.hash_filter.preload([row[0] async for row in cursor])
+
+    async def __copy_rows(self, db_conn, table_rows) -> int:
+        """COPY one ColumnBatch of rows in a single transaction."""
+        async with db_conn.transaction():
+            cursor = db_conn.cursor()
+            for table, rows in table_rows.items():
+                if rows:
+                    stream = records.CsvStream(rows)
+                    with self.metrics.stage(f"insert.{table}", 'db'):
+                        async with cursor.copy(sql.COPIES[table]) as copy:
+                            for data in iter(lambda: stream.read(
+                                    records.COPY_READ_SIZE), ''):
+                                await copy.write(data)
+        return len(table_rows)
+
+    async def load_file(self, input_path: pathlib.Path,
+                        batch_size: int = 0) -> dict:
+        """Bulk load a source file through COPY, return load stats.
+
+        Each chunk is read, enriched and transformed in a worker thread
+        while the loop keeps serving other coroutines; the COPY batches
+        (batch_size rows per transaction, 0: one per chunk) run on one
+        borrowed connection. Rows with a known content hash are skipped
+        and counted as duplicates, as in PostgresMedia.load_file().
+        """
+        stats = {'file': str(input_path), 'engine': 'copy',
+                 'status': False, 'rows': 0, 'duplicates': 0,
+                 'seconds': 0.0}
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        chunks = self.__iter_chunks(input_path)
+        try:
+            async with self.pool.connection() as db_conn:
+                if not self.hash_filter.loaded:
+                    await self.__preload_hashes(db_conn)
+                await db_conn.execute(sql.VIEW_CHANGED,
+                                      [sql.views_of(list(sql.HEADERS))])
+                while True:
+                    table_rows = await loop.run_in_executor(None, next,
+                                                            chunks, None)
+                    if table_rows is None:
+                        break
+                    table_rows, _, duplicates = dedup.dedup_rows(
+                        self.hash_filter, table_rows)
+                    stats['duplicates'] += duplicates
+                    self.metrics.count('duplicates', duplicates)
+                    size = batch_size or len(table_rows) or 1
+                    for offset in range(0, len(table_rows), size):
+                        try:
+                            stats['rows'] += await self.__copy_rows(
+                                db_conn,
+                                table_rows.slice(offset, offset + size))
+                        except psycopg.Error:
+                            self.hash_filter.release(table_rows.slice(
+                                offset).column(dedup.HASH_COLUMN))
+                            raise
+            stats['status'] = True
+            self.metrics.count('bytes', input_path.stat().st_size)
+        except (IndexError, KeyError, ValueError, OSError,
+                psycopg.OperationalError, psycopg.DataError,
+                psycopg.IntegrityError, psycopg.errors.UndefinedTable) as exc:
+            self.metrics.count('errors')
+            print(f"~!ERROR!~ load_file() '{input_path.name}' "
+                  f"{type(exc).__name__}: {exc}")
+        stats['seconds'] = time.perf_counter() - start
+        self.metrics.count('files')
+        self.metrics.count('rows', stats['rows'])
+        return stats
+
+    async def refresh_views(self, tables: list = None) -> list:
+        """REFRESH CONCURRENTLY the summary views reading tables."""
+        names = list(sql.VIEWS) if tables is None else sql.views_of(tables)
+        async with self.pool.connection() as db_conn:
+            with self.metrics.stage('refresh'):
+                for name in names:
+                    cursor = await db_conn.execute(sql.VIEW_CHANGES_SELECT,
+                                                   [name])
+                    changes = (await cursor.fetchone())[0]
+                    await db_conn.execute(sql.refresh_view_query(name))
+                    await db_conn.execute(sql.VIEW_REFRESHED,
+                                          [changes, name])
+        return names
+
+    async def load_data(self, input_path: pathlib.Path,
+                        batch_size: int = 0) -> dict:
+        """Load every source file under input path concurrently.
+
+        Files are loaded as concurrent tasks, bounded by the pool size,
+        and the summary views are refreshed once afterwards.
+        """
+        summary = {'status': False, 'files': 0, 'loaded': 0, 'failed': [],
+                   'rows': 0, 'duplicates': 0, 'seconds': 0.0,
+                   'results': []}
+        start = time.perf_counter()
+        file_path_list = [p.absolute() for p in sorted(input_path.rglob("*"))
+                          if p.is_file() and readers.is_source(p)]
+        results = await asyncio.gather(*[self.load_file(path, batch_size)
+                                         for path in file_path_list])
+        if results:
+            await self.refresh_views(list(sql.HEADERS))
+        summary['results'] = list(results)
+        summary['files'] = len(file_path_list)
+        summary['loaded'] = sum(1 for r in results if r['status'])
+        summary['failed'] = [r['file'] for r in results if not r['status']]
+        summary['rows'] = sum(r['rows'] for r in results)
+        summary['duplicates'] = sum(r['duplicates'] for r in results)
+        summary['status'] = bool(file_path_list)
+        summary['seconds'] = time.perf_counter() - start
+        print(f"  loaded {summary['loaded']}/{summary['files']} files, "
+              f"{summary['rows']} rows in {summary['seconds']:0.2f}s "
+              f"({summary['duplicates']} duplicates, "
+              f"{len(summary['failed'])} failed)")
+        return summary
@@ -1,12 +1,20 @@
 # -*- coding: UTF-8 -*-
 """Tables and insert queries for PostgreSQL."""
+import re
+import zlib
+from db import postgres_select_queries as select_sql
+
 ARTIST = "artist"
 ALBUM = "album"
 TRACK = "track"
 GENRE = "genre"
 FILE_META = "filedata"
+MANIFEST = "manifest"
+CHECKPOINT = "checkpoint"
+VIEW_STATE = "view_state"
 
-TABLES = [ARTIST, ALBUM, TRACK, GENRE, FILE_META]
+TABLES = [ARTIST, ALBUM, TRACK, GENRE, FILE_META, MANIFEST, CHECKPOINT,
+          VIEW_STATE]
 
 ARTIST_HEADERS = ['artist_id', 'artist_name', 'composer', 'conductor']
 CREATE_ARTIST_QUERY = (f"CREATE TABLE IF NOT EXISTS {ARTIST} "
@@ -40,7 +48,8 @@ CREATE_TRACK_QUERY = (f"CREATE TABLE IF NOT EXISTS {TRACK} "
                       f"track_length VARCHAR(16) NULL, "
                       f"rating VARCHAR(16) NULL, "
                       f"comment VARCHAR(128) NULL, "
-                      f"track_gain NUMERIC(5,2));")
+                      f"track_gain NUMERIC(5,2), "
+                      f"source_id INTEGER NULL);")
 
 GENRE_HEADERS = ['artist_id', 'artist_name', 'genre', 'genre_in_dict']
 CREATE_GENRE_QUERY = (f"CREATE TABLE IF NOT EXISTS {GENRE} "
@@ -64,14 +73,52 @@ CREATE_FILE_QUERY = (f"CREATE TABLE IF NOT EXISTS {FILE_META} "
                      f"path_len SMALLINT, "
                      f"last_modified TIMESTAMP, "
                      f"encoding VARCHAR(24) NULL, "
-                     f"hash VARCHAR(150) NULL);")
+                     f"hash VARCHAR(150) NULL, "
+                     f"source_id INTEGER NULL);")
+
+# incremental loads: one row per input file, source_id of track/filedata
+CREATE_MANIFEST_QUERY = (f"CREATE TABLE IF NOT EXISTS {MANIFEST} "
+                         f"(id SERIAL PRIMARY KEY, "
+                         f"file_path VARCHAR(1024) UNIQUE NOT NULL, "
+                         f"mtime DOUBLE PRECISION, "
+                         f"file_size BIGINT, "
+                         f"content_hash VARCHAR(64) NULL, "
+                         f"loaded_at TIMESTAMP DEFAULT now());")
+
+# resumable loads: rows of each file committed so far, updated in the
+# same transaction as every batch; mtime/size tell if the file changed
+CREATE_CHECKPOINT_QUERY = (f"CREATE TABLE IF NOT EXISTS {CHECKPOINT} "
+                           f"(id SERIAL PRIMARY KEY, "
+                           f"file_path VARCHAR(1024) UNIQUE NOT NULL, "
+                           f"row_offset BIGINT NOT NULL DEFAULT 0, "
+                           f"mtime DOUBLE PRECISION, "
+                           f"file_size BIGINT, "
+                           f"complete BOOLEAN NOT NULL DEFAULT FALSE, "
+                           f"updated_at TIMESTAMP DEFAULT now());")
+
+# summary views: loads count changes, refreshes remember the count they
+# saw, so a view is fresh while changes match refreshed_changes
+CREATE_VIEW_STATE_QUERY = (f"CREATE TABLE IF NOT EXISTS {VIEW_STATE} "
+                           f"(id SERIAL PRIMARY KEY, "
+                           f"view_name VARCHAR(64) UNIQUE NOT NULL, "
+                           f"changes BIGINT NOT NULL DEFAULT 0, "
+                           f"refreshed_changes BIGINT NOT NULL DEFAULT 0, "
+                           f"refreshed_at TIMESTAMP DEFAULT now());")
 
 HEADERS = {ARTIST: ARTIST_HEADERS, ALBUM: ALBUM_HEADERS, TRACK: TRACK_HEADERS,
            GENRE: GENRE_HEADERS, FILE_META: FILE_HEADERS}
 
+# source values are strings, cast once per chunk to the column types
+INTEGER_COLUMNS = ['file_size', 'track_number', 'year', 'path_len']
+NUMERIC_COLUMNS = ['track_gain', 'album_gain']
+TIMESTAMP_COLUMNS = ['last_modified']
+
 CREATE_TABLES_QUERIES = [CREATE_ARTIST_QUERY, CREATE_ALBUM_QUERY,
                          CREATE_TRACK_QUERY,
-                         CREATE_GENRE_QUERY, CREATE_FILE_QUERY]
+                         CREATE_GENRE_QUERY, CREATE_FILE_QUERY,
+                         CREATE_MANIFEST_QUERY, CREATE_CHECKPOINT_QUERY,
+                         CREATE_VIEW_STATE_QUERY]
+CREATE_QUERIES = dict(zip(TABLES, CREATE_TABLES_QUERIES))
 
 ARTIST_INSERT = (f"INSERT INTO {ARTIST} "
                  "(artist_id, artist_name, composer, conductor) "
@@ -99,3 +146,325 @@ FILE_INSERT = (f"INSERT INTO {FILE_META} "
 
 INSERTS = {ARTIST: ARTIST_INSERT, ALBUM: ALBUM_INSERT, TRACK: TRACK_INSERT,
            GENRE: GENRE_INSERT, FILE_META: FILE_INSERT}
+
+# bulk load: one COPY per table streams CSV rows in HEADERS column order
+COPIES = {table: (f"COPY {table} ({', '.join(headers)}) "
+                  f"FROM STDIN WITH (FORMAT csv)")
+          for table, headers in HEADERS.items()}
+
+# incremental loads: upserts keyed on natural keys, rows of track/filedata
+# remember the manifest id of the file they were loaded from
+SOURCE_COLUMN = 'source_id'
+SOURCE_TABLES = [TRACK, FILE_META]
+UPSERT_KEYS = {ARTIST: ['artist_id'], ALBUM: ['album_id'],
+               TRACK: ['track_id'], GENRE: ['artist_id', 'genre'],
+               FILE_META: ['hash']}
+UPSERT_HEADERS = {table: headers + [SOURCE_COLUMN]
+                  if table in SOURCE_TABLES else headers
+                  for table, headers in HEADERS.items()}
+
+
+def _on_conflict(table: str, upsert_keys: dict = UPSERT_KEYS) -> str:
+    """ON CONFLICT clause updating every non-key column of table."""
+    keys = upsert_keys[table]
+    updates = ', '.join(f"{col} = EXCLUDED.{col}"
+                        for col in UPSERT_HEADERS[table] if col not in keys)
+    return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+
+UNIQUE_INDEXES = {f"{table}_{'_'.join(keys)}_key": (table, keys, True)
+                  for table, keys in UPSERT_KEYS.items()}
+
+# content-hash dedup: filedata.hash is unique for plain loads as well
+HASH_KEY = f"{FILE_META}_hash_key"
+HASH_SELECT = f"SELECT hash FROM {FILE_META} WHERE hash IS NOT NULL;"
+HASH_EXISTS_SELECT = f"SELECT hash FROM {FILE_META} WHERE hash = ANY(%s);"
+
+
+def _upserts(upsert_keys: dict) -> dict:
+    """Row upsert statement per table on the upsert_keys conflict keys."""
+    return {table: (f"INSERT INTO {table} ({', '.join(headers)}) "
+                    f"VALUES ({', '.join(['%s'] * len(headers))}) "
+                    f"{_on_conflict(table, upsert_keys)};")
+            for table, headers in UPSERT_HEADERS.items()}
+
+
+UPSERTS = _upserts(UPSERT_KEYS)
+
+# COPY into per-session staging tables, then merge one row per key
+STAGES = {table: (f"CREATE TEMP TABLE IF NOT EXISTS stage_{table} "
+                  f"ON COMMIT DELETE ROWS AS "
+                  f"SELECT {', '.join(headers)} FROM {table} WITH NO DATA;")
+          for table, headers in UPSERT_HEADERS.items()}
+
+STAGE_COPIES = {table: (f"COPY stage_{table} ({', '.join(headers)}) "
+                        f"FROM STDIN WITH (FORMAT csv)")
+                for table, headers in UPSERT_HEADERS.items()}
+
+
+def _merges(upsert_keys: dict) -> dict:
+    """Staging table merge per table, last row per conflict key wins."""
+    return {table: (f"INSERT INTO {table} ({', '.join(headers)}) "
+                    f"SELECT DISTINCT ON ({', '.join(upsert_keys[table])}) "
+                    f"{', '.join(headers)} FROM stage_{table} "
+                    f"ORDER BY {', '.join(upsert_keys[table])}, ctid DESC "
+                    f"{_on_conflict(table, upsert_keys)};")
+            for table, headers in UPSERT_HEADERS.items()}
+
+
+MERGES = _merges(UPSERT_KEYS)
+
+# upsert keys a sync leaves on artist/album/track/genre: plain loads then
+# skip rows whose key is loaded already (filedata hash conflicts raise)
+SKIP_KEYS = {name: table for name, (table, _, _) in UNIQUE_INDEXES.items()
+             if table != FILE_META}
+SKIP_INSERTS = {table: f"{INSERTS[table][:-1]} ON CONFLICT DO NOTHING;"
+                for table in SKIP_KEYS.values()}
+SKIP_COPIES = {table: (f"COPY stage_{table} ({', '.join(HEADERS[table])}) "
+                       f"FROM STDIN WITH (FORMAT csv)")
+               for table in SKIP_KEYS.values()}
+SKIP_MERGES = {table: (f"INSERT INTO {table} ({', '.join(HEADERS[table])}) "
+                       f"SELECT {', '.join(HEADERS[table])} "
+                       f"FROM stage_{table} ON CONFLICT DO NOTHING;")
+               for table in SKIP_KEYS.values()}
+
+SOURCE_DELETES = [f"DELETE FROM {table} WHERE {SOURCE_COLUMN} = %s;"
+                  for table in SOURCE_TABLES]
+# rows loaded without the manifest (no source file to track)
+UNTRACKED_SELECT = "SELECT " + " + ".join(
+    f"(SELECT COUNT(*) FROM {table} WHERE {SOURCE_COLUMN} IS NULL)"
+    for table in SOURCE_TABLES) + ";"
+DATA_TRUNCATE = f"TRUNCATE {', '.join(HEADERS)} RESTART IDENTITY;"
+
+# shared artist/album/genre rows no longer referenced by any track
+ORPHAN_DELETES = [(f"DELETE FROM {ARTIST} a WHERE NOT EXISTS "
+                   f"(SELECT 1 FROM {TRACK} t "
+                   f"WHERE t.artist_id IS NOT DISTINCT FROM a.artist_id);"),
+                  (f"DELETE FROM {ALBUM} m WHERE NOT EXISTS "
+                   f"(SELECT 1 FROM {TRACK} t "
+                   f"WHERE t.artist_id IS NOT DISTINCT FROM m.artist_id "
+                   f"AND t.album_title = m.album_title);"),
+                  (f"DELETE FROM {GENRE} g WHERE NOT EXISTS "
+                   f"(SELECT 1 FROM {TRACK} t "
+                   f"WHERE t.artist_id IS NOT DISTINCT FROM g.artist_id);")]
+
+MANIFEST_SELECT = (f"SELECT id, file_path, mtime, file_size, content_hash "
+                   f"FROM {MANIFEST};")
+MANIFEST_FILE_SELECT = (f"SELECT id, file_path, mtime, file_size, "
+                        f"content_hash FROM {MANIFEST} WHERE file_path = %s;")
+MANIFEST_REGISTER = (f"INSERT INTO {MANIFEST} (file_path) VALUES (%s) "
+                     f"ON CONFLICT (file_path) "
+                     f"DO UPDATE SET content_hash = NULL RETURNING id;")
+MANIFEST_UPDATE = (f"UPDATE {MANIFEST} SET mtime = %s, file_size = %s, "
+                   f"content_hash = %s, loaded_at = now() WHERE id = %s;")
+MANIFEST_DELETE = f"DELETE FROM {MANIFEST} WHERE id = %s;"
+
+CHECKPOINT_SELECT = (f"SELECT file_path, row_offset, mtime, file_size, "
+                     f"complete FROM {CHECKPOINT};")
+CHECKPOINT_UPSERT = (f"INSERT INTO {CHECKPOINT} "
+                     f"(file_path, row_offset, mtime, file_size, complete) "
+                     f"VALUES (%s, %s, %s, %s, %s) ON CONFLICT (file_path) "
+                     f"DO UPDATE SET row_offset = EXCLUDED.row_offset, "
+                     f"mtime = EXCLUDED.mtime, "
+                     f"file_size = EXCLUDED.file_size, "
+                     f"complete = EXCLUDED.complete, updated_at = now();")
+CHECKPOINT_DELETE = f"DELETE FROM {CHECKPOINT} WHERE file_path = ANY(%s);"
+
+# index catalog {name: (table, columns, unique)} for the lookups and joins
+# in postgres_select_queries, built after bulk loads
+INDEXES = {'artist_artist_name_idx': (ARTIST, ['artist_name'], False),
+           'artist_artist_id_idx': (ARTIST, ['artist_id'], False),
+           'album_album_title_idx': (ALBUM, ['album_title'], False),
+           'album_artist_id_idx': (ALBUM, ['artist_id'], False),
+           'album_album_gain_idx': (ALBUM, ['album_gain'], False),
+           'track_track_title_idx': (TRACK, ['track_title'], False),
+           'track_artist_id_idx': (TRACK, ['artist_id'], False),
+           'genre_genre_idx': (GENRE, ['genre'], False),
+           'genre_artist_id_idx': (GENRE, ['artist_id'], False),
+           'filedata_file_ext_idx': (FILE_META, ['file_ext'], False),
+           'filedata_source_id_idx': (FILE_META, [SOURCE_COLUMN], False),
+           'track_source_id_idx': (TRACK, [SOURCE_COLUMN], False),
+           **{f"{table}_{column}_prefix_idx":
+              (table, [f"({select_sql.prefix_key(column)})"], False)
+              for table, column in select_sql.SEARCH_COLUMNS.values()}}
+# GIN trigram indexes of the fuzzy search, built once pg_trgm is installed
+TRIGRAM_INDEXES = {f"{table}_{column}_trgm_idx":
+                   (table, [f"{column} gin_trgm_ops"], False)
+                   for table, column in select_sql.SEARCH_COLUMNS.values()}
+CREATE_TRIGRAM_QUERY = "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+# fallback search indexes are stale once the table was recreated or a
+# load counted a change against the views reading it
+SEARCH_STATE_SELECT = (f"SELECT to_regclass(%s)::oid, "
+                       f"(SELECT COALESCE(SUM(changes), 0) FROM {VIEW_STATE} "
+                       f"WHERE view_name = ANY(%s));")
+
+INDEX_CATALOG = {**INDEXES, **UNIQUE_INDEXES, **TRIGRAM_INDEXES}
+
+# optional declarative partitioning {table: (strategy, column)}: one
+# LIST partition per file extension, one RANGE partition per YEAR_SPAN
+# album years, created as values appear; NULLs go to the DEFAULT one
+PARTITIONS = {FILE_META: ('LIST', 'file_ext'), ALBUM: ('RANGE', 'year')}
+YEAR_SPAN = 10
+# unique keys of a partitioned table must contain its partition column
+PARTITION_UPSERT_KEYS = {table: keys + [PARTITIONS[table][1]]
+                         if table in PARTITIONS else keys
+                         for table, keys in UPSERT_KEYS.items()}
+PARTITION_UPSERTS = _upserts(PARTITION_UPSERT_KEYS)
+PARTITION_MERGES = _merges(PARTITION_UPSERT_KEYS)
+PARTITION_INDEX_CATALOG = {
+    **INDEX_CATALOG,
+    **{name: (table, PARTITION_UPSERT_KEYS[table], True)
+       for name, (table, _, _) in UNIQUE_INDEXES.items()}}
+
+
+def create_index_query(name: str, concurrently: bool = False,
+                       partitioned: bool = False) -> str:
+    """CREATE INDEX statement for a catalog index.
+
+    Indexes of partitioned tables cannot be built CONCURRENTLY.
+    """
+    catalog = PARTITION_INDEX_CATALOG if partitioned else INDEX_CATALOG
+    table, columns, unique = catalog[name]
+    concurrently = concurrently and not (partitioned and table in PARTITIONS)
+    using = ' USING gin' if name in TRIGRAM_INDEXES else ''
+    return (f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+            f"{name} ON {table}{using} ({', '.join(columns)});")
+
+
+def drop_index_query(name: str, concurrently: bool = False,
+                     partitioned: bool = False) -> str:
+    """DROP INDEX statement for a catalog index."""
+    table = INDEX_CATALOG[name][0]
+    concurrently = concurrently and not (partitioned and table in PARTITIONS)
+    return (f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}"
+            f"IF EXISTS {name};")
+
+
+def create_partitioned_query(table: str) -> str:
+    """CREATE TABLE of a PARTITIONS table, partitioned by its column.
+
+    Without a primary key: it would have to include the (nullable)
+    partition column.
+    """
+    strategy, column = PARTITIONS[table]
+    query = CREATE_QUERIES[table]
+    return (query.replace('id SERIAL PRIMARY KEY', 'id SERIAL NOT NULL')
+            .rstrip(';') + f" PARTITION BY {strategy} ({column});")
+
+
+def partition_bounds(table: str, value) -> tuple:
+    """(name, FOR VALUES clause, WHERE clause) of the partition of value.
+
+    None for values only the DEFAULT partition takes: NULL, '' and
+    negative years. Extensions like '.flac' name filedata_flac, other
+    values get a checksum suffix so distinct values never share a name.
+    """
+    strategy, column = PARTITIONS[table]
+    if strategy == 'RANGE':
+        if value is None or value < 0:
+            return None
+        low = value - value % YEAR_SPAN
+        high = low + YEAR_SPAN
+        return (f"{table}_{low}", f"FOR VALUES FROM ({low}) TO ({high})",
+                f"{column} >= {low} AND {column} < {high}")
+    if not value:
+        return None
+    slug = re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_')[:40]
+    if value != f".{slug}":
+        slug = f"{slug}_{zlib.crc32(value.encode('utf-8')):08x}"
+    literal = value.replace("'", "''")
+    return (f"{table}_{slug.lstrip('_')}", f"FOR VALUES IN ('{literal}')",
+            f"{column} = '{literal}'")
+
+
+def partition_name(table: str, value) -> str:
+    """Partition of table holding value (None: the DEFAULT partition)."""
+    bounds = partition_bounds(table, value)
+    return bounds[0] if bounds else None
+
+
+def create_partition_query(table: str, value) -> str:
+    """CREATE TABLE of the partition holding value."""
+    name, values, _ = partition_bounds(table, value)
+    return (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"{values};")
+
+
+def move_partition_queries(table: str, value) -> list:
+    """Statements moving rows of value out of DEFAULT into a new partition.
+
+    A partition cannot be created while DEFAULT holds its rows (e.g.
+    rows loaded before it existed), so it is attached after the move;
+    run them in one transaction.
+    """
+    name, values, where = partition_bounds(table, value)
+    return [f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS);",
+            f"WITH moved AS (DELETE FROM {table}_default WHERE {where} "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved;",
+            f"ALTER TABLE {table} ATTACH PARTITION {name} {values};"]
+
+
+def copy_partition_query(table: str, name: str) -> str:
+    """COPY statement loading table rows straight into partition name."""
+    return (f"COPY {name} ({', '.join(HEADERS[table])}) "
+            f"FROM STDIN WITH (FORMAT csv)")
+
+
+CREATE_DEFAULT_PARTITIONS_QUERIES = [
+    f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} "
+    f"DEFAULT;" for table in PARTITIONS]
+PARTITIONED_SELECT = ("SELECT relname FROM pg_class WHERE relkind = 'p' "
+                      "AND relnamespace = current_schema()::regnamespace;")
+PARTITIONS_SELECT = ("SELECT p.relname, c.relname, "
+                     "pg_get_expr(c.relpartbound, c.oid), c.reltuples "
+                     "FROM pg_inherits i "
+                     "JOIN pg_class c ON c.oid = i.inhrelid "
+                     "JOIN pg_class p ON p.oid = i.inhparent "
+                     "WHERE p.relname = ANY(%s) ORDER BY c.relname;")
+
+
+# materialized summary views {name: (query, unique key, base tables)},
+# the unique key lets them be refreshed CONCURRENTLY
+VIEWS = {select_sql.GENRE_SUMMARY: (select_sql.GENRE_COUNT_SELECT,
+                                    ['genre'], [GENRE, TRACK]),
+         select_sql.FILE_EXT_SUMMARY: (select_sql.EXT_SIZE_SELECT,
+                                       ['file_ext'], [FILE_META]),
+         select_sql.ARTIST_GAIN_SUMMARY: (select_sql.ARTIST_GAIN_SELECT,
+                                          ['artist_id'], [ALBUM, ARTIST])}
+
+
+def views_of(tables: list) -> list:
+    """Summary views reading any of tables."""
+    return [name for name, (_, _, base) in VIEWS.items()
+            if set(base) & set(tables)]
+
+
+def create_view_queries(name: str) -> list:
+    """CREATE statements of a summary view, its key index and state."""
+    query, keys, _ = VIEWS[name]
+    return [f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query};",
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key "
+            f"ON {name} ({', '.join(keys)});",
+            f"INSERT INTO {VIEW_STATE} (view_name) VALUES ('{name}') "
+            f"ON CONFLICT (view_name) DO NOTHING;"]
+
+
+def refresh_view_query(name: str, concurrently: bool = True) -> str:
+    """REFRESH statement for a summary view."""
+    return (f"REFRESH MATERIALIZED VIEW "
+            f"{'CONCURRENTLY ' if concurrently else ''}{name};")
+
+
+DROP_VIEWS_QUERY = f"DROP MATERIALIZED VIEW IF EXISTS {', '.join(VIEWS)};"
+VIEW_CHANGED = (f"UPDATE {VIEW_STATE} SET changes = changes + 1 "
+                f"WHERE view_name = ANY(%s);")
+VIEW_CHANGES_SELECT = (f"SELECT changes FROM {VIEW_STATE} "
+                       f"WHERE view_name = %s;")
+VIEW_REFRESHED = (f"UPDATE {VIEW_STATE} SET refreshed_changes = %s, "
+                  f"refreshed_at = now() WHERE view_name = %s;")
+VIEW_FRESH_SELECT = (f"SELECT changes = refreshed_changes FROM {VIEW_STATE} "
+                     f"WHERE view_name = %s;")
+
+INDEX_SELECT = ("SELECT indexname FROM pg_indexes "
+                "WHERE schemaname = current_schema();")
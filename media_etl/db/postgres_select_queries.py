@@ -5,6 +5,9 @@ ALBUM = "album"
 TRACK = "track"
 GENRE = "genre"
 FILE_META = "filedata"
+GENRE_SUMMARY = "genre_summary"
+FILE_EXT_SUMMARY = "file_ext_summary"
+ARTIST_GAIN_SUMMARY = "artist_gain_summary"
 
 ARTIST_SELECT = ("SELECT artist_id, artist_name, composer, conductor "
                  f"FROM {ARTIST} "
@@ -42,3 +45,110 @@ FILE_SELECT = ("SELECT file_name, encoding, file_ext "
                "WHERE file_ext = (%s)")
 
 AVG_SIZE_SELECT = f"SELECT AVG(file_size) FROM {FILE_META}"
+
+# reporting aggregates, also the definitions of the materialized views
+GENRE_COUNT_SELECT = ("SELECT g.genre, "
+                      "COUNT(DISTINCT g.artist_id) AS artists, "
+                      "COUNT(DISTINCT t.id) AS tracks "
+                      f"FROM {GENRE} g "
+                      f"LEFT JOIN {TRACK} t ON t.artist_id = g.artist_id "
+                      "GROUP BY g.genre")
+
+EXT_SIZE_SELECT = ("SELECT file_ext, COUNT(*) AS files, "
+                   "COUNT(file_size) AS sized_files, "
+                   "SUM(file_size) AS total_size, "
+                   "AVG(file_size) AS avg_size, "
+                   "MIN(file_size) AS min_size, MAX(file_size) AS max_size "
+                   f"FROM {FILE_META} "
+                   "GROUP BY file_ext")
+
+ARTIST_GAIN_SELECT = ("SELECT m.artist_id, MIN(a.artist_name) AS artist_name, "
+                      "COUNT(DISTINCT m.album_id) AS albums, "
+                      "MIN(m.album_gain) AS min_gain, "
+                      "MAX(m.album_gain) AS max_gain "
+                      f"FROM {ALBUM} m "
+                      f"LEFT JOIN {ARTIST} a ON a.artist_id = m.artist_id "
+                      "GROUP BY m.artist_id")
+
+# the same results read from the views while they are fresh
+GENRE_COUNT_VIEW_SELECT = ("SELECT genre, artists, tracks "
+                           f"FROM {GENRE_SUMMARY}")
+
+EXT_SIZE_VIEW_SELECT = ("SELECT file_ext, files, sized_files, total_size, "
+                        "avg_size, min_size, max_size "
+                        f"FROM {FILE_EXT_SUMMARY}")
+
+ARTIST_GAIN_VIEW_SELECT = ("SELECT artist_id, artist_name, albums, "
+                           "min_gain, max_gain "
+                           f"FROM {ARTIST_GAIN_SUMMARY}")
+
+AVG_SIZE_VIEW_SELECT = ("SELECT SUM(total_size) / NULLIF(SUM(sized_files), 0) "
+                        f"FROM {FILE_EXT_SUMMARY}")
+
+VIEW_SELECTS = {GENRE_COUNT_SELECT: (GENRE_SUMMARY, GENRE_COUNT_VIEW_SELECT),
+                EXT_SIZE_SELECT: (FILE_EXT_SUMMARY, EXT_SIZE_VIEW_SELECT),
+                ARTIST_GAIN_SELECT: (ARTIST_GAIN_SUMMARY,
+                                     ARTIST_GAIN_VIEW_SELECT),
+                AVG_SIZE_SELECT: (FILE_EXT_SUMMARY, AVG_SIZE_VIEW_SELECT)}
+
+# named queries of the 'query' command: name -> (query, param count)
+QUERIES = {'artist': (ARTIST_SELECT, 1), 'album': (ALBUM_SELECT, 1),
+           'track': (TRACK_SELECT, 1), 'genre': (GENRE_SELECT, 1),
+           'file': (FILE_SELECT, 1), 'gain': (GAIN_SELECT, 1),
+           'join': (JOIN_SELECT, 1), 'avg_size': (AVG_SIZE_SELECT, 0),
+           'genre_count': (GENRE_COUNT_SELECT, 0),
+           'ext_size': (EXT_SIZE_SELECT, 0),
+           'artist_gain': (ARTIST_GAIN_SELECT, 0)}
+
+# name search of the 'search' command: kind -> (table, name column)
+SEARCH_COLUMNS = {'artist': (ARTIST, 'artist_name'),
+                  'album': (ALBUM, 'album_title'),
+                  'track': (TRACK, 'track_title')}
+SEARCH_LIMIT = 10
+TRIGRAM_SELECT = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+
+
+def prefix_key(column: str) -> str:
+    """Case-insensitive, byte-ordered key of a name column.
+
+    Matches the prefix search indexes, so LIKE 'prefix%' and the
+    ORDER BY both run on the index.
+    """
+    return f'lower({column}) COLLATE "C"'
+
+
+def like_prefix(text: str) -> str:
+    """LIKE pattern of the names starting with text, any case."""
+    escaped = text.lower().replace('\\', '\\\\')
+    return escaped.replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def prefix_query(kind: str) -> str:
+    """Distinct names of kind starting with a LIKE pattern, sorted.
+
+    Parameters: like_prefix(text), limit.
+    """
+    table, column = SEARCH_COLUMNS[kind]
+    key = prefix_key(column)
+    return (f"SELECT MIN({column}) FROM {table} "
+            f"WHERE {key} LIKE %s "
+            f"GROUP BY {key} ORDER BY {key} LIMIT %s")
+
+
+def search_query(kind: str) -> str:
+    """pg_trgm search of kind names, best word_similarity first.
+
+    The <% operator (pg_trgm.word_similarity_threshold) runs on the
+    trigram index. Parameters: text, text, limit.
+    """
+    table, column = SEARCH_COLUMNS[kind]
+    return (f"SELECT {column}, word_similarity(%s, {column}) AS score "
+            f"FROM {table} WHERE %s <%% {column} "
+            f"GROUP BY {column} ORDER BY score DESC, {column} LIMIT %s")
+
+
+def names_query(kind: str) -> str:
+    """Distinct names of kind, for the in-process fallback index."""
+    table, column = SEARCH_COLUMNS[kind]
+    return (f"SELECT DISTINCT {column} FROM {table} "
+            f"WHERE {column} IS NOT NULL")
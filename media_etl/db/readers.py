@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+"""Source readers for media files, selected by file extension."""
+import json
+import pathlib
+import pandas
+from db import json_stream
+from db import postgres_insert_queries as sql
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = json_stream.CHUNK_SIZE
+# every column a table (or the enrichment stage) reads, the projection
+# of columnar sources
+SOURCE_COLUMNS = list(dict.fromkeys(
+    column for headers in sql.HEADERS.values() for column in headers))
+
+__all__ = ['EXTENSIONS', 'READERS', 'SOURCE_COLUMNS', 'iter_chunks',
+           'is_source']
+
+
+def _projected(df):
+    """Only SOURCE_COLUMNS, absent ones added blank like split JSON."""
+    return df.reindex(columns=SOURCE_COLUMNS, fill_value='')
+
+
+def read_split_json(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """pandas orient='split' JSON: whole file, or streamed if large."""
+    if json_stream.is_streamed(input_path):
+        yield from json_stream.iter_split_chunks(input_path, chunk_size)
+    else:
+        yield pandas.read_json(input_path, lines=False, encoding='utf-8',
+                               orient='split')
+
+
+def read_json_lines(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """JSON Lines of row objects, decoded one line at a time."""
+    rows = []
+    with open(input_path, mode='r', encoding='utf-8') as input_file:
+        for line_num, line in enumerate(input_file, 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"'{input_path.name}' line {line_num}: "
+                                 f"{exc}") from exc
+            if len(rows) >= chunk_size:
+                yield _projected(pandas.DataFrame(rows))
+                rows = []
+    if rows:
+        yield _projected(pandas.DataFrame(rows))
+
+
+def _require_pyarrow(input_path: pathlib.Path) -> None:
+    """Parquet/Arrow sources need the optional pyarrow package."""
+    if pyarrow is None:
+        raise ValueError(f"'{input_path.name}' needs pyarrow "
+                         f"(pip install pyarrow)")
+
+
+def _arrow_columns(schema) -> list:
+    """SOURCE_COLUMNS present in an Arrow schema."""
+    return [column for column in SOURCE_COLUMNS if column in schema.names]
+
+
+def read_parquet(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """Memory-mapped Parquet, one row group at a time, projected."""
+    _require_pyarrow(input_path)
+    parquet_file = pyarrow.parquet.ParquetFile(str(input_path),
+                                               memory_map=True)
+    columns = _arrow_columns(parquet_file.schema_arrow)
+    for group in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(group, columns=columns)
+        for batch in table.to_batches(max_chunksize=chunk_size):
+            yield _projected(batch.to_pandas())
+
+
+def read_arrow_ipc(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """Memory-mapped Arrow IPC file (or stream), batch by batch."""
+    _require_pyarrow(input_path)
+    with pyarrow.memory_map(str(input_path), 'r') as source:
+        try:
+            reader = pyarrow.ipc.open_file(source)
+            batches = (reader.get_batch(idx)
+                       for idx in range(reader.num_record_batches))
+        except pyarrow.ArrowInvalid:
+            source.seek(0)
+            reader = pyarrow.ipc.open_stream(source)
+            batches = iter(reader)
+        columns = _arrow_columns(reader.schema)
+        for batch in batches:
+            table = pyarrow.Table.from_batches([batch]).select(columns)
+            for chunk in table.to_batches(max_chunksize=chunk_size):
+                yield _projected(chunk.to_pandas())
+
+
+READERS = {'.json': read_split_json,
+           '.jsonl': read_json_lines,
+           '.ndjson': read_json_lines,
+           '.parquet': read_parquet,
+           '.arrow': read_arrow_ipc,
+           '.feather': read_arrow_ipc}
+EXTENSIONS = list(READERS)
+
+
+def is_source(input_path: pathlib.Path) -> bool:
+    """Files with a registered reader extension."""
+    return input_path.suffix.lower() in READERS
+
+
+def iter_chunks(input_path: pathlib.Path, chunk_size: int = CHUNK_SIZE):
+    """Yield DataFrame chunks using the reader for the file extension."""
+    reader = READERS.get(input_path.suffix.lower())
+    if reader is None:
+        raise ValueError(f"'{input_path.name}' unsupported extension, "
+                         f"expected one of {EXTENSIONS}")
+    return reader(input_path, chunk_size)
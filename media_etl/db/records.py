@@ -0,0 +1,202 @@
+# -*- coding: UTF-8 -*-
+"""Compact column batches of media rows shared by every table load."""
+import csv
+import io
+import itertools
+import sys
+from db import postgres_insert_queries as sql
+
+COPY_READ_SIZE = 65536
+CSV_ROWS = 500
+# values repeated across rows (low cardinality, or one per artist or
+# album): a single shared str per distinct value instead of one per row
+INTERNED_COLUMNS = ['genre', 'genre_in_dict', 'file_ext', 'encoding',
+                    'encoder', 'rating', 'track_length', 'album_art',
+                    'artist_id', 'artist_name', 'composer', 'conductor',
+                    'album_id', 'album_title', 'comment']
+
+__all__ = ['INTERNED_COLUMNS', 'ColumnBatch', 'CsvStream', 'TableRows',
+           'intern_values']
+
+
+def intern_values(values: list) -> list:
+    """Values with every string replaced by its interned copy."""
+    return [sys.intern(value) if isinstance(value, str) else value
+            for value in values]
+
+
+class TableRows:
+    """Row tuples of one table, projected lazily from a ColumnBatch.
+
+    Supports len(), iteration, indexing and slicing like the list of
+    tuples it replaces, but tuples only exist while they are consumed
+    (written to a COPY buffer or executed), never for the whole batch.
+    """
+
+    __slots__ = ('batch', 'headers')
+
+    def __init__(self, batch, headers: list):
+        self.batch = batch
+        self.headers = headers
+
+    def __len__(self) -> int:
+        return len(self.batch)
+
+    def __iter__(self):
+        return zip(*[self.batch.column(name) for name in self.headers])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("TableRows slices need step 1")
+            return TableRows(self.batch.slice(start, stop), self.headers)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TableRows index out of range")
+        position = self.batch.start + index
+        return tuple(self.batch.columns[name][position]
+                     for name in self.headers)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+
+class ColumnBatch:
+    """One list per source column, shared by the table projections.
+
+    batch[table] returns the TableRows of a table in headers_map column
+    order, batch.items() all of them, so a batch stands in for the
+    {table: [row tuples]} dict it replaces while holding each value
+    once. slice() returns views over the same lists.
+    """
+
+    __slots__ = ('columns', 'headers_map', 'start', 'stop')
+
+    def __init__(self, columns: dict, headers_map: dict = sql.HEADERS,
+                 start: int = 0, stop: int = None):
+        self.columns = columns
+        self.headers_map = headers_map
+        self.start = start
+        if stop is None:
+            stop = len(next(iter(columns.values()), []))
+        self.stop = stop
+
+    @classmethod
+    def empty(cls, headers_map: dict = sql.HEADERS):
+        """Batch without rows holding every headers_map column."""
+        return cls({name: [] for headers in headers_map.values()
+                    for name in headers}, headers_map)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, table: str) -> TableRows:
+        return TableRows(self, self.headers_map[table])
+
+    def keys(self):
+        """Tables of the batch."""
+        return self.headers_map.keys()
+
+    def items(self):
+        """(table, TableRows) pairs in headers_map order."""
+        return [(table, TableRows(self, headers))
+                for table, headers in self.headers_map.items()]
+
+    def column(self, name: str):
+        """Iterator over the values of one column in this view."""
+        values = self.columns[name]
+        if self.start:
+            # islice would step over every value before start
+            return iter(values[self.start:self.stop])
+        return itertools.islice(values, self.stop)
+
+    def slice(self, start: int, stop: int = None):
+        """View of rows start:stop sharing the column lists."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return ColumnBatch(self.columns, self.headers_map,
+                           self.start + start, self.start + stop)
+
+    def compact(self) -> None:
+        """Drop column values outside this view, e.g. flushed rows."""
+        if self.start or any(len(values) != self.stop
+                             for values in self.columns.values()):
+            self.columns = {name: values[self.start:self.stop]
+                            for name, values in self.columns.items()}
+            self.start, self.stop = 0, len(self)
+
+    def extend(self, other) -> None:
+        """Append the rows of another batch (compacts this one first)."""
+        self.compact()
+        for name, values in self.columns.items():
+            values.extend(other.column(name))
+        self.stop += len(other)
+
+    def with_column(self, name: str, values: list):
+        """Batch of these rows with one column replaced, others shared."""
+        batch = self.slice(0)
+        batch.compact()
+        columns = dict(batch.columns)
+        columns[name] = values
+        return ColumnBatch(columns, self.headers_map, 0, len(batch))
+
+    def select(self, keep: list):
+        """New batch of the rows where keep is true."""
+        return ColumnBatch({name: list(itertools.compress(self.column(name),
+                                                          keep))
+                            for name in self.columns}, self.headers_map)
+
+    def split(self, name: str, key) -> dict:
+        """{key(value): batch of its rows} over the values of one column.
+
+        Groups keep the row order and the order keys first appear in,
+        e.g. one batch per target partition.
+        """
+        groups = {}
+        for index, value in enumerate(self.column(name)):
+            groups.setdefault(key(value), []).append(self.start + index)
+        if len(groups) == 1:
+            return {group: self for group in groups}
+        return {group: ColumnBatch({column: [values[index]
+                                             for index in indexes]
+                                    for column, values
+                                    in self.columns.items()},
+                                   self.headers_map)
+                for group, indexes in groups.items()}
+
+
+class CsvStream:
+    """Readable text file of rows as CSV, written while COPY reads it.
+
+    Only CSV_ROWS rows are encoded at a time, so a COPY of any batch
+    size buffers kilobytes instead of the whole table as text. Quoting
+    matches csv.QUOTE_NONNUMERIC: quoted '' stays an empty string and
+    None loads as NULL.
+    """
+
+    __slots__ = ('rows', 'buffer', 'writer', 'pending', 'offset')
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, quoting=csv.QUOTE_NONNUMERIC)
+        self.pending = ''
+        self.offset = 0
+
+    def read(self, size: int = -1) -> str:
+        """Up to size characters of CSV ('' once every row was read)."""
+        while size < 0 or len(self.pending) - self.offset < size:
+            chunk = list(itertools.islice(self.rows, CSV_ROWS))
+            if not chunk:
+                break
+            self.writer.writerows(chunk)
+            self.pending = self.pending[self.offset:] + \
+                self.buffer.getvalue()
+            self.offset = 0
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        end = len(self.pending) if size < 0 else self.offset + size
+        data = self.pending[self.offset:end]
+        self.offset = min(end, len(self.pending))
+        return data
@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+"""In-process fuzzy name search without pg_trgm."""
+import bisect
+import numpy
+from rapidfuzz import fuzz, process
+from db.spotify_cache import normalize
+
+# name score (0-100) a fuzzy match needs, like pg_trgm's 0.6 threshold
+SCORE_CUTOFF = 60
+# per query word: similar (or longer, while typing) vocabulary words
+WORD_CUTOFF = 75
+WORD_MATCHES = 20
+# names sharing the most query words that get a full score
+CANDIDATES = 1000
+
+__all__ = ['NameIndex']
+
+
+class NameIndex:
+    """Sorted distinct names plus a word index over them.
+
+    Fuzzy lookups match each query word against the (small) word
+    vocabulary, count per name how many query words it contains, and
+    score only the CANDIDATES best names in full, so a query touches
+    thousands of names instead of all of them.
+    """
+
+    def __init__(self, names):
+        pairs = sorted({(normalize(name), name) for name in names if name})
+        self.keys = [key for key, _ in pairs]
+        self.names = [name for _, name in pairs]
+        postings = {}
+        for position, key in enumerate(self.keys):
+            for word in set(key.split()):
+                postings.setdefault(word, []).append(position)
+        self.lengths = numpy.array([len(key) for key in self.keys],
+                                   dtype=numpy.int32)
+        self.rank_step = int(self.lengths.max(initial=0)) + 1
+        self.words = sorted(postings)
+        self.postings = {word: numpy.array(positions, dtype=numpy.int32)
+                         for word, positions in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def __starting(keys: list, prefix: str, limit: int) -> list:
+        """Positions of up to limit sorted keys starting with prefix."""
+        start = bisect.bisect_left(keys, prefix)
+        stop = start
+        while (stop < len(keys) and stop - start < limit
+               and keys[stop].startswith(prefix)):
+            stop += 1
+        return list(range(start, stop))
+
+    def __similar_words(self, word: str) -> list:
+        """Vocabulary words close to word, or extending it."""
+        similar = {match for match, _, _ in process.extract(
+            word, self.words, scorer=fuzz.ratio, limit=WORD_MATCHES,
+            score_cutoff=WORD_CUTOFF)}
+        similar.update(self.words[position] for position in
+                       self.__starting(self.words, word, WORD_MATCHES))
+        return list(similar)
+
+    def __candidates(self, words: list):
+        """Positions of the names matching most of the query words."""
+        hits = []
+        for word in words:
+            postings = [self.postings[match]
+                        for match in self.__similar_words(word)]
+            if postings:
+                hits.append(numpy.unique(numpy.concatenate(postings)))
+        if not hits:
+            return numpy.array([], dtype=numpy.int32)
+        counts = numpy.bincount(numpy.concatenate(hits),
+                                minlength=len(self.keys))
+        positions = numpy.flatnonzero(counts)
+        if len(positions) > CANDIDATES:
+            # most query words first, then the shortest names
+            rank = (self.lengths[positions]
+                    - counts[positions] * self.rank_step)
+            best = numpy.argpartition(rank, CANDIDATES)[:CANDIDATES]
+            positions = positions[best]
+        return positions
+
+    @staticmethod
+    def score(text: str, key: str) -> float:
+        """Similarity 0-100 of a query to a normalized name.
+
+        Like pg_trgm's word_similarity a query found inside a longer
+        name scores high (partial_ratio), a longer query only as far as
+        the name covers it; word order does not matter.
+        """
+        scorer = fuzz.partial_ratio if len(text) < len(key) else fuzz.ratio
+        return max(scorer(text, key), fuzz.token_sort_ratio(text, key))
+
+    def fuzzy(self, text: str, limit: int,
+              score_cutoff: float = SCORE_CUTOFF) -> list:
+        """Up to limit (name, score 0-1) pairs most similar to text.
+
+        Equal scores go to the name closest as a whole.
+        """
+        key = normalize(text)
+        matches = []
+        for position in self.__candidates(key.split()):
+            score = self.score(key, self.keys[position])
+            if score >= score_cutoff:
+                matches.append((-score, -fuzz.ratio(key, self.keys[position]),
+                                int(position)))
+        matches.sort()
+        return [(self.names[position], round(-score / 100, 4))
+                for score, _, position in matches[:limit]]
@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+"""Load sinks taking the per-table batches of PostgresMedia.load_file()."""
+import abc
+import contextlib
+import sqlite3
+import threading
+import time
+from db import postgres_insert_queries as sql
+
+SINKS = ['postgres', 'memory', 'null', 'sqlite']
+SQLITE_PATH = ':memory:'
+SQLITE_TYPES = {**dict.fromkeys(sql.INTEGER_COLUMNS, 'INTEGER'),
+                **dict.fromkeys(sql.NUMERIC_COLUMNS, 'REAL'),
+                sql.SOURCE_COLUMN: 'INTEGER'}
+
+__all__ = ['SINKS', 'MemorySink', 'PostgresSink', 'Sink', 'SqliteSink',
+           'create_sink']
+
+
+class Sink(abc.ABC):
+    """Target of the records.ColumnBatch batches of a load.
+
+    Subclasses implement write(); load() times it, so each sink reports
+    its own rows/sec apart from the read, enrich and transform stages
+    feeding it: a slow load with a fast sink is slow upstream.
+    """
+
+    name = 'sink'
+
+    def __init__(self):
+        self.rows = 0
+        self.duplicates = 0
+        self.seconds = 0.0
+        self.__lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Context of one file load (nothing to set up by default)."""
+        yield self
+
+    def flush_size(self, batch_size: int, checkpoint: tuple = None) -> int:
+        """Rows per write() of a load with batch_size (0: whole file)."""
+        return batch_size
+
+    @abc.abstractmethod
+    def write(self, batch, checkpoint: list = None) -> int:
+        """Store one batch, return its rows written (others: duplicates)."""
+
+    def load(self, batch, checkpoint: list = None) -> int:
+        """write() a batch, adding its rows and seconds to the sink."""
+        start = time.perf_counter()
+        rows = self.write(batch, checkpoint)
+        seconds = time.perf_counter() - start
+        with self.__lock:
+            self.rows += rows
+            self.duplicates += len(batch) - rows
+            self.seconds += seconds
+        return rows
+
+    @property
+    def rate(self) -> float:
+        """Rows per second spent inside the sink."""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def report(self) -> dict:
+        """Rows, seconds and rows/sec of the sink so far."""
+        return {'sink': self.name, 'rows': self.rows,
+                'duplicates': self.duplicates,
+                'seconds': round(self.seconds, 4),
+                'rows_per_sec': round(self.rate, 1)}
+
+    def close(self) -> None:
+        """Release the sink's resources."""
+
+
+class MemorySink(Sink):
+    """Row tuples kept per table in lists, or only counted (keep=False).
+
+    Without a database in the way, load rows/sec measure the read,
+    enrich and transform stages; the 'null' sink does not even build
+    the row tuples.
+    """
+
+    def __init__(self, keep: bool = True):
+        super().__init__()
+        self.name = 'memory' if keep else 'null'
+        self.keep = keep
+        self.tables = {}
+        self.__lock = threading.Lock()
+
+    def write(self, batch, checkpoint: list = None) -> int:
+        """Append the row tuples of every table (keep) or count them."""
+        if self.keep:
+            tables = [(table, list(rows)) for table, rows in batch.items()]
+            with self.__lock:
+                for table, rows in tables:
+                    self.tables.setdefault(table, []).extend(rows)
+        return len(batch)
+
+
+class SqliteSink(Sink):
+    """Tables of sql.HEADERS in a SQLite file (default: in memory).
+
+    One transaction per batch; rows are appended like the 'insert'
+    engine (no dedup, checkpoints or upserts), timestamps stored as
+    ISO text. For local runs and tests without a Postgres server.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str = SQLITE_PATH):
+        super().__init__()
+        self.db_path = str(db_path)
+        self.__lock = threading.Lock()
+        self.__inserts = {}
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self.conn:
+            for table, headers in sql.UPSERT_HEADERS.items():
+                columns = ', '.join(f"{name} {SQLITE_TYPES.get(name, 'TEXT')}"
+                                    for name in headers)
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                                  f"(id INTEGER PRIMARY KEY, {columns});")
+
+    def __insert(self, table: str, headers: list) -> str:
+        """INSERT statement of table for the batch's headers."""
+        key = (table, tuple(headers))
+        if key not in self.__inserts:
+            self.__inserts[key] = (f"INSERT INTO {table} "
+                                   f"({', '.join(headers)}) VALUES "
+                                   f"({', '.join('?' * len(headers))});")
+        return self.__inserts[key]
+
+    @staticmethod
+    def __values(batch, name: str):
+        """Column values SQLite can bind."""
+        values = batch.column(name)
+        if name in sql.TIMESTAMP_COLUMNS:
+            return (value if value is None else value.isoformat(' ')
+                    for value in values)
+        return values
+
+    def write(self, batch, checkpoint: list = None) -> int:
+        """Insert the rows of every table in one transaction."""
+        with self.__lock, self.conn:
+            for table, rows in batch.items():
+                self.conn.executemany(
+                    self.__insert(table, rows.headers),
+                    zip(*[self.__values(batch, name)
+                          for name in rows.headers]))
+        return len(batch)
+
+    def count(self, table: str) -> int:
+        """Rows in table."""
+        with self.__lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        self.conn.close()
+
+
+class PostgresSink(Sink):
+    """PostgresMedia tables, loaded with the 'insert' or 'copy' engine.
+
+    A session borrows one pooled connection for the file, preloads the
+    hash filter and counts the change against the summary views; each
+    batch skips known hashes, creates missing partitions and commits
+    with its checkpoint row (see PostgresMedia.load_batch()).
+    """
+
+    name = 'postgres'
+
+    def __init__(self, pg_api, engine: str = 'copy', upsert: bool = False):
+        super().__init__()
+        self.pg_api = pg_api
+        self.engine = engine
+        self.upsert = upsert
+        # upserts already replace rows by hash through ON CONFLICT
+        self.dedup_rows = not upsert
+        self.__local = threading.local()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Borrow a connection for the file and prepare the load."""
+        with self.pg_api.connection() as db_conn:
+            self.pg_api.prepare_load(db_conn, self.dedup_rows)
+            self.__local.db_conn = db_conn
+            try:
+                yield self
+            finally:
+                self.__local.db_conn = None
+
+    def flush_size(self, batch_size: int, checkpoint: tuple = None) -> int:
+        """Row by row for autocommit inserts, else batch_size."""
+        if self.engine == 'insert' and checkpoint is None:
+            return 1
+        return batch_size
+
+    def write(self, batch, checkpoint: list = None) -> int:
+        """Load a batch on the session connection."""
+        return self.pg_api.load_batch(self.__local.db_conn, batch,
+                                      self.engine, self.upsert, checkpoint,
+                                      self.dedup_rows)
+
+
+def create_sink(name: str, pg_api=None, engine: str = 'copy',
+                db_path: str = SQLITE_PATH) -> Sink:
+    """Sink of a SINKS name; 'postgres' loads through pg_api."""
+    if name == 'postgres':
+        return PostgresSink(pg_api, engine)
+    if name == 'sqlite':
+        return SqliteSink(db_path)
+    if name in SINKS:
+        return MemorySink(keep=name == 'memory')
+    raise ValueError(f"invalid sink: '{name}' {SINKS}")
@@ -6,12 +6,17 @@ import sys
 import configparser
 import traceback
 import spotipy
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 from spotipy.oauth2 import SpotifyClientCredentials
+from db.spotify_cache import LookupCache, CACHE_PATH, normalize
 
 BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
 TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
 DEGUB = False
+# album title matches below SCORE_CUTOFF are rejected, matches below
+# LOW_CONFIDENCE are accepted but flagged for review
+SCORE_CUTOFF = 80.0
+LOW_CONFIDENCE = 90.0
 
 OFFLINE_ARTIST_IDS = {'Arcade Fire': '3kjuyTCjPG1WMFCiyc5IuB',
                       'Frank Sinatra': '1Mxqyy3pSjf8kZZL4QVxS0',
@@ -39,6 +44,52 @@ OFFLINE_ALBUM_IDS = {'The Suburbs': '3DrgM5X3yX1JP1liNLAOHI',
                      'Definitive Collection': '3g5uyAp8sS8LnnCxh9y2em',
                      'Dirty Radio': '7I9KroNPmpw9qFYZ8Vp7pN'}
 
+OFFLINE_ALBUM_ARTISTS = {'The Suburbs': 'Arcade Fire',
+                         'Sinatra Reprise': 'Frank Sinatra',
+                         'Turn On The Bright Lights': 'Interpol',
+                         'Capriccio Espagnol': 'Rimsky-Korsakov',
+                         'Hold Time': 'M. Ward',
+                         '100th Window': 'Massive Attack',
+                         'So Tonight That I Might See': 'Mazzy Star',
+                         'Rapsodie Espagnol': 'Ravel',
+                         'Symphony No.8 in F-major, Op.93': 'Beethoven',
+                         'Debut': 'Björk',
+                         'Definitive Collection': 'Patsy Cline',
+                         'Dirty Radio': 'Sallie Ford & The Sound Outside'}
+
+
+def match_albums(target_albums: list, albums: list,
+                 score_cutoff: float = SCORE_CUTOFF) -> dict:
+    """Map each target title to (album ID, ratio) of its closest album.
+
+    Titles are normalized once and every target is scored against the
+    whole discography in one rapidfuzz cdist() call. Targets without an
+    album scoring at least score_cutoff map to ('', 0.0).
+    """
+    targets = list(dict.fromkeys(target_albums))
+    if not targets or not albums:
+        return {target: ('', 0.0) for target in targets}
+    scores = process.cdist([normalize(target) for target in targets],
+                           [normalize(album['name']) for album in albums],
+                           scorer=fuzz.ratio, score_cutoff=score_cutoff)
+    matches = {}
+    for row, max_idx in enumerate(scores.argmax(axis=1)):
+        ratio = round(float(scores[row, max_idx]), 4)
+        if DEGUB:
+            print(f"idx: {max_idx} max:{ratio}\n"
+                  f"input_album:   {targets[row]}\n"
+                  f"closest_album: {albums[max_idx]['name']}\n"
+                  f"album_id:   {albums[max_idx]['id']}\n")
+        matches[targets[row]] = ((albums[max_idx]['id'], ratio) if ratio
+                                 else ('', 0.0))
+    return matches
+
+
+def closest_album(target_album: str, albums: list,
+                  score_cutoff: float = 0.0) -> tuple:
+    """Return (album ID, ratio) of the album name closest to target."""
+    return match_albums([target_album], albums, score_cutoff)[target_album]
+
 
 class ConfigClient:
     """ConfigParser Class to parse Spotify config file."""
@@ -84,10 +135,12 @@ class SpotifyClient:
     """Class to lookup/add Spotify media tags to Postgres backend."""
 
     @classmethod
-    def __init__(cls, config_path: pathlib.Path):
+    def __init__(cls, config_path: pathlib.Path,
+                 cache_path: pathlib.Path = CACHE_PATH):
         """Start Spotify API client to lookup tag data."""
         cls.__is_connected = False
         cls.__is_config_valid = False
+        cls.cache = LookupCache(cache_path)
         try:
             cls.__cc = ConfigClient(config_path)
             cls.__is_config_valid = cls.__cc.is_config_valid()
@@ -131,53 +184,67 @@ class SpotifyClient:
         """If both client is connected adn spotify.cfg is valid."""
         return cls.is_config_valid() and cls.is_connected()
 
+    @classmethod
+    def warm_cache(cls) -> int:
+        """Pre-warm lookup cache from the offline artist/album IDs.
+
+        Opt-in only: the cache is shared with online runs, which would
+        take these IDs as hits instead of asking the API.
+        """
+        return cls.cache.warm(OFFLINE_ARTIST_IDS, OFFLINE_ALBUM_IDS,
+                              OFFLINE_ALBUM_ARTISTS)
+
     @classmethod
     def get_artist_id(cls, artist_name: str) -> str:
-        """Spotify API to lookup artist ID."""
-        artist_id = ''
-        if cls.run_spotify():
+        """Spotify API to lookup artist ID (lookup cache first)."""
+        artist_id = cls.cache.get_artist_id(artist_name)
+        if artist_id is None and cls.run_spotify():
             try:
                 results = cls.__sp.search(q=f"artist:{artist_name}",
                                           type='artist')
                 items = results['artists']['items']
-                if len(items) > 0:
-                    artist_id = items[0]['id']
+                artist_id = items[0]['id'] if len(items) > 0 else ''
+                cls.cache.put_artist_id(artist_name, artist_id)
             except (spotipy.oauth2.SpotifyOauthError,
                     spotipy.exceptions.SpotifyException):
+                artist_id = ''
                 cls.__show_exception()
-        else:
+        elif artist_id is None:
+            # offline IDs are not cached, only API answers are
             artist_id = OFFLINE_ARTIST_IDS[artist_name]
         print(f"   get_artist_id: {artist_name:32}\t{artist_id}")
         return artist_id
 
+    @classmethod
+    def get_artist_albums(cls, artist_id: str) -> list:
+        """Full (paginated) discography of artist, cached once."""
+        albums = cls.cache.get_albums(artist_id)
+        if albums is None:
+            results = cls.__sp.artist_albums(artist_id=artist_id, limit=50)
+            albums = results['items']
+            while results['next']:
+                results = cls.__sp.next(results)
+                albums.extend(results['items'])
+            cls.cache.put_albums(artist_id, albums)
+        return albums
+
     @classmethod
     def get_album_id(cls, artist_id: str, target_album: str) -> str:
         """Spotify API to lookup album ID using rapidfuzz for closest match."""
-        album_id = ''
-        if cls.run_spotify():
+        album_id = cls.cache.get_album_id(artist_id, target_album)
+        if album_id is None and cls.run_spotify():
             try:
-                results = cls.__sp.artist_albums(artist_id=artist_id,
-                                                 limit=50)
-                albums = results['items']
-                ratios = []
-                for album in albums:
-                    fuzz_ratio = round(fuzz.ratio(target_album.lower(),
-                                                  album['name'].lower()), 4)
-                    ratios.append(fuzz_ratio)
-                # check album title by string similarity matching (rapidfuzz)
-                max_idx = ratios.index(max(ratios))
-                album_id = albums[max_idx]['id']
-                if DEGUB:
-                    print(f"album: {album['name']}\t"
-                          f"id: {album['id']}\t ratio: {fuzz_ratio}")
-                    print(f"idx: {max_idx} max:{max(ratios)}\n"
-                          f"input_album:   {target_album}\n"
-                          f"closest_album: {albums[max_idx]['name']}\n"
-                          f"album_id:   {album_id}\n")
+                album_id, ratio = closest_album(
+                    target_album, cls.get_artist_albums(artist_id),
+                    SCORE_CUTOFF)
+                if 0 < ratio < LOW_CONFIDENCE:
+                    print(f"   low confidence: {target_album} ({ratio})")
+                cls.cache.put_album_id(artist_id, target_album, album_id)
             except (spotipy.oauth2.SpotifyOauthError,
                     spotipy.exceptions.SpotifyException):
+                album_id = ''
                 cls.__show_exception()
-        else:
+        elif album_id is None:
             album_id = OFFLINE_ALBUM_IDS[target_album]
         print(f"    get_album_id: {target_album:32}\t{album_id}")
         return album_id
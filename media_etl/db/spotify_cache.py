@@ -0,0 +1,208 @@
+# -*- coding: UTF-8 -*-
+"""Persistent SQLite cache for Spotify artist/album ID lookups."""
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+CACHE_PATH = pathlib.Path(TWO_PARENT_PATH, 'data', 'cache',
+                          'spotify_cache.sqlite')
+TTL_SECONDS = 30 * 24 * 60 * 60
+MAX_ENTRIES = 250000
+# hits whose access times are written together in one commit
+FLUSH_HITS = 1000
+
+CREATE_LOOKUP_QUERY = ("CREATE TABLE IF NOT EXISTS lookup "
+                       "(key TEXT PRIMARY KEY, "
+                       "value TEXT NOT NULL, "
+                       "created REAL NOT NULL, "
+                       "accessed REAL NOT NULL);")
+CREATE_ACCESSED_INDEX = ("CREATE INDEX IF NOT EXISTS lookup_accessed_idx "
+                         "ON lookup (accessed);")
+
+__all__ = ['LookupCache', 'normalize']
+
+
+def normalize(text: str) -> str:
+    """Case/whitespace/unicode-insensitive form of an artist/album name."""
+    text = unicodedata.normalize('NFKC', str(text))
+    return ' '.join(text.casefold().split())
+
+
+class LookupCache:
+    """Key/value file of resolved IDs with TTL and LRU size bound.
+
+    Keys are the normalized artist name, or artist ID plus normalized
+    album title. Reads refresh the access time so eviction drops the
+    least recently used entries once max_entries is exceeded; hits are
+    written in batches (next put, every FLUSH_HITS hits, close), not
+    one commit per lookup. Eviction counts the rows in the file, so
+    several processes can share it.
+    """
+
+    def __init__(self, cache_path: pathlib.Path = CACHE_PATH,
+                 ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.cache_path = pathlib.Path(cache_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__accessed = {}
+        self.__lock = threading.Lock()
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.__conn = sqlite3.connect(str(self.cache_path), timeout=30,
+                                      check_same_thread=False)
+        # WAL: parallel loader processes read while one of them writes
+        self.__conn.execute("PRAGMA journal_mode=WAL;")
+        self.__conn.execute(CREATE_LOOKUP_QUERY)
+        self.__conn.execute(CREATE_ACCESSED_INDEX)
+        self.__conn.commit()
+
+    @staticmethod
+    def artist_key(artist_name: str) -> str:
+        """Cache key for an artist name lookup."""
+        return f"artist:{normalize(artist_name)}"
+
+    @staticmethod
+    def album_key(artist_id: str, album_title: str) -> str:
+        """Cache key for an (artist ID, album title) lookup."""
+        return f"album:{artist_id}:{normalize(album_title)}"
+
+    @staticmethod
+    def albums_key(artist_id: str) -> str:
+        """Cache key for the full discography of an artist."""
+        return f"albums:{artist_id}"
+
+    def get(self, key: str):
+        """Return cached value, or None if missing or expired."""
+        now = time.time()
+        with self.__lock:
+            row = self.__conn.execute("SELECT value, created FROM lookup "
+                                      "WHERE key = ?;", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self.__conn.execute("DELETE FROM lookup WHERE key = ?;",
+                                    (key,))
+                self.__conn.commit()
+                self.__accessed.pop(key, None)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__accessed[key] = now
+            if len(self.__accessed) >= FLUSH_HITS:
+                self.__flush()
+            return row[0]
+
+    def __flush(self) -> None:
+        """Write access times of pending hits and commit (lock held)."""
+        if self.__accessed:
+            self.__conn.executemany("UPDATE lookup SET accessed = ? "
+                                    "WHERE key = ?;",
+                                    [(accessed, key) for key, accessed
+                                     in self.__accessed.items()])
+            self.__accessed = {}
+        self.__conn.commit()
+
+    def flush(self) -> None:
+        """Write the access times of hits since the last commit."""
+        with self.__lock:
+            self.__flush()
+
+    def put(self, key: str, value: str) -> None:
+        """Store value under key, evicting least recently used entries."""
+        self.put_many({key: value})
+
+    def put_many(self, items: dict) -> None:
+        """Store several key/value pairs in one transaction."""
+        if not items:
+            return
+        now = time.time()
+        with self.__lock:
+            # pending hits first, so eviction sees their access times
+            self.__flush()
+            self.__conn.executemany("INSERT OR REPLACE INTO lookup "
+                                    "(key, value, created, accessed) "
+                                    "VALUES (?, ?, ?, ?);",
+                                    [(key, value, now, now)
+                                     for key, value in items.items()])
+            overflow = self.__count() - self.max_entries
+            if self.max_entries and overflow > 0:
+                self.__conn.execute("DELETE FROM lookup WHERE key IN "
+                                    "(SELECT key FROM lookup "
+                                    "ORDER BY accessed LIMIT ?);",
+                                    (overflow,))
+                self.evictions += overflow
+            self.__conn.commit()
+
+    def __count(self) -> int:
+        """Entries in the file, whichever process wrote them."""
+        return self.__conn.execute(
+            "SELECT COUNT(*) FROM lookup;").fetchone()[0]
+
+    def get_artist_id(self, artist_name: str):
+        """Cached Spotify artist ID for artist name, or None."""
+        return self.get(self.artist_key(artist_name))
+
+    def put_artist_id(self, artist_name: str, artist_id: str) -> None:
+        """Cache Spotify artist ID for artist name."""
+        self.put(self.artist_key(artist_name), artist_id)
+
+    def get_album_id(self, artist_id: str, album_title: str):
+        """Cached Spotify album ID for (artist ID, album title), or None."""
+        return self.get(self.album_key(artist_id, album_title))
+
+    def put_album_id(self, artist_id: str, album_title: str,
+                     album_id: str) -> None:
+        """Cache Spotify album ID for (artist ID, album title)."""
+        self.put(self.album_key(artist_id, album_title), album_id)
+
+    def get_albums(self, artist_id: str):
+        """Cached discography ([{'id', 'name'}]) of artist, or None."""
+        value = self.get(self.albums_key(artist_id))
+        return None if value is None else json.loads(value)
+
+    def put_albums(self, artist_id: str, albums: list) -> None:
+        """Cache the discography (album IDs and names) of artist."""
+        self.put(self.albums_key(artist_id), json.dumps(
+            [{'id': album['id'], 'name': album['name']}
+             for album in albums]))
+
+    def warm(self, artist_ids: dict, album_ids: dict,
+             album_artists: dict) -> int:
+        """Pre-load artist/album IDs; album_artists maps title to artist."""
+        items = {self.artist_key(name): artist_id
+                 for name, artist_id in artist_ids.items()}
+        for title, album_id in album_ids.items():
+            artist_id = artist_ids.get(album_artists.get(title, ''), '')
+            items[self.album_key(artist_id, title)] = album_id
+        self.put_many(items)
+        return len(items)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current entry count."""
+        lookups = self.hits + self.misses
+        with self.__lock:
+            size = self.__count()
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': size,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self.__lock:
+            self.__conn.execute("DELETE FROM lookup;")
+            self.__conn.commit()
+            self.__accessed = {}
+
+    def close(self) -> None:
+        """Write pending access times and close the cache file."""
+        with self.__lock:
+            self.__flush()
+            self.__conn.close()
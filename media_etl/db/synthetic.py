@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+"""Synthetic orient='split' media library generator for benchmarks."""
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import random
+import string
+
+BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
+TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
+OUTPUT_PATH = pathlib.Path(TWO_PARENT_PATH, 'data', 'synthetic')
+OFFLINE_IDS_FILE = 'library.ids'
+
+COLUMNS = ['index', 'file_size', 'readable_size', 'file_ext', 'artist_name',
+           'album_title', 'track_title', 'track_number', 'track_length',
+           'genre', 'genre_in_dict', 'album_art', 'year', 'rating',
+           'encoder', 'composer', 'conductor', 'comment', 'track_gain',
+           'album_gain', 'file_name', 'path_len', 'last_modified',
+           'encoding', 'hash', 'artist_id', 'album_id', 'track_id']
+
+FILE_EXTS = ['.mp3', '.flac', '.mp4', '.wma']
+FILE_EXT_WEIGHTS = [70, 20, 7, 3]
+GENRES = ['Alternative', 'Classical', 'Electronic', 'Jazz', 'Pop',
+          'Post-Punk-Revival', 'Rock', 'Rockabilly', 'Traditional-Pop',
+          'Trip-Hop', 'Folk', 'Country']
+GENRE_IN_DICT = ['GENRE_OK', 'INCONSISTENT']
+RATINGS = ['1-star', '2-star', '2-1/2-star', '3-star', '4-star', '5-star']
+ENCODERS = ['iTunes v7.5.0.20', 'iTunes v7.6.2.9', 'MediaMonkey 4.1.25',
+            'LAME 3.99', 'Exact Audio Copy']
+ENCODINGS = ['ascii', 'utf-8']
+ID_CHARS = string.ascii_letters + string.digits
+
+__all__ = ['generate_library', 'load_offline_ids']
+
+
+class _Library:
+    """Artist and album names with fake Spotify IDs for one seed."""
+
+    def __init__(self, rand: random.Random, artists: int,
+                 albums_per_artist: int, name_length: int):
+        self.rand = rand
+        self.name_length = name_length
+        self.artists = [self.name(f"A{idx}") for idx in range(artists)]
+        self.albums = [[self.name(f"L{idx}.{num}")
+                        for num in range(albums_per_artist)]
+                       for idx in range(artists)]
+        self.artist_ids = {name: self.spotify_id() for name in self.artists}
+        self.album_ids, self.album_artists = {}, {}
+        for artist, titles in zip(self.artists, self.albums):
+            for title in titles:
+                self.album_ids[title] = self.spotify_id()
+                self.album_artists[title] = artist
+
+    def name(self, suffix: str) -> str:
+        """Random capitalized words about name_length chars, unique."""
+        words, length = [], 0
+        while length < self.name_length:
+            word = ''.join(self.rand.choices(string.ascii_lowercase,
+                                             k=self.rand.randint(3, 9)))
+            words.append(word.capitalize())
+            length += len(word) + 1
+        return f"{' '.join(words)} {suffix}"
+
+    def spotify_id(self) -> str:
+        """22 character base62 ID like the Spotify ones."""
+        return ''.join(self.rand.choices(ID_CHARS, k=22))
+
+
+def _track_row(lib: _Library, idx: int) -> list:
+    """One media_lib row of strings for track number idx."""
+    rand = lib.rand
+    artist_idx = rand.randrange(len(lib.artists))
+    artist = lib.artists[artist_idx]
+    album = rand.choice(lib.albums[artist_idx])
+    title = lib.name(f"T{idx}")
+    track_number = rand.randint(1, 20)
+    year = rand.randint(1950, 2020)
+    file_ext = rand.choices(FILE_EXTS, FILE_EXT_WEIGHTS)[0]
+    file_size = rand.randint(2000000, 60000000)
+    seconds = rand.randint(60, 900)
+    modified = datetime.datetime(2020, 1, 1) + datetime.timedelta(
+        seconds=rand.randint(0, 365 * 24 * 60 * 60))
+    file_name = (f"{track_number:02d}~{title}~{artist}~{album}~"
+                 f"{year}{file_ext}")
+    return [f"{idx:06d}", str(file_size),
+            f"{file_size / 1048576:05.2f} MiB", file_ext, artist, album,
+            title, str(track_number),
+            f"0:{seconds // 60:02d}:{seconds % 60:02d}",
+            rand.choice(GENRES), rand.choice(GENRE_IN_DICT), 'ALBUM_ART',
+            str(year), rand.choice(RATINGS), rand.choice(ENCODERS),
+            artist if rand.random() < 0.5 else '', '', '',
+            f"{rand.uniform(-12, 0):0.2f}", f"{rand.uniform(-12, 0):0.2f}",
+            file_name, str(len(file_name) + 60),
+            modified.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            rand.choice(ENCODINGS),
+            hashlib.sha256(f"{idx}~{file_name}".encode()).hexdigest()
+            .upper(), '', '', '']
+
+
+def generate_library(output_path: pathlib.Path = OUTPUT_PATH,
+                     tracks: int = 10000, artists: int = 500,
+                     albums_per_artist: int = 4, name_length: int = 16,
+                     tracks_per_file: int = 0, seed: int = 1) -> list:
+    """Write orient='split' JSON files and the offline IDs of a library.
+
+    Rows are written as they are generated so memory does not grow with
+    tracks. tracks_per_file splits the library into several files (0:
+    one file). Returns the JSON paths written.
+    """
+    output_path = pathlib.Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    lib = _Library(random.Random(seed), artists, albums_per_artist,
+                   name_length)
+    per_file = tracks_per_file or tracks
+    json_paths = []
+    for start in range(0, tracks, per_file):
+        count = min(per_file, tracks - start)
+        json_path = pathlib.Path(output_path,
+                                 f"media_lib_{len(json_paths):04d}.json")
+        with open(json_path, mode='w', encoding='utf-8') as json_file:
+            json_file.write(f'{{"columns":{json.dumps(COLUMNS)},"index":[')
+            for block in range(0, count, 100000):
+                json_file.write(('' if block == 0 else ',') + ','.join(
+                    map(str, range(block, min(block + 100000, count)))))
+            json_file.write('],"data":[')
+            for idx in range(start, start + count):
+                if idx > start:
+                    json_file.write(',')
+                json_file.write(json.dumps(_track_row(lib, idx)))
+            json_file.write(']}')
+        json_paths.append(json_path)
+    with open(pathlib.Path(output_path, OFFLINE_IDS_FILE), mode='w',
+              encoding='utf-8') as ids_file:
+        json.dump({'artist_ids': lib.artist_ids,
+                   'album_ids': lib.album_ids,
+                   'album_artists': lib.album_artists}, ids_file)
+    return json_paths
+
+
+def load_offline_ids(output_path: pathlib.Path = OUTPUT_PATH) -> dict:
+    """Artist/album IDs written next to a generated library."""
+    with open(pathlib.Path(output_path, OFFLINE_IDS_FILE),
+              encoding='utf-8') as ids_file:
+        return json.load(ids_file)
@@ -0,0 +1,58 @@
+# -*- coding: UTF-8 -*-
+"""Column-wise transform of media DataFrame chunks into table rows."""
+import pandas
+from db import records
+from db import postgres_insert_queries as sql
+
+__all__ = ['cast_columns', 'column_batch', 'column_values', 'table_rows']
+
+
+def cast_columns(df):
+    """Cast integer, numeric and timestamp columns once for the chunk.
+
+    Values that do not parse become NULL instead of failing the load.
+    """
+    for column in sql.INTEGER_COLUMNS:
+        df[column] = pandas.to_numeric(df[column], errors='coerce') \
+            .round().astype('Int64')
+    for column in sql.NUMERIC_COLUMNS:
+        df[column] = pandas.to_numeric(df[column], errors='coerce') \
+            .round(2)
+    for column in sql.TIMESTAMP_COLUMNS:
+        df[column] = pandas.to_datetime(df[column], errors='coerce')
+    return df
+
+
+def column_values(series) -> list:
+    """Python values of a column, missing values as None.
+
+    Timestamps become datetime objects, a third the size of pandas
+    Timestamps (numpy converts NaT to None).
+    """
+    if pandas.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy('datetime64[us]').tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def column_batch(df, headers_map: dict = sql.HEADERS):
+    """ColumnBatch of the headers_map columns of a chunk.
+
+    Every column is converted to Python values once, low-cardinality
+    columns are interned and the tables read projections of the same
+    column lists, so no per-row Series or per-table tuple is created.
+    """
+    df = cast_columns(df)
+    columns = {}
+    for column in dict.fromkeys(column for headers in headers_map.values()
+                                for column in headers):
+        values = column_values(df[column])
+        if column in records.INTERNED_COLUMNS:
+            values = records.intern_values(values)
+        columns[column] = values
+    return records.ColumnBatch(columns, headers_map, stop=len(df))
+
+
+def table_rows(df, headers_map: dict = sql.HEADERS) -> dict:
+    """Per-table lists of row tuples in headers_map column order."""
+    return {table: list(rows)
+            for table, rows in column_batch(df, headers_map).items()}
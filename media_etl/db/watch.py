@@ -0,0 +1,307 @@
+# -*- coding: UTF-8 -*-
+"""Watch mode: detect new source files and load them as they land."""
+import os
+import pathlib
+import queue
+import threading
+import time
+from db import readers
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# a file is loaded once its size/mtime stayed unchanged this long
+DEBOUNCE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+QUEUE_SIZE = 64
+WORKERS = 2
+
+__all__ = ['Debouncer', 'InotifySource', 'PollingSource', 'Watcher',
+           'change_source']
+
+
+def _signature(input_path: pathlib.Path) -> tuple:
+    """(mtime_ns, size) of a file, None once it is gone."""
+    try:
+        file_stat = input_path.stat()
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+class PollingSource:
+    """Change detection by rescanning mtime and size every interval.
+
+    Files present when the source starts are the baseline and are not
+    reported unless they change afterwards.
+    """
+
+    def __init__(self, input_path: pathlib.Path,
+                 interval: float = POLL_SECONDS):
+        self.input_path = pathlib.Path(input_path)
+        self.interval = interval
+        self.__known = self.__scan()
+        self.__next_scan = time.monotonic() + interval
+
+    def __scan(self) -> dict:
+        """{path: signature} of the source files under input path."""
+        return {path: _signature(path)
+                for path in self.input_path.rglob("*")
+                if readers.is_source(path) and path.is_file()}
+
+    def changes(self, timeout: float) -> set:
+        """Files created or modified since the last scan."""
+        time.sleep(max(0.0, min(timeout,
+                                self.__next_scan - time.monotonic())))
+        if time.monotonic() < self.__next_scan:
+            return set()
+        self.__next_scan = time.monotonic() + self.interval
+        known, self.__known = self.__known, self.__scan()
+        return {path for path, signature in self.__known.items()
+                if known.get(path) != signature}
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+class InotifySource:
+    """Change detection with Linux inotify, subdirectories included."""
+
+    def __init__(self, input_path: pathlib.Path):
+        self.input_path = pathlib.Path(input_path)
+        self.__inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        self.__mask = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE |
+                       flags.MODIFY)
+        self.__dirs = {}
+        self.__watch_tree(self.input_path)
+
+    def __watch_tree(self, dir_path: pathlib.Path) -> set:
+        """Watch dir_path and its subdirectories, return files in them."""
+        found = set()
+        for root, _, file_names in os.walk(dir_path):
+            self.__dirs[self.__inotify.add_watch(root, self.__mask)] = \
+                pathlib.Path(root)
+            found.update(pathlib.Path(root, name) for name in file_names)
+        return found
+
+    def changes(self, timeout: float) -> set:
+        """Files written, created or moved in within timeout seconds."""
+        changed = set()
+        for event in self.__inotify.read(timeout=int(timeout * 1000)):
+            if event.wd not in self.__dirs or not event.name:
+                continue
+            path = pathlib.Path(self.__dirs[event.wd], event.name)
+            if event.mask & inotify_simple.flags.ISDIR:
+                # files may land before the new directory is watched
+                changed.update(self.__watch_tree(path))
+            else:
+                changed.add(path)
+        return {path for path in changed if readers.is_source(path)}
+
+    def close(self) -> None:
+        """Release the inotify descriptor."""
+        self.__inotify.close()
+
+
+def change_source(input_path: pathlib.Path,
+                  poll_interval: float = POLL_SECONDS,
+                  use_inotify: bool = None):
+    """InotifySource where available (or use_inotify), else polling."""
+    if use_inotify is None:
+        use_inotify = inotify_simple is not None
+    if use_inotify:
+        try:
+            return InotifySource(input_path)
+        except (OSError, AttributeError):
+            print("inotify unavailable, polling for changes")
+    return PollingSource(input_path, poll_interval)
+
+
+class Debouncer:
+    """Hold changed files until writes have settled.
+
+    A file is ready once debounce seconds passed since its last change
+    event and its (mtime, size) did not move in that time, so partially
+    written drops are not loaded.
+    """
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self.__pending = {}
+
+    def __len__(self) -> int:
+        return len(self.__pending)
+
+    def touch(self, paths, now: float = None) -> None:
+        """Record change events of paths."""
+        now = time.monotonic() if now is None else now
+        for path in paths:
+            detected = self.__pending.get(path, (now,))[0]
+            self.__pending[path] = (detected, now, _signature(path))
+
+    def ready(self, now: float = None) -> list:
+        """[(path, first detected)] of files that settled."""
+        now = time.monotonic() if now is None else now
+        settled = []
+        for path, (detected, changed, signature) in list(
+                self.__pending.items()):
+            if now - changed < self.debounce:
+                continue
+            current = _signature(path)
+            if current is None:
+                del self.__pending[path]
+            elif current != signature:
+                self.__pending[path] = (detected, now, current)
+            else:
+                del self.__pending[path]
+                settled.append((path, detected))
+        return settled
+
+
+class Watcher:
+    """Continuous ingestion: scan, debounce and load concurrently.
+
+    The calling thread reads change events and feeds settled files into
+    a bounded queue; worker threads load them through the manifest with
+    pg_api.sync_file(), so a slow load only blocks scanning once the
+    queue is full. Summary views are refreshed when the queue drains.
+    """
+
+    def __init__(self, pg_api, input_path: pathlib.Path,
+                 engine: str = 'copy', batch_size: int = 0,
+                 workers: int = WORKERS, debounce: float = DEBOUNCE_SECONDS,
+                 poll_interval: float = POLL_SECONDS,
+                 queue_size: int = QUEUE_SIZE, use_inotify: bool = None):
+        self.pg_api = pg_api
+        self.input_path = pathlib.Path(input_path)
+        self.engine = engine
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.debouncer = Debouncer(debounce)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.results = []
+        self.__active = set()
+        self.__lock = threading.Lock()
+        self.__dirty = False
+
+    def __load(self) -> None:
+        """Worker thread: load queued files until the None sentinel."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path, detected = item
+            stats = {'file': str(path), 'engine': self.engine,
+                     'status': False, 'rows': 0, 'duplicates': 0,
+                     'seconds': 0.0}
+            try:
+                stats = self.pg_api.sync_file(path, self.engine,
+                                              self.batch_size)
+            except Exception as exc:
+                # a failed file must not take its worker down with it
+                print(f"~!ERROR!~ watch: {path.name} {exc!r}")
+            finally:
+                stats['latency'] = time.monotonic() - detected
+                with self.__lock:
+                    self.results.append(stats)
+                    self.__active.discard(path)
+                    self.__dirty = self.__dirty or stats['rows'] > 0
+                self.queue.task_done()
+            print(f"  watch: {path.name} {stats['rows']} rows, "
+                  f"{stats['latency']:0.2f}s after detection")
+
+    def __enqueue(self, path: pathlib.Path, detected: float,
+                  stop_event: threading.Event) -> None:
+        """Queue a settled file, waiting while the queue is full."""
+        with self.__lock:
+            if path in self.__active:
+                # changed again while loading: load it once more later
+                self.debouncer.touch([path])
+                return
+            self.__active.add(path)
+        while not stop_event.is_set():
+            try:
+                self.queue.put((path, detected), timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+        with self.__lock:
+            self.__active.discard(path)
+
+    def __stop_workers(self, threads: list) -> None:
+        """Queue a None sentinel per worker, unless none is left alive."""
+        for _ in threads:
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    self.queue.put(None, timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    continue
+        for thread in threads:
+            thread.join()
+
+    def __idle(self) -> bool:
+        """True if nothing is queued, loading or waiting to settle."""
+        with self.__lock:
+            return not self.__active and not len(self.debouncer)
+
+    def run(self, stop_event: threading.Event = None, max_files: int = None,
+            timeout: float = None) -> dict:
+        """Catch up with sync_data, then load changes until stopped.
+
+        Stops when stop_event is set, max_files files were loaded or
+        after timeout seconds (KeyboardInterrupt also stops cleanly).
+        """
+        stop_event = stop_event or threading.Event()
+        summary = {'status': False, 'loaded': 0, 'skipped': 0,
+                   'failed': [], 'rows': 0, 'seconds': 0.0, 'latency': 0.0,
+                   'results': self.results}
+        start = time.monotonic()
+        # watch before catching up, so files landing meanwhile are seen
+        source = change_source(self.input_path, self.poll_interval,
+                               self.use_inotify)
+        print(f"watching '{self.input_path}' ({type(source).__name__})")
+        self.pg_api.sync_data(self.input_path, self.engine, self.batch_size)
+        threads = [threading.Thread(target=self.__load, daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not stop_event.is_set():
+                self.debouncer.touch(source.changes(
+                    min(self.poll_interval, self.debouncer.debounce / 2)))
+                for path, detected in self.debouncer.ready():
+                    self.__enqueue(path, detected, stop_event)
+                if self.__dirty and self.__idle():
+                    self.__dirty = False
+                    self.pg_api.refresh_views()
+                with self.__lock:
+                    done = len(self.results)
+                if max_files and done >= max_files:
+                    break
+                if timeout and time.monotonic() - start > timeout:
+                    break
+        except KeyboardInterrupt:
+            print("watch: interrupted")
+        finally:
+            self.__stop_workers(threads)
+            source.close()
+        if self.__dirty:
+            self.pg_api.refresh_views()
+        loaded = [r for r in self.results if r['status'] and r['rows']]
+        summary['loaded'] = len(loaded)
+        summary['skipped'] = sum(1 for r in self.results
+                                 if r['status'] and not r['rows'])
+        summary['failed'] = [r['file'] for r in self.results
+                             if not r['status']]
+        summary['rows'] = sum(r['rows'] for r in self.results)
+        if loaded:
+            summary['latency'] = max(r['latency'] for r in loaded)
+        summary['status'] = not summary['failed']
+        summary['seconds'] = time.monotonic() - start
+        return summary
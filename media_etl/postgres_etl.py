@@ -1,17 +1,128 @@
 # -*- coding: UTF-8 -*-
 """Media driver module to insert JSON media tag data into PostgreSQL."""
+import importlib
 import os
 import pathlib
 import time
 from db import cmd_args
 from db import postgres_api
 from db import postgres_select_queries as sql
+from db import sinks
 
 BASE_DIR, MODULE_NAME = os.path.split(os.path.abspath(__file__))
 PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
 TWO_PARENT_PATH = os.sep.join(pathlib.Path(BASE_DIR).parts[:-2])
 DEMO_ENABLED = True
 PRIVATE_CONFIG = False
+# engine modules a command needs on top of postgres_api (psycopg2):
+# pandas/pyarrow readers and spotipy/rapidfuzz enrichment only load
+COMMAND_MODULES = {'load': ['db.readers', 'db.transform', 'db.enrichment'],
+                   'query': [],
+                   'status': [],
+                   'export': ['db.export'],
+                   'partition': [],
+                   'search': []}
+
+
+def import_engines(command: str) -> list:
+    """Import the engine modules of command, return them."""
+    return [importlib.import_module(name)
+            for name in COMMAND_MODULES[command]]
+
+
+def load(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """Load (or watch/sync) the input path, then report metrics."""
+    pg_api.metrics.start_progress(args.progress)
+    if args.sink != 'postgres':
+        sink = sinks.create_sink(args.sink, db_path=args.sqlite_path)
+        pg_api.load_data(args.input_path, engine=args.engine,
+                         batch_size=args.batch_size, sink=sink)
+        sink.close()
+        print(f"sink: {sink.report()}")
+    elif args.watch:
+        pg_api.create_tables(args.partitioned)
+        pg_api.watch_data(args.input_path, engine=args.engine,
+                          batch_size=args.batch_size,
+                          workers=args.workers,
+                          debounce=args.debounce)
+    elif args.incremental:
+        pg_api.create_tables(args.partitioned)
+        pg_api.sync_data(args.input_path, engine=args.engine,
+                         batch_size=args.batch_size,
+                         workers=args.workers, reset=args.reset)
+    else:
+        if not args.resume:
+            pg_api.drop_tables()
+        pg_api.create_tables(args.partitioned)
+        pg_api.process_data(args.input_path, engine=args.engine,
+                            batch_size=args.batch_size,
+                            workers=args.workers,
+                            concurrent_indexes=args.concurrent_indexes,
+                            resume=args.resume)
+    pg_api.metrics.stop_progress()
+    pg_api.metrics.report()
+    json_file, prom_file = pg_api.metrics.write(args.metrics_path)
+    print(f"metrics: '{json_file.name}', '{prom_file.name}'")
+    if args.sink != 'postgres':
+        return
+    pg_api.show_database_status()
+    if DEMO_ENABLED:
+        pg_api.query(query=sql.ARTIST_SELECT, params=['Mazzy Star'])
+        pg_api.query(query=sql.ALBUM_SELECT, params=['Debut'])
+        pg_api.query(query=sql.TRACK_SELECT, params=['Future Proof'])
+        pg_api.query(query=sql.GENRE_SELECT, params=['Classical'])
+        pg_api.query(query=sql.FILE_SELECT, params=['.flac'])
+        pg_api.query(query=sql.GAIN_SELECT, params=['-4.0'])
+        pg_api.query(query=sql.JOIN_SELECT, params=['Rockabilly'])
+        pg_api.query(query=sql.AVG_SIZE_SELECT)
+
+
+def query(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """Print the result set of a named query."""
+    pg_api.query(query=sql.QUERIES[args.name][0], params=args.params)
+
+
+def status(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """Print tables, indexes and summary view freshness."""
+    pg_api.show_database_status()
+
+
+def export(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """Stream the requested exports out of Postgres with COPY TO STDOUT."""
+    summary = pg_api.export_data(output_path=args.output_path,
+                                 exports=args.exports, fmt=args.format,
+                                 chunk_rows=args.chunk_rows,
+                                 partition_by=args.partition_by,
+                                 params=args.params,
+                                 workers=args.workers)
+    print(f"export: '{args.output_path}' "
+          f"{'SUCCESS' if summary['status'] else '~!ERROR!~'}")
+
+
+def partition(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """List partitions, or drop/reload the partition of one value."""
+    if args.action == 'list':
+        for row in pg_api.get_partitions([args.table] if args.table
+                                         else None):
+            print(row)
+    elif args.action == 'drop':
+        pg_api.drop_partition(args.table, args.value)
+    else:
+        pg_api.reload_partition(args.table, args.value, args.input_path)
+
+
+def search(pg_api: postgres_api.PostgresMedia, args) -> None:
+    """Print the names matching text, by similarity or by prefix."""
+    if args.prefix:
+        names = pg_api.autocomplete(args.text, args.kind, args.limit)
+    else:
+        names = pg_api.search(args.text, args.kind, args.limit)
+    for name in names:
+        print(name)
+
+
+COMMANDS = {'load': load, 'query': query, 'status': status,
+            'export': export, 'partition': partition, 'search': search}
 
 
 def main():
@@ -19,32 +130,18 @@ def main():
     print(f"{MODULE_NAME} starting...")
     start = time.perf_counter()
     args = cmd_args.get_cmd_args(port_num=5432)
-    server = args.server
-    port_num = args.port_num
-    database = args.database
-    username = args.username
-    password = args.password
-    pg_api = postgres_api.PostgresMedia(hostname=server,
-                                        port_num=port_num,
-                                        username=username,
-                                        password=password,
-                                        db_name=database,
-                                        private_cfg=PRIVATE_CONFIG)
-    if pg_api.is_connected():
-        pg_api.drop_tables()
-        pg_api.create_tables()
-        json_path = pathlib.Path(PARENT_PATH, 'data', 'input')
-        pg_api.process_data(json_path)
-        pg_api.show_database_status()
-        if DEMO_ENABLED:
-            pg_api.query(query=sql.ARTIST_SELECT, params=['Mazzy Star'])
-            pg_api.query(query=sql.ALBUM_SELECT, params=['Debut'])
-            pg_api.query(query=sql.TRACK_SELECT, params=['Future Proof'])
-            pg_api.query(query=sql.GENRE_SELECT, params=['Classical'])
-            pg_api.query(query=sql.FILE_SELECT, params=['.flac'])
-            pg_api.query(query=sql.GAIN_SELECT, params=['-4.0'])
-            pg_api.query(query=sql.JOIN_SELECT, params=['Rockabilly'])
-            pg_api.query(query=sql.AVG_SIZE_SELECT)
+    import_engines(args.command)
+    # other sinks load without a Postgres server
+    offline = getattr(args, 'sink', 'postgres') != 'postgres'
+    pg_api = postgres_api.PostgresMedia(hostname=args.server,
+                                        port_num=args.port_num,
+                                        username=args.username,
+                                        password=args.password,
+                                        db_name=args.database,
+                                        private_cfg=PRIVATE_CONFIG,
+                                        connect=not offline)
+    if pg_api.is_connected() or offline:
+        COMMANDS[args.command](pg_api, args)
         pg_api.close()
     end = time.perf_counter() - start
     print(f"\n{MODULE_NAME} finished in {end:0.2f} seconds")
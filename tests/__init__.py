@@ -1,3 +1,18 @@
 import sys
 sys.path.append("..")
-__all__ = ['test_postgres_api']
\ No newline at end of file
+__all__ = ['test_cmd_args',
+           'test_dedup',
+           'test_enrichment',
+           'test_export',
+           'test_json_stream',
+           'test_metrics',
+           'test_postgres_api',
+           'test_postgres_async',
+           'test_readers',
+           'test_records',
+           'test_search',
+           'test_sinks',
+           'test_spotify_cache',
+           'test_synthetic',
+           'test_transform',
+           'test_watch']
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""Unit tests to parse the command line of postgres_etl.py."""
+import unittest
+import os
+import pathlib
+from media_etl.db import cmd_args
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestCmdArgs(unittest.TestCase):
+    """Test case class for cmd_args.py."""
+
+    def test_default_load(self):
+        """Options without a command load, like before the commands."""
+        args = cmd_args.get_cmd_args(argv=['-p', '5433', '-e', 'copy'])
+        self.assertEqual((args.command, args.port_num, args.engine),
+                         ('load', 5433, 'copy'))
+        self.assertTrue(args.input_path.samefile(
+            pathlib.Path(PARENT_PATH, 'data', 'input')))
+        args = cmd_args.get_cmd_args(argv=[])
+        self.assertEqual((args.command, args.engine), ('load', 'insert'))
+
+    def test_load_input_path(self):
+        """Directories are accepted, missing paths exit."""
+        input_path = pathlib.Path(PARENT_PATH, 'data', 'input')
+        args = cmd_args.get_cmd_args(argv=['load', '-i', str(input_path),
+                                           '--incremental'])
+        self.assertEqual(args.input_path, input_path)
+        self.assertTrue(args.incremental)
+        self.assertFalse(args.reset)
+        with self.assertRaises(SystemExit):
+            cmd_args.get_cmd_args(argv=['load', '-i',
+                                        str(pathlib.Path(input_path,
+                                                         'missing'))])
+        with self.assertRaises(SystemExit):
+            cmd_args.get_cmd_args(argv=['load', '--reset'])
+
+    def test_query(self):
+        """Named queries take exactly their parameter count."""
+        args = cmd_args.get_cmd_args(argv=['query', 'genre', 'Classical',
+                                           '-s', 'db_host'])
+        self.assertEqual((args.command, args.name, args.params,
+                          args.server), ('query', 'genre', ['Classical'],
+                                         'db_host'))
+        args = cmd_args.get_cmd_args(argv=['query', 'avg_size'])
+        self.assertEqual(args.params, [])
+        for argv in [['query', 'genre'], ['query', 'avg_size', 'x'],
+                     ['query', 'unknown']]:
+            with self.assertRaises(SystemExit):
+                cmd_args.get_cmd_args(argv=argv)
+
+    def test_status_export(self):
+        """status takes only connection options, export its own."""
+        args = cmd_args.get_cmd_args(argv=['status', '-d', 'other_db'])
+        self.assertEqual((args.command, args.database),
+                         ('status', 'other_db'))
+        args = cmd_args.get_cmd_args(argv=['export', '-f', 'parquet',
+                                           '-x', 'artist', 'join',
+                                           '--params', 'Rockabilly'])
+        self.assertEqual((args.command, args.format, args.exports),
+                         ('export', 'parquet', ['artist', 'join']))
+        self.assertIsInstance(args.output_path, pathlib.Path)
+        with self.assertRaises(SystemExit):
+            cmd_args.get_cmd_args(argv=['status', '-e', 'copy'])
+
+    def test_partition(self):
+        """Years of a RANGE partition are integers, values required."""
+        args = cmd_args.get_cmd_args(argv=['partition', 'drop', 'album',
+                                           '1995'])
+        self.assertEqual((args.table, args.value), ('album', 1995))
+        args = cmd_args.get_cmd_args(argv=['partition', 'reload',
+                                           'filedata', '.flac'])
+        self.assertEqual(args.value, '.flac')
+        args = cmd_args.get_cmd_args(argv=['partition', 'list'])
+        self.assertIsNone(args.table)
+        for argv in [['partition', 'drop', 'album'],
+                     ['partition', 'drop', 'album', 'x'],
+                     ['partition', 'drop', 'track', '1']]:
+            with self.assertRaises(SystemExit):
+                cmd_args.get_cmd_args(argv=argv)
+        args = cmd_args.get_cmd_args(argv=['--partitioned'])
+        self.assertTrue(args.partitioned)
+
+    def test_sink(self):
+        """Loads default to Postgres, other sinks load full files."""
+        args = cmd_args.get_cmd_args(argv=['load'])
+        self.assertEqual(args.sink, 'postgres')
+        args = cmd_args.get_cmd_args(argv=['load', '--sink', 'sqlite',
+                                           '--sqlite_path', 'local.db'])
+        self.assertEqual((args.sink, args.sqlite_path),
+                         ('sqlite', pathlib.Path('local.db')))
+        for argv in [['load', '--sink', 'csv'],
+                     ['load', '--sink', 'memory', '--incremental']]:
+            with self.assertRaises(SystemExit):
+                cmd_args.get_cmd_args(argv=argv)
+
+    def test_search(self):
+        """Search defaults to fuzzy artist names, limits are positive."""
+        args = cmd_args.get_cmd_args(argv=['search', 'mazy star'])
+        self.assertEqual((args.command, args.text, args.kind, args.limit,
+                          args.prefix), ('search', 'mazy star', 'artist',
+                                         10, False))
+        args = cmd_args.get_cmd_args(argv=['search', 'fu', '-k', 'track',
+                                           '-l', '3', '--prefix'])
+        self.assertEqual((args.kind, args.limit, args.prefix),
+                         ('track', 3, True))
+        for argv in [['search'], ['search', 'x', '-k', 'genre'],
+                     ['search', 'x', '-l', '0']]:
+            with self.assertRaises(SystemExit):
+                cmd_args.get_cmd_args(argv=argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Unit tests to skip media rows whose content hash is already loaded."""
+import unittest
+import os
+import pathlib
+import pandas
+from media_etl.db import dedup
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import transform
+from media_etl.db.postgres_api import PostgresMedia
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestDedup(unittest.TestCase):
+    """Test case class for dedup.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.df = pandas.read_json(self.valid_json_file, orient='split',
+                                   dtype=False)
+
+    def test_claim_release(self):
+        """Known and repeated hashes are duplicates, blanks never are."""
+        hash_filter = dedup.HashFilter()
+        self.assertEqual(hash_filter.preload(['a', None, '']), 1)
+        self.assertEqual(hash_filter.claim(['a', 'b', 'b', '', None, '']),
+                         [False, True, False, True, True, True])
+        self.assertIn('b', hash_filter)
+        hash_filter.release(['b'])
+        self.assertEqual(hash_filter.claim(['b']), [True])
+        hash_filter.reset()
+        self.assertFalse(hash_filter.loaded)
+        self.assertEqual(len(hash_filter), 0)
+
+    def test_dedup_rows(self):
+        """Every table drops the rows of a duplicate track."""
+        batch = transform.column_batch(self.df)
+        table_rows = transform.table_rows(self.df)
+        hash_filter = dedup.HashFilter()
+        hash_filter.preload(list(batch.column(dedup.HASH_COLUMN))[:5])
+        rows, claimed, duplicates = dedup.dedup_rows(hash_filter, batch)
+        self.assertEqual((len(rows), len(claimed), duplicates), (7, 7, 5))
+        for table in sql.HEADERS:
+            self.assertEqual(list(rows[table]), table_rows[table][5:])
+        rows, claimed, duplicates = dedup.dedup_rows(hash_filter, batch)
+        self.assertEqual((len(rows), claimed, duplicates), (0, [], 12))
+
+    def test_blank_hash(self):
+        """Blank hashes are always loaded, as NULL."""
+        batch = transform.column_batch(self.df).slice(2, 6)
+        batch = batch.with_column(dedup.HASH_COLUMN, ['', None, 'a', 'a'])
+        rows, claimed, duplicates = dedup.dedup_rows(dedup.HashFilter(),
+                                                     batch)
+        self.assertEqual((claimed, duplicates), (['a'], 1))
+        self.assertEqual(list(rows.column(dedup.HASH_COLUMN)),
+                         [None, None, 'a'])
+
+    def test_reload(self):
+        """Re-ingesting a loaded file writes no rows."""
+        pg_api = PostgresMedia()
+        pg_api.drop_tables()
+        pg_api.create_tables()
+        self.assertIn(sql.HASH_KEY, pg_api.get_indexes())
+        stats = pg_api.load_file(self.valid_json_file, engine='copy')
+        self.assertEqual((stats['rows'], stats['duplicates']), (12, 0))
+        for engine in ['copy', 'insert']:
+            stats = pg_api.load_file(self.valid_json_file, engine=engine)
+            self.assertTrue(stats['status'])
+            self.assertEqual((stats['rows'], stats['duplicates']), (0, 12))
+        count = pg_api.query("SELECT COUNT(*) FROM track")[0][0]
+        self.assertEqual(count, 12)
+        pg_api.close()
+
+    def test_stale_filter(self):
+        """Rows another client loaded meanwhile are re-read, not failed."""
+        pg_api, other = PostgresMedia(), PostgresMedia()
+        pg_api.drop_tables()
+        pg_api.create_tables()
+        other.hash_filter.preload([])
+        pg_api.load_file(self.valid_json_file, engine='copy')
+        stats = other.load_file(self.valid_json_file, engine='copy',
+                                batch_size=5)
+        self.assertTrue(stats['status'])
+        self.assertEqual((stats['rows'], stats['duplicates']), (0, 12))
+        self.assertEqual(len(other.hash_filter), 12)
+        pg_api.close()
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+"""Unit tests for the Spotify enrichment stage against a stub server."""
+import unittest
+import json
+import pathlib
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas
+from media_etl.db.enrichment import EnrichmentStage, SpotifyWebApi
+from media_etl.db.spotify import match_albums
+from media_etl.db.spotify_cache import LookupCache
+
+ALBUMS = [{'id': 'album-debut', 'name': 'Debut'},
+          {'id': 'album-post', 'name': 'Post'},
+          {'id': 'album-homogenic', 'name': 'Homogenic'}]
+
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    """Stands in for the Spotify token, search and artist album routes."""
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload: dict, status: int = 200, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_json({'access_token': 'stub-token',
+                        'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight,
+                                       server.in_flight)
+            throttle = server.throttle > 0
+            server.throttle -= 1
+        time.sleep(0.02)
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if throttle:
+            self.send_json({'error': 'rate limited'}, status=429,
+                           headers={'Retry-After': '1'})
+        elif url.path == '/v1/search':
+            name = query['q'][0].split(':', 1)[1]
+            self.send_json({'artists': {'items': [
+                {'id': f"id-{name.lower().replace(' ', '-')}"}]}})
+        elif url.path.endswith('/albums'):
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['20'])[0])
+            albums = server.albums[offset:offset + limit]
+            more = offset + limit < len(server.albums)
+            self.send_json({'items': albums,
+                            'next': f"{url.path}?offset={offset + limit}"
+                            if more else None})
+        else:
+            self.send_json({'error': 'not found'}, status=404)
+        with server.lock:
+            server.in_flight -= 1
+
+
+class TestEnrichmentStage(unittest.TestCase):
+    """Test case class for enrichment.py."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          StubSpotifyHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.throttle = 0
+        self.server.albums = ALBUMS
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.api = SpotifyWebApi('client', 'secret',
+                                 api_url=f"{base_url}/v1",
+                                 token_url=f"{base_url}/api/token")
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = LookupCache(pathlib.Path(self.temp_dir.name,
+                                              'lookup.sqlite'))
+        names = [f"Artist {idx % 10}" for idx in range(40)]
+        self.df = pandas.DataFrame({'artist_name': names,
+                                    'album_title': ['debut'] * 40,
+                                    'artist_id': '', 'album_id': ''})
+
+    def test_enrich_distinct_and_bounded(self):
+        """Each distinct key is fetched once with bounded concurrency."""
+        stage = EnrichmentStage(api=self.api, cache=self.cache,
+                                max_in_flight=3)
+        df = stage.enrich(self.df)
+        self.assertEqual(self.server.requests, 20)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertEqual(df.loc[0, 'artist_id'], 'id-artist-0')
+        self.assertEqual(set(df['album_id']), {'album-debut'})
+
+    def test_enrich_cached(self):
+        """A second batch is served from the lookup cache."""
+        EnrichmentStage(api=self.api, cache=self.cache).enrich(self.df)
+        requests = self.server.requests
+        stage = EnrichmentStage(api=self.api, cache=self.cache)
+        df = stage.enrich(self.df.copy())
+        self.assertEqual(self.server.requests, requests)
+        self.assertEqual(df.loc[9, 'artist_id'], 'id-artist-9')
+
+    def test_retry_after(self):
+        """HTTP 429 responses pause requests for Retry-After, then retry."""
+        self.server.throttle = 2
+        stage = EnrichmentStage(api=self.api, max_in_flight=2)
+        start = time.perf_counter()
+        artist_ids = stage.resolve_artists(['Mazzy Star', 'Interpol'])
+        self.assertGreaterEqual(time.perf_counter() - start, 1.0)
+        self.assertEqual(stage.scheduler.throttled, 2)
+        self.assertEqual(artist_ids['Interpol'], 'id-interpol')
+
+    def test_retry_after_queued(self):
+        """Calls waiting for a slot during a 429 also wait it out."""
+        self.server.throttle = 2
+        stage = EnrichmentStage(api=self.api, max_in_flight=1)
+        start = time.perf_counter()
+        artist_ids = stage.resolve_artists(['Mazzy Star', 'Interpol',
+                                            'Bjork'])
+        # the second 429 can only come after the first window
+        self.assertGreaterEqual(time.perf_counter() - start, 2.0)
+        self.assertEqual(stage.scheduler.throttled, 2)
+        self.assertEqual(artist_ids['Bjork'], 'id-bjork')
+        self.assertEqual(self.api.calls, 5)
+
+    def test_discography_paginated(self):
+        """All pages are fetched once per artist and then cached."""
+        self.server.albums = [{'id': f"album-{idx}", 'name': f"Album {idx}"}
+                              for idx in range(120)]
+        stage = EnrichmentStage(api=self.api, cache=self.cache)
+        matches = stage.resolve_album_matches(
+            [('a1', 'album 7'), ('a1', 'Album 119'), ('a1', 'album 7')])
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(matches[('a1', 'album 7')], ('album-7', 100.0))
+        self.assertEqual(matches[('a1', 'Album 119')][0], 'album-119')
+        album_ids = stage.resolve_albums([('a1', 'Album 42')])
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(album_ids[('a1', 'Album 42')], 'album-42')
+
+    def test_match_scores(self):
+        """Scores come back with IDs, weak matches are cut or flagged."""
+        matches = match_albums(['DEBUT ', 'Homogenc', 'Vespertine'], ALBUMS)
+        self.assertEqual(matches['DEBUT '], ('album-debut', 100.0))
+        self.assertEqual(matches['Homogenc'][0], 'album-homogenic')
+        self.assertEqual(matches['Vespertine'], ('', 0.0))
+        stage = EnrichmentStage(api=self.api, score_cutoff=50.0)
+        stage.resolve_album_matches([('a1', 'Homogenc'), ('a1', 'Post')])
+        self.assertEqual([flag[1] for flag in stage.flagged], [])
+        stage.resolve_album_matches([('a2', 'Posted')])
+        self.assertEqual(stage.flagged[0][:3], ('a2', 'Posted',
+                                                'album-post'))
+
+    def test_offline(self):
+        """Without an API client the offline IDs are used."""
+        stage = EnrichmentStage(api=None, cache=self.cache)
+        album_ids = stage.resolve_albums([('x', 'Debut'), ('y', 'Unknown')])
+        self.assertEqual(album_ids[('x', 'Debut')], '3icT9XGrBfhlV8BKK4WEGX')
+        self.assertEqual(album_ids[('y', 'Unknown')], '')
+        stage.resolve_artists(['Interpol', 'Unknown Artist'])
+        # offline IDs and misses are not cached for later online runs
+        self.assertIsNone(self.cache.get_album_id('y', 'Unknown'))
+        self.assertIsNone(self.cache.get_artist_id('Unknown Artist'))
+        stage = EnrichmentStage(api=self.api, cache=self.cache)
+        artist_ids = stage.resolve_artists(['Unknown Artist'])
+        self.assertEqual(artist_ids['Unknown Artist'], 'id-unknown-artist')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
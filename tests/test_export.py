@@ -0,0 +1,163 @@
+"""Unit tests to export media_db tables and queries with COPY TO."""
+import unittest
+import csv
+import gzip
+import os
+import pathlib
+import tempfile
+from media_etl.db import export
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db.postgres_api import PostgresMedia
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+def read_csv_parts(export_dir: pathlib.Path) -> list:
+    """Rows of every gzip CSV part, headers dropped."""
+    rows = []
+    for part_path in sorted(export_dir.rglob('part-*.csv.gz')):
+        with gzip.open(part_path, mode='rt', encoding='utf-8') as part:
+            rows.extend(list(csv.reader(part))[1:])
+    return rows
+
+
+class TestExport(unittest.TestCase):
+    """Test case class for export.py."""
+
+    def setUp(self):
+        self.pg_api = PostgresMedia(hostname='localhost',
+                                    port_num=5432,
+                                    username='run_admin_run',
+                                    password='run_pass_run')
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.pg_api.load_data(pathlib.Path(PARENT_PATH, 'data', 'input'),
+                              engine='copy')
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = pathlib.Path(self.temp_dir.name)
+
+    def test_export_csv_chunks(self):
+        """Rows are split into gzip CSV parts of chunk_rows rows."""
+        summary = self.pg_api.export_data(self.output_path,
+                                          exports=[sql.FILE_META],
+                                          chunk_rows=5)
+        self.assertTrue(summary['status'])
+        self.assertEqual((summary['rows'], summary['files']), (12, 3))
+        rows = read_csv_parts(pathlib.Path(self.output_path, sql.FILE_META))
+        self.assertEqual(len(rows), 12)
+        # serial id and source_id around the loaded columns
+        self.assertEqual(len(rows[0]), len(sql.FILE_HEADERS) + 2)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_export_parquet_partitioned(self):
+        """Parquet parts per genre keep numeric and timestamp types."""
+        summary = self.pg_api.export_data(self.output_path,
+                                          exports=[sql.GENRE, sql.ALBUM],
+                                          fmt='parquet',
+                                          partition_by='genre')
+        self.assertTrue(summary['status'])
+        genre_dir = pathlib.Path(self.output_path, sql.GENRE)
+        self.assertIn('genre=Rockabilly',
+                      [part.name for part in genre_dir.iterdir()])
+        genres = pyarrow.parquet.read_table(str(genre_dir))
+        self.assertEqual(genres.num_rows, summary['results'][0]['rows'])
+        self.assertIn('genre', genres.schema.names)
+        albums = pyarrow.parquet.read_table(
+            str(pathlib.Path(self.output_path, sql.ALBUM)))
+        self.assertEqual(summary['results'][1]['partitions'], 0)
+        self.assertTrue(pyarrow.types.is_decimal(
+            albums.schema.field('album_gain').type))
+        self.assertTrue(pyarrow.types.is_integer(
+            albums.schema.field('year').type))
+
+    def test_export_query(self):
+        """Named queries are exported with their params."""
+        summary = self.pg_api.export_data(self.output_path,
+                                          exports=['join'],
+                                          params=['Rockabilly'])
+        self.assertTrue(summary['status'])
+        rows = read_csv_parts(pathlib.Path(self.output_path, 'join'))
+        self.assertEqual(len(rows), summary['rows'])
+        self.assertTrue(rows)
+        summary = self.pg_api.export_data(self.output_path,
+                                          exports=['gain'])
+        self.assertEqual(summary['failed'], ['gain'])
+
+    def test_export_parallel(self):
+        """Every table is exported on its own connection."""
+        summary = self.pg_api.export_data(self.output_path, workers=2)
+        self.assertTrue(summary['status'])
+        self.assertEqual(summary['exports'], len(export.TABLES))
+        for table in export.TABLES:
+            self.assertTrue(pathlib.Path(self.output_path, table,
+                                         'part-00000.csv.gz').exists())
+
+    def test_export_csv_partitioned(self):
+        """One ordered COPY fills a directory per value, NULL included."""
+        stats = export.export_query(
+            self.pg_api.get_connection_kwargs(), 'years',
+            "SELECT NULLIF(year, (SELECT MIN(year) FROM album)) AS year, "
+            "album_title FROM album", self.output_path,
+            partition_by='year')
+        self.assertTrue(stats['status'])
+        # the earliest year became the NULL partition
+        years = self.pg_api.query("SELECT COUNT(DISTINCT year) FROM album",
+                                  verbose=False)[0][0]
+        self.assertEqual(stats['partitions'], years)
+        export_dir = pathlib.Path(self.output_path, 'years')
+        self.assertIn('year=__HIVE_DEFAULT_PARTITION__',
+                      [part.name for part in export_dir.iterdir()])
+        rows = read_csv_parts(export_dir)
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len(rows[0]), 1)
+
+    def test_partition_writer(self):
+        """Quoted, empty and NULL first fields each get a partition."""
+        writer = export.PartitionWriter(self.output_path, 'genre')
+        for row in [b'genre,n\n', b'"A ""b"", c",1\n', b'"A ""b"", c",2\n',
+                    b'"",3\n', b',4\n']:
+            writer.write(row)
+        writer.close()
+        self.assertEqual([w.output_dir.name for w in writer.writers],
+                         [export._partition_dir('genre', 'A "b", c'),
+                          'genre=', 'genre=__HIVE_DEFAULT_PARTITION__'])
+        self.assertTrue(writer.writers[0].output_dir.name.startswith(
+            'genre=A_b_c_'))
+        self.assertEqual([w.rows for w in writer.writers], [2, 1, 1])
+        with gzip.open(writer.writers[0].files[0], mode='rb') as part:
+            self.assertEqual(part.read(), b'n\n1\n2\n')
+
+    def test_partition_collisions(self):
+        """Values sanitized to the same name keep their own files."""
+        writer = export.PartitionWriter(self.output_path, 'genre')
+        for row in [b'genre,n\n', b'Rock Pop,1\n', b'Rock/Pop,2\n',
+                    b'Rock_Pop,3\n']:
+            writer.write(row)
+        writer.close()
+        self.assertEqual(len({w.output_dir for w in writer.writers}), 3)
+        self.assertIn('genre=Rock_Pop', [w.output_dir.name
+                                         for w in writer.writers])
+        self.assertEqual(len(read_csv_parts(self.output_path)), 3)
+
+    def test_chunk_writer_empty(self):
+        """An empty result still writes one part with the header."""
+        writer = export.ChunkWriter(self.output_path, chunk_rows=2)
+        writer.write(b'a,b\n')
+        writer.close()
+        self.assertEqual(writer.rows, 0)
+        with gzip.open(writer.files[0], mode='rb') as part:
+            self.assertEqual(part.read(), b'a,b\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        self.pg_api.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Unit tests to stream orient='split' JSON media files."""
+import unittest
+import json
+import os
+import pathlib
+import tempfile
+from media_etl.db.json_stream import SplitJsonReader, iter_split_chunks
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestSplitJsonReader(unittest.TestCase):
+    """Test case class for json_stream.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        with open(self.valid_json_file, encoding='utf-8') as json_file:
+            self.expected = json.load(json_file)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def write_json(self, text: str) -> pathlib.Path:
+        """Write text to a temporary JSON file."""
+        json_path = pathlib.Path(self.temp_dir.name, 'stream.json')
+        json_path.write_text(text, encoding='utf-8')
+        return json_path
+
+    def test_iter_rows(self):
+        """Rows match json.load() even with tiny read blocks."""
+        for read_size in [1, 7, 64, 65536]:
+            reader = SplitJsonReader(self.valid_json_file,
+                                     read_size=read_size)
+            rows = list(reader.iter_rows())
+            self.assertEqual(reader.columns, self.expected['columns'])
+            self.assertEqual(rows, self.expected['data'])
+
+    def test_iter_chunks(self):
+        """Chunks are bounded by chunk_size and keep the column order."""
+        chunks = list(iter_split_chunks(self.valid_json_file, chunk_size=5))
+        self.assertEqual([len(df) for df in chunks], [5, 5, 2])
+        self.assertEqual(list(chunks[0].columns), self.expected['columns'])
+        self.assertEqual(chunks[2].iloc[-1]['hash'],
+                         self.expected['data'][-1][-4])
+
+    def test_number_at_block_edge(self):
+        """Numbers split across read blocks decode in full."""
+        json_path = self.write_json('{"columns":["a"],"index":[10,2345],'
+                                    '"data":[[12345],[678]]}')
+        reader = SplitJsonReader(json_path, read_size=3)
+        self.assertEqual(list(reader.iter_rows()), [[12345], [678]])
+
+    def test_malformed(self):
+        """Missing columns or truncated data raise ValueError."""
+        json_path = self.write_json('{"data":[["x"]],"columns":["a"]}')
+        with self.assertRaises(ValueError):
+            list(SplitJsonReader(json_path).iter_rows())
+        json_path = self.write_json('{"columns":["a"],"data":[["x"],')
+        with self.assertRaises(ValueError):
+            list(SplitJsonReader(json_path).iter_rows())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
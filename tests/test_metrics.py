@@ -0,0 +1,79 @@
+"""Unit tests for ETL run timings, counters and histograms."""
+import unittest
+import json
+import pathlib
+import tempfile
+from media_etl.db.metrics import Histogram, RunMetrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    """Test case class for metrics.py."""
+
+    def setUp(self):
+        self.metrics = RunMetrics()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def test_histogram(self):
+        """Samples fall into the first bucket bound at or above them."""
+        hist = Histogram((0.1, 1.0))
+        for seconds in [0.05, 0.1, 0.5, 2.0]:
+            hist.observe(seconds)
+        self.assertEqual(hist.counts, [2, 1, 1])
+        self.assertEqual(hist.quantile(0.5), 0.1)
+        self.assertEqual(hist.quantile(1.0), float('inf'))
+
+    def test_stage(self):
+        """Stages add up seconds and calls, iter_stage times each step."""
+        with self.metrics.stage('insert.artist', 'db'):
+            pass
+        self.assertEqual(list(self.metrics.iter_stage('read', 'abc')),
+                         ['a', 'b', 'c'])
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['stages']['insert.artist'][1], 1)
+        self.assertEqual(snapshot['stages']['read'][1], 4)
+        self.assertEqual(snapshot['histograms']['db']['count'], 1)
+
+    def test_merge(self):
+        """Worker snapshots add into the parent run."""
+        worker = RunMetrics()
+        worker.count('rows', 5)
+        worker.record('enrich', 0.5)
+        worker.observe('api', 0.2)
+        self.metrics.count('rows', 2)
+        self.metrics.merge(worker.snapshot())
+        self.metrics.merge(worker.snapshot())
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['counters']['rows'], 12)
+        self.assertEqual(snapshot['stages']['enrich'], [1.0, 2])
+        self.assertEqual(snapshot['histograms']['api']['count'], 2)
+
+    def test_prometheus(self):
+        """Text format has cumulative buckets ending in +Inf."""
+        self.metrics.count('rows', 3)
+        self.metrics.observe('db', 0.002)
+        self.metrics.observe('db', 100.0)
+        text = self.metrics.to_prometheus()
+        self.assertIn('media_etl_rows_total 3\n', text)
+        self.assertIn('media_etl_db_latency_seconds_bucket{le="0.0025"} 1',
+                      text)
+        self.assertIn('media_etl_db_latency_seconds_bucket{le="+Inf"} 2',
+                      text)
+        self.assertIn('media_etl_db_latency_seconds_count 2', text)
+
+    def test_write(self):
+        """JSON summary and .prom file are written to the output path."""
+        self.metrics.count('files')
+        json_path, prom_path = self.metrics.write(
+            pathlib.Path(self.temp_dir.name))
+        summary = json.loads(json_path.read_text(encoding='utf-8'))
+        self.assertEqual(summary['counters']['files'], 1)
+        self.assertTrue(prom_path.read_text(encoding='utf-8'))
+        self.assertFalse(prom_path.with_suffix('.prom.tmp').exists())
+
+    def tearDown(self):
+        self.metrics.stop_progress()
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
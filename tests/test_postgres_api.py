@@ -1,7 +1,18 @@
 """Unit tests to insert JSON media tags into PostgreSQL."""
 import unittest
 import os
+import json
 import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import psycopg2
+from media_etl.db import readers
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import postgres_select_queries as select_sql
 from media_etl.db.postgres_api import PostgresMedia
 
 BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
@@ -65,6 +76,27 @@ class TestDatabase(unittest.TestCase):
         p_result_set = self.pg_api.query(query=param_query, params=['Ravel'])
         self.assertFalse(len(p_result_set) > 0)
 
+    def test_iter_query(self):
+        """Streams rows and batches lazily from a server-side cursor."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.pg_api.load_file(self.valid_json_file, engine='copy')
+        count = self.pg_api.query("SELECT COUNT(*) FROM filedata",
+                                  verbose=False)[0][0]
+        rows = list(self.pg_api.iter_query("SELECT hash FROM filedata",
+                                           itersize=5))
+        self.assertEqual(len(rows), count)
+        batches = list(self.pg_api.iter_query("SELECT hash FROM filedata",
+                                              batch_size=5))
+        self.assertEqual(sum(len(batch) for batch in batches), count)
+        self.assertTrue(all(len(batch) <= 5 for batch in batches))
+        rows = self.pg_api.iter_query("SELECT * FROM filedata")
+        next(rows)
+        rows.close()
+        self.assertEqual(list(self.pg_api.iter_query(
+            "SELECT * FROM unknown_table")), [])
+        self.assertIsNotNone(self.pg_api.query("SELECT 1"))
+
     def test_create_role(self):
         """Verifies role creation for media_db postgres instance."""
         status = self.pg_api.create_role(username='new_user',
@@ -82,11 +114,43 @@ class TestDatabase(unittest.TestCase):
         status = self.pg_api.create_tables()
         self.assertTrue('SUCCESS' in status)
 
+    def test_create_indexes(self):
+        """Drop and rebuild (concurrently) the catalog indexes."""
+        self.pg_api.create_tables()
+        status = self.pg_api.drop_indexes()
+        self.assertTrue('SUCCESS' in status)
+        self.assertFalse(set(sql.INDEXES) & set(self.pg_api.get_indexes()))
+        status = self.pg_api.create_indexes(concurrently=True)
+        self.assertTrue('SUCCESS' in status)
+        self.assertTrue(set(sql.INDEXES) <= set(self.pg_api.get_indexes()))
+
     def test_process_file(self):
         """Extract/Transform media_lib.json, Load into postgres media_db."""
         status = self.pg_api.process_file(self.valid_json_file)
         self.assertTrue(status)
 
+    def test_process_file_copy(self):
+        """Bulk load media_lib.json through COPY in batched transactions."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        stats = self.pg_api.load_file(self.valid_json_file, engine='copy',
+                                      batch_size=5)
+        self.assertTrue(stats['status'])
+        self.assertEqual(stats['rows'], 12)
+        status = self.pg_api.process_file(self.valid_json_file,
+                                          engine='unknown')
+        self.assertFalse(status)
+
+    def test_process_file_streamed(self):
+        """Stream media_lib.json in chunks when above the size threshold."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        with mock.patch('db.json_stream.STREAM_THRESHOLD', 0):
+            stats = self.pg_api.load_file(self.valid_json_file,
+                                          engine='copy')
+        self.assertTrue(stats['status'])
+        self.assertEqual(stats['rows'], 12)
+
     def test_process_data(self):
         """Find all .json input files."""
         status = self.pg_api.create_tables()
@@ -95,6 +159,320 @@ class TestDatabase(unittest.TestCase):
         status = self.pg_api.process_data(self.invalid_json_path)
         self.assertFalse(status)
 
+    def test_load_data_parallel(self):
+        """Copies of media_lib.json on worker processes load only once."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for idx in range(3):
+                shutil.copy(self.valid_json_file,
+                            pathlib.Path(temp_dir, f"media_lib_{idx}.json"))
+            summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                            engine='copy', workers=2)
+        self.assertTrue(summary['status'])
+        self.assertEqual(summary['loaded'], 3)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual((summary['rows'], summary['duplicates']), (12, 24))
+        counters = self.pg_api.metrics.snapshot()['counters']
+        self.assertEqual((counters['files'], counters['rows'],
+                          counters['duplicates']), (3, 12, 24))
+        count = self.pg_api.query("SELECT COUNT(*) FROM filedata",
+                                  verbose=False)[0][0]
+        self.assertEqual(count, 12)
+
+    def test_load_data_sources(self):
+        """JSON Lines and Parquet sources load like split JSON."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        media_lib = json.loads(self.valid_json_file.read_text('utf-8'))
+        records = [dict(zip(media_lib['columns'], row))
+                   for row in media_lib['data']]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pathlib.Path(temp_dir, 'media_lib.jsonl').write_text(
+                '\n'.join(json.dumps(record) for record in records),
+                encoding='utf-8')
+            pathlib.Path(temp_dir, 'notes.txt').write_text('skipped')
+            if readers.pyarrow:
+                readers.pyarrow.parquet.write_table(
+                    readers.pyarrow.Table.from_pylist(
+                        [{key: str(value) for key, value in record.items()}
+                         for record in records]),
+                    str(pathlib.Path(temp_dir, 'media_lib.parquet')))
+            summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                            engine='copy')
+        files = 2 if readers.pyarrow else 1
+        self.assertEqual((summary['files'], summary['loaded']),
+                         (files, files))
+        self.assertEqual((summary['rows'], summary['duplicates']),
+                         (12, 12 * (files - 1)))
+
+    def test_load_metrics(self):
+        """Stages, counters and DB latencies are recorded per load."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.pg_api.metrics.reset()
+        self.pg_api.load_data(self.valid_json_path, engine='copy')
+        snapshot = self.pg_api.metrics.snapshot()
+        for stage in ['scan', 'read', 'enrich', 'transform', 'commit',
+                      'index', f"insert.{sql.ARTIST}"]:
+            self.assertIn(stage, snapshot['stages'])
+        self.assertEqual(snapshot['counters']['rows'], 12)
+        self.assertGreater(snapshot['counters']['bytes'], 0)
+        self.assertEqual(snapshot['counters']['errors'], 0)
+        self.assertEqual(snapshot['histograms']['db']['count'],
+                         len(sql.HEADERS) + 1)
+
+    def test_resume(self):
+        """An interrupted load resumes after its last committed batch."""
+        def count(query):
+            return self.pg_api.query(query, verbose=False)[0][0]
+
+        copy_rows = PostgresMedia._PostgresMedia__copy_rows
+        calls = []
+
+        def drop_connection(cursor, table_rows, upsert):
+            calls.append(len(table_rows[sql.ARTIST]))
+            if len(calls) == 2:
+                raise psycopg2.OperationalError('connection lost')
+            return copy_rows(self.pg_api, cursor, table_rows, upsert)
+
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copy(self.valid_json_file, temp_dir)
+            # checkpoints compare mtime/size, files are not hashed
+            with mock.patch.object(PostgresMedia,
+                                   '_PostgresMedia__copy_rows',
+                                   side_effect=drop_connection), \
+                    mock.patch.object(PostgresMedia,
+                                      '_PostgresMedia__hash_file',
+                                      side_effect=AssertionError):
+                summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                                engine='copy', batch_size=5)
+            self.assertEqual((summary['rows'], len(summary['failed'])),
+                             (5, 1))
+            self.assertEqual(count("SELECT row_offset FROM checkpoint"), 5)
+            summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                            engine='insert', batch_size=5,
+                                            resume=True)
+            self.assertEqual((summary['rows'], summary['failed']), (7, []))
+            summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                            engine='copy', resume=True)
+            self.assertEqual((summary['rows'], summary['skipped']), (0, 1))
+            json_path = pathlib.Path(temp_dir, self.valid_json_file.name)
+            os.utime(json_path, ns=(1, 1))
+            summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                            engine='copy', resume=True)
+            self.assertEqual(summary['failed'], [str(json_path)])
+        self.assertEqual(count("SELECT COUNT(DISTINCT hash) FROM filedata"),
+                         12)
+        self.assertEqual(count("SELECT COUNT(*) FROM filedata"), 12)
+
+    def test_summary_views(self):
+        """Reporting queries read fresh views, base tables when stale."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.pg_api.load_data(self.valid_json_path, engine='copy')
+        self.assertTrue(all(self.pg_api.is_fresh(name)
+                            for name in sql.VIEWS))
+        view_avg = self.pg_api.query(select_sql.AVG_SIZE_SELECT)
+        genres = dict((row[0], row[1:]) for row in self.pg_api.query(
+            select_sql.GENRE_COUNT_SELECT, verbose=False))
+        self.assertEqual(genres['Rockabilly'], (2, 2))
+        media_lib = json.loads(self.valid_json_file.read_text('utf-8'))
+        hash_idx = media_lib['columns'].index('hash')
+        for row in media_lib['data']:
+            row[hash_idx] = f"{row[hash_idx]}B"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path = pathlib.Path(temp_dir, 'media_lib_b.json')
+            json_path.write_text(json.dumps(media_lib))
+            self.pg_api.process_file(json_path)
+        self.assertFalse(self.pg_api.is_fresh(select_sql.FILE_EXT_SUMMARY))
+        base_avg = self.pg_api.query(select_sql.AVG_SIZE_SELECT)
+        self.assertEqual(view_avg, base_avg)
+        stale = self.pg_api.query(select_sql.EXT_SIZE_VIEW_SELECT,
+                                  verbose=False)
+        self.assertEqual(sum(row[1] for row in stale), 12)
+        self.assertIn('SUCCESS', self.pg_api.refresh_views([sql.FILE_META]))
+        self.assertTrue(self.pg_api.is_fresh(select_sql.FILE_EXT_SUMMARY))
+        self.assertFalse(self.pg_api.is_fresh(select_sql.GENRE_SUMMARY))
+        fresh = self.pg_api.query(select_sql.EXT_SIZE_SELECT, verbose=False)
+        self.assertEqual(sum(row[1] for row in fresh), 24)
+
+    def test_sync_data(self):
+        """Incremental loads skip unchanged and remove deleted files."""
+        def write_json(json_path, rows):
+            json_path.write_text(json.dumps(
+                {'columns': media_lib['columns'],
+                 'index': list(range(len(rows))), 'data': rows}))
+
+        def count(table):
+            return self.pg_api.query(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+        media_lib = json.loads(self.valid_json_file.read_text('utf-8'))
+        hash_idx = media_lib['columns'].index('hash')
+        other_rows = [row[:hash_idx] + [f"{row[hash_idx]}B"] +
+                      row[hash_idx + 1:] for row in media_lib['data'][:5]]
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            lib_path = pathlib.Path(temp_dir, 'a.json')
+            other_path = pathlib.Path(temp_dir, 'b.json')
+            write_json(lib_path, media_lib['data'])
+            write_json(other_path, other_rows)
+            summary = self.pg_api.sync_data(pathlib.Path(temp_dir),
+                                            engine='copy')
+            self.assertEqual(summary['loaded'], 2)
+            self.assertEqual((count('filedata'), count('artist')), (17, 12))
+            summary = self.pg_api.sync_data(pathlib.Path(temp_dir))
+            self.assertEqual((summary['loaded'], summary['skipped']), (0, 2))
+            other_path.unlink()
+            write_json(lib_path, media_lib['data'][:6])
+            summary = self.pg_api.sync_data(pathlib.Path(temp_dir))
+            self.assertEqual((summary['loaded'], summary['removed']), (1, 1))
+        self.assertEqual((count('filedata'), count('track')), (6, 6))
+        self.assertEqual((count('artist'), count('manifest')), (6, 1))
+        # plain loads skip rows whose upsert key the sync loaded already
+        for engine, suffix in [('copy', 'C'), ('insert', 'D')]:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                write_json(pathlib.Path(temp_dir, 'c.json'),
+                           [row[:hash_idx] + [f"{row[hash_idx]}{suffix}"] +
+                            row[hash_idx + 1:]
+                            for row in media_lib['data'][:6]])
+                summary = self.pg_api.load_data(pathlib.Path(temp_dir),
+                                                engine=engine, resume=True)
+            self.assertTrue(summary['status'])
+        self.assertEqual((count('filedata'), count('artist')), (18, 6))
+        self.pg_api.drop_tables()
+
+    def test_concurrent_queries(self):
+        """Threads share one instance, borrowing from a bounded pool."""
+        pg_api = PostgresMedia(max_conn=2)
+        pg_api.drop_tables()
+        pg_api.create_tables()
+        queries = ["SELECT pg_sleep(0.05), %s"] * 12
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(
+                lambda idx: pg_api.query(queries[idx], [idx],
+                                         verbose=False), range(12)))
+        self.assertEqual([rows[0][1] for rows in results], list(range(12)))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stats = list(executor.map(
+                lambda path: pg_api.load_file(path, engine='copy'),
+                [self.valid_json_file] * 2))
+        self.assertEqual(sorted(s['rows'] for s in stats), [0, 12])
+        self.assertEqual(sum(s['duplicates'] for s in stats), 12)
+        self.assertTrue(all(s['status'] for s in stats))
+        pg_api.close()
+
+    def test_reconnect(self):
+        """Closed connections are replaced, other instances unaffected."""
+        other = PostgresMedia(db_name='does_not_exist')
+        self.assertFalse(other.is_connected())
+        self.assertTrue(self.pg_api.is_connected())
+        with self.pg_api.connection() as db_conn:
+            db_conn.close()
+        self.assertEqual(self.pg_api.query("SELECT 1", verbose=False),
+                         [(1,)])
+        with self.assertRaises(psycopg2.OperationalError):
+            with self.pg_api.cursor() as cursor:
+                cursor.execute("SELECT pg_terminate_backend("
+                               "pg_backend_pid());")
+        self.assertEqual(self.pg_api.query("SELECT 2", verbose=False),
+                         [(2,)])
+
+    def test_partitions(self):
+        """Partitions appear with new values, drop and reload one by one."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables(partitioned=True)
+        self.assertTrue(self.pg_api.is_partitioned())
+        summary = self.pg_api.load_data(self.valid_json_path, engine='copy')
+        self.assertEqual(summary['rows'], 12)
+        counts = dict(self.pg_api.query(
+            "SELECT tableoid::regclass::text, COUNT(*) FROM filedata "
+            "GROUP BY 1", verbose=False))
+        self.assertEqual(counts, {'filedata_flac': 3, 'filedata_m4a': 4,
+                                  'filedata_mp3': 4, 'filedata_wma': 1})
+        plan = self.pg_api.query(f"EXPLAIN {select_sql.FILE_SELECT}",
+                                 ['.flac'], verbose=False)
+        self.assertNotIn('filedata_mp3', str(plan))
+        names = [row[1] for row in self.pg_api.get_partitions(['album'])]
+        self.assertIn('album_1990', names)
+        self.assertIn('SUCCESS', self.pg_api.drop_partition('filedata',
+                                                            '.flac'))
+        count = self.pg_api.query("SELECT COUNT(*) FROM filedata",
+                                  verbose=False)[0][0]
+        self.assertEqual(count, 9)
+        stats = self.pg_api.reload_partition('filedata', '.flac',
+                                             self.valid_json_path)
+        self.assertEqual((stats['status'], stats['rows']), (True, 3))
+        self.assertTrue(self.pg_api.is_fresh('file_ext_summary'))
+        # a .flac row whose hash another partition already holds
+        media_lib = json.loads(self.valid_json_file.read_text('utf-8'))
+        ext_idx = media_lib['columns'].index('file_ext')
+        hash_idx = media_lib['columns'].index('hash')
+        rows = media_lib['data']
+        flac = next(row for row in rows if row[ext_idx] == '.flac')
+        flac[hash_idx] = next(row[hash_idx] for row in rows
+                              if row[ext_idx] == '.mp3')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pathlib.Path(temp_dir, 'media_lib.json').write_text(
+                json.dumps(media_lib))
+            stats = self.pg_api.reload_partition('filedata', '.flac',
+                                                 pathlib.Path(temp_dir))
+        self.assertEqual((stats['rows'], stats['duplicates']), (2, 1))
+        # rows of full loads are only replaced by an explicit reset
+        summary = self.pg_api.sync_data(self.valid_json_path, engine='copy')
+        self.assertEqual((summary['status'], summary['rows']), (False, 0))
+        state_query = ("SELECT (SELECT COUNT(*) FROM checkpoint), "
+                       "(SELECT SUM(changes) FROM view_state)")
+        checkpoints, changes = self.pg_api.query(state_query,
+                                                 verbose=False)[0]
+        summary = self.pg_api.sync_data(self.valid_json_path, engine='copy',
+                                        reset=True)
+        self.assertEqual((summary['status'], summary['rows']), (True, 12))
+        state = self.pg_api.query(state_query, verbose=False)[0]
+        # the reset keeps the checkpoints and view change counters
+        self.assertEqual(state[0], checkpoints)
+        self.assertGreater(checkpoints, 0)
+        self.assertGreater(state[1], changes)
+        self.assertTrue(self.pg_api.is_fresh('file_ext_summary'))
+        self.assertTrue(self.pg_api.is_partitioned())
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.assertFalse(self.pg_api.is_partitioned())
+
+    def test_partition_default(self):
+        """Rows loaded before their partition existed are moved into it."""
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables(partitioned=True)
+        self.pg_api.query("INSERT INTO filedata (file_ext, hash) "
+                          "VALUES ('.mp3', 'early') RETURNING id",
+                          verbose=False)
+        stats = self.pg_api.load_file(self.valid_json_file, engine='insert')
+        self.assertEqual(stats['rows'], 12)
+        counts = dict(self.pg_api.query(
+            "SELECT tableoid::regclass::text, COUNT(*) FROM filedata "
+            "GROUP BY 1", verbose=False))
+        self.assertEqual((counts['filedata_mp3'], len(counts)), (5, 4))
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+
+    def test_lazy_imports(self):
+        """Queries import neither pandas nor the Spotify clients."""
+        code = ("import sys\n"
+                "loaded = set(sys.modules)\n"
+                "from db import postgres_api\n"
+                "pg_api = postgres_api.PostgresMedia()\n"
+                "pg_api.query('SELECT 1', verbose=False)\n"
+                "pg_api.close()\n"
+                "print(sorted({'pandas', 'pyarrow', 'rapidfuzz', "
+                "'spotipy'} & set(sys.modules) - loaded))")
+        output = subprocess.run([sys.executable, '-c', code],
+                                cwd=pathlib.Path(PARENT_PATH, 'media_etl'),
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.splitlines()[-1], '[]')
+
     def test_drop_tables(self):
         """Drop all tables in postgres for media_db."""
         status = self.pg_api.drop_tables()
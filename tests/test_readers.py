@@ -0,0 +1,95 @@
+"""Unit tests to read media sources by file extension."""
+import unittest
+import json
+import os
+import pathlib
+import tempfile
+import pandas
+from media_etl.db import readers
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestReaders(unittest.TestCase):
+    """Test case class for readers.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.df = pandas.read_json(self.valid_json_file, orient='split',
+                                   dtype=False).astype(str)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def temp_path(self, file_name: str) -> pathlib.Path:
+        """Path of a file in the temporary directory."""
+        return pathlib.Path(self.temp_dir.name, file_name)
+
+    def assert_chunks(self, input_path: pathlib.Path) -> None:
+        """5 row chunks projected to SOURCE_COLUMNS with the same rows."""
+        chunks = list(readers.iter_chunks(input_path, chunk_size=5))
+        self.assertEqual([len(df) for df in chunks], [5, 5, 2])
+        self.assertEqual(list(chunks[0].columns), readers.SOURCE_COLUMNS)
+        self.assertNotIn('index', chunks[0].columns)
+        df = pandas.concat(chunks, ignore_index=True)
+        self.assertEqual(list(df['hash']), list(self.df['hash']))
+        self.assertEqual(df.loc[1, 'artist_name'], 'Frank Sinatra')
+
+    def test_json_lines(self):
+        """JSON Lines rows are streamed, blank lines ignored."""
+        jsonl_path = self.temp_path('media_lib.jsonl')
+        records = self.df.to_dict(orient='records')
+        jsonl_path.write_text('\n'.join(json.dumps(record) for record
+                                        in records) + '\n\n',
+                              encoding='utf-8')
+        self.assert_chunks(jsonl_path)
+        jsonl_path.write_text('{"artist_name": "x"}\n{oops\n',
+                              encoding='utf-8')
+        with self.assertRaises(ValueError):
+            list(readers.iter_chunks(jsonl_path))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_parquet(self):
+        """Parquet row groups are read in chunks, projected to HEADERS."""
+        parquet_path = self.temp_path('media_lib.parquet')
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(self.df),
+                                    parquet_path, row_group_size=4)
+        self.assertEqual(pyarrow.parquet.ParquetFile(
+            parquet_path).num_row_groups, 3)
+        chunks = list(readers.iter_chunks(parquet_path, chunk_size=5))
+        self.assertEqual([len(df) for df in chunks], [4, 4, 4])
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(self.df),
+                                    parquet_path)
+        self.assert_chunks(parquet_path)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_arrow_ipc(self):
+        """Arrow IPC files are memory-mapped and missing columns blank."""
+        arrow_path = self.temp_path('media_lib.arrow')
+        pyarrow.feather.write_feather(self.df, str(arrow_path))
+        self.assert_chunks(arrow_path)
+        pyarrow.feather.write_feather(self.df.drop(columns=['comment']),
+                                      str(arrow_path))
+        df = next(readers.iter_chunks(arrow_path))
+        self.assertEqual(set(df['comment']), {''})
+
+    def test_unsupported(self):
+        """Files without a reader are not sources."""
+        csv_path = self.temp_path('media_lib.csv')
+        self.assertFalse(readers.is_source(csv_path))
+        self.assertTrue(readers.is_source(self.temp_path('a.PARQUET')))
+        with self.assertRaises(ValueError):
+            readers.iter_chunks(csv_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
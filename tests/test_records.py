@@ -0,0 +1,96 @@
+"""Unit tests for the column batches shared by the table loads."""
+import unittest
+import csv
+import io
+import os
+import pathlib
+import pandas
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import records
+from media_etl.db import transform
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestRecords(unittest.TestCase):
+    """Test case class for records.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.df = pandas.read_json(self.valid_json_file, orient='split',
+                                   dtype=False)
+        self.table_rows = transform.table_rows(self.df.copy())
+        self.batch = transform.column_batch(self.df)
+
+    def test_projections(self):
+        """Tables project the shared columns like the row tuples."""
+        self.assertEqual(len(self.batch), 12)
+        self.assertEqual(list(self.batch.keys()), list(sql.HEADERS))
+        for table, rows in self.batch.items():
+            self.assertEqual(list(rows), self.table_rows[table])
+            self.assertEqual(rows[-1], self.table_rows[table][-1])
+            self.assertEqual(list(rows[3:5]), self.table_rows[table][3:5])
+        with self.assertRaises(IndexError):
+            self.batch[sql.ARTIST][12]
+
+    def test_interned(self):
+        """Repeated values of low-cardinality columns share one object."""
+        for column in ['genre', 'file_ext', 'artist_name']:
+            values = self.batch.columns[column]
+            self.assertEqual(len({id(value) for value in values}),
+                             len(set(values)))
+
+    def test_slice_extend(self):
+        """Views share columns until compacted, extend appends rows."""
+        view = self.batch.slice(4, 8)
+        self.assertIs(view.columns, self.batch.columns)
+        self.assertEqual(list(view[sql.FILE_META]),
+                         self.table_rows[sql.FILE_META][4:8])
+        view.compact()
+        self.assertEqual((view.start, len(view.columns['hash'])), (0, 4))
+        view.extend(self.batch.slice(0, 2))
+        self.assertEqual(list(view[sql.TRACK]),
+                         self.table_rows[sql.TRACK][4:8] +
+                         self.table_rows[sql.TRACK][:2])
+        empty = records.ColumnBatch.empty()
+        empty.extend(self.batch)
+        self.assertEqual(list(empty[sql.GENRE]), self.table_rows[sql.GENRE])
+
+    def test_select(self):
+        """select() keeps the flagged rows of every table."""
+        keep = [idx % 3 == 0 for idx in range(12)]
+        selected = self.batch.select(keep)
+        self.assertEqual(list(selected[sql.ALBUM]),
+                         self.table_rows[sql.ALBUM][::3])
+
+    def test_split(self):
+        """Rows are grouped by a key of one column, order kept."""
+        groups = self.batch.slice(2).split('file_ext', str.upper)
+        self.assertEqual(sum(len(group) for group in groups.values()), 10)
+        for key, group in groups.items():
+            self.assertEqual(set(group.column('file_ext')),
+                             {key.lower()})
+        expected = [row for row in self.table_rows[sql.FILE_META][2:]
+                    if row[3] == '.flac']
+        self.assertEqual(list(groups['.FLAC'][sql.FILE_META]), expected)
+        single = self.batch.split('file_ext', lambda value: None)
+        self.assertIs(single[None], self.batch)
+
+    def test_csv_stream(self):
+        """Small reads return the same CSV as writing all rows at once."""
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(
+            self.table_rows[sql.FILE_META])
+        stream = records.CsvStream(self.batch[sql.FILE_META])
+        parts = list(iter(lambda: stream.read(100), ''))
+        self.assertTrue(all(len(part) <= 100 for part in parts))
+        self.assertEqual(''.join(parts), buffer.getvalue())
+        stream = records.CsvStream(self.batch[sql.ARTIST])
+        self.assertEqual(len(stream.read().splitlines()), 12)
+        self.assertEqual(stream.read(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Unit tests for fuzzy and prefix search of media names."""
+import unittest
+import os
+import pathlib
+import tempfile
+import pandas
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import postgres_select_queries as select_sql
+from media_etl.db import search
+from media_etl.db.postgres_api import PostgresMedia
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestNameIndex(unittest.TestCase):
+    """Test case class for search.py."""
+
+    def setUp(self):
+        self.index = search.NameIndex(['Mazzy Star', 'mazzy  star', 'Azz',
+                                       'Massive Attack', 'Star', None, '',
+                                       'Star Wars Theme', 'Interpol'])
+
+    def test_distinct(self):
+        """Blank names are skipped, names differing in case kept."""
+        self.assertEqual(len(self.index), 7)
+        self.assertIn('star', self.index.words)
+
+    def test_fuzzy(self):
+        """Typos and partial names rank the closest name first."""
+        self.assertEqual(self.index.fuzzy('mazy star', 1),
+                         [('Mazzy Star', 0.9474)])
+        matches = self.index.fuzzy('Star', 3)
+        self.assertEqual(matches[0], ('Star', 1.0))
+        self.assertEqual([score for _, score in matches], [1.0] * 3)
+        self.assertEqual(self.index.fuzzy('interpoll', 5)[0][0], 'Interpol')
+        self.assertEqual(self.index.fuzzy('qwxz', 5), [])
+        self.assertEqual(self.index.fuzzy('', 5), [])
+
+    def test_candidates(self):
+        """Only the names sharing most query words are scored."""
+        names = [f"Track {idx}" for idx in range(3000)] + ['Track Star']
+        index = search.NameIndex(names)
+        self.assertEqual(index.fuzzy('trakc star', 1)[0][0], 'Track Star')
+
+
+class TestPostgresSearch(unittest.TestCase):
+    """Test case class for PostgresMedia search()/autocomplete()."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.pg_api = PostgresMedia()
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.pg_api.load_file(self.valid_json_file, engine='copy')
+        self.pg_api.create_search_indexes()
+
+    def tearDown(self):
+        self.pg_api.close()
+
+    def test_autocomplete(self):
+        """Prefixes match any case, LIKE wildcards are literal."""
+        self.assertEqual(self.pg_api.autocomplete('m'),
+                         ['M. Ward', 'Massive Attack', 'Mazzy Star'])
+        self.assertEqual(self.pg_api.autocomplete('MA', limit=1),
+                         ['Massive Attack'])
+        self.assertEqual(self.pg_api.autocomplete('the', 'album'),
+                         ['The Suburbs'])
+        self.assertEqual(self.pg_api.autocomplete('%'), [])
+        self.assertEqual(select_sql.like_prefix('50%_a\\'), '50\\%\\_a\\\\%')
+        with self.pg_api.cursor() as cursor:
+            # 12 rows: without this the planner always scans the table
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {select_sql.prefix_query('track')}",
+                           ['fu%', 1])
+            plan = str(cursor.fetchall())
+            cursor.execute("RESET enable_seqscan")
+        self.assertIn('track_track_title_prefix_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_search(self):
+        """Misspelled names are found, best match first."""
+        results = self.pg_api.search('mazy star')
+        self.assertEqual(results[0][0], 'Mazzy Star')
+        self.assertTrue(0 < results[0][1] <= 1)
+        self.assertEqual(self.pg_api.search('futur proof', 'track',
+                                            limit=1)[0][0], 'Future Proof')
+        self.assertEqual(self.pg_api.search('debut', 'album')[0],
+                         ('Debut', 1.0))
+        self.assertEqual(self.pg_api.search('x', 'genre'), [])
+
+    def test_stale_index(self):
+        """A load or a recreated table rebuilds the fallback index."""
+        if self.pg_api.has_trigram():
+            self.skipTest("pg_trgm installed, no in-process index")
+        self.assertEqual(self.pg_api.search('the kinks'), [])
+        df = pandas.read_json(self.valid_json_file, orient='split',
+                              dtype=False).head(1)
+        df['artist_name'] = 'The Kinks'
+        df['artist_id'] = 'kinks'
+        df['hash'] = 'kinks'
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_file = pathlib.Path(temp_dir, 'kinks.json')
+            df.to_json(json_file, orient='split', index=False)
+            self.pg_api.load_file(json_file, engine='copy')
+        self.assertEqual(self.pg_api.search('the kinks')[0],
+                         ('The Kinks', 1.0))
+        self.pg_api.drop_tables()
+        self.pg_api.create_tables()
+        self.assertEqual(self.pg_api.search('the kinks'), [])
+
+    def test_trigram(self):
+        """With pg_trgm the search runs on the GIN trigram index."""
+        available = self.pg_api.query(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'",
+            verbose=False)
+        if not available:
+            self.skipTest("pg_trgm not available on this server")
+        self.assertTrue(self.pg_api.has_trigram())
+        self.assertTrue(set(sql.TRIGRAM_INDEXES) <=
+                        set(self.pg_api.get_indexes()))
+        self.assertEqual(self.pg_api.search('mazy star')[0][0],
+                         'Mazzy Star')
+
+
+if __name__ == '__main__':
+    unittest.main()
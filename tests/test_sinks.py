@@ -0,0 +1,101 @@
+"""Unit tests for the load sinks taking per-table batches."""
+import unittest
+import os
+import pathlib
+import tempfile
+import pandas
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import sinks
+from media_etl.db import transform
+from media_etl.db.postgres_api import PostgresMedia
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestSinks(unittest.TestCase):
+    """Test case class for sinks.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.df = pandas.read_json(self.valid_json_file, orient='split',
+                                   dtype=False)
+        self.table_rows = transform.table_rows(self.df.copy())
+        # no pool: the sinks below load without Postgres
+        self.offline = PostgresMedia(connect=False)
+
+    def tearDown(self):
+        self.offline.close()
+
+    def test_memory(self):
+        """Memory keeps the row tuples, null only counts them."""
+        batch = transform.column_batch(self.df)
+        memory, null = sinks.MemorySink(), sinks.create_sink('null')
+        for sink in [memory, null]:
+            self.assertEqual(sink.load(batch.slice(0, 5)), 5)
+            self.assertEqual(sink.load(batch.slice(5)), 7)
+            report = sink.report()
+            self.assertEqual((report['rows'], report['duplicates']),
+                             (12, 0))
+            self.assertGreater(report['rows_per_sec'], 0)
+        self.assertEqual(null.name, 'null')
+        self.assertEqual(null.tables, {})
+        for table in sql.HEADERS:
+            self.assertEqual(memory.tables[table], self.table_rows[table])
+        with self.assertRaises(ValueError):
+            sinks.create_sink('csv')
+        with self.assertRaises(TypeError):
+            type('NoWrite', (sinks.Sink,), {})()
+
+    def test_load_file(self):
+        """load_file() batches into any sink, timing it as a stage."""
+        self.assertFalse(self.offline.is_connected())
+        sink = sinks.MemorySink()
+        stats = self.offline.load_file(self.valid_json_file, engine='copy',
+                                       batch_size=5, sink=sink)
+        self.assertTrue(stats['status'])
+        self.assertEqual((stats['rows'], stats['sink']), (12, 'memory'))
+        self.assertGreater(stats['seconds'], stats['sink_seconds'])
+        self.assertEqual(self.offline.metrics.stages['sink.memory'][1], 3)
+        self.assertEqual(len(sink.tables[sql.TRACK]), 12)
+
+    def test_sqlite(self):
+        """A load_data() run writes every table to a SQLite file."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sink = sinks.SqliteSink(pathlib.Path(temp_dir, 'media.sqlite'))
+            summary = self.offline.load_data(self.valid_json_file.parent,
+                                             engine='copy', sink=sink)
+            self.assertTrue(summary['status'])
+            self.assertEqual(summary['rows'], sink.rows)
+            for table in sql.HEADERS:
+                self.assertEqual(sink.count(table), sink.rows)
+            modified = sink.conn.execute(
+                f"SELECT last_modified FROM {sql.FILE_META} "
+                f"WHERE last_modified IS NOT NULL;").fetchone()[0]
+            self.assertIsInstance(modified, str)
+            sink.close()
+
+    def test_postgres(self):
+        """The Postgres sink is the default load target, dedup included."""
+        pg_api = PostgresMedia()
+        pg_api.drop_tables()
+        pg_api.create_tables()
+        sink = sinks.PostgresSink(pg_api, engine='copy')
+        stats = pg_api.load_file(self.valid_json_file, engine='copy',
+                                 sink=sink)
+        self.assertEqual((stats['rows'], stats['sink']), (12, 'postgres'))
+        stats = pg_api.load_file(self.valid_json_file, engine='copy',
+                                 sink=sink)
+        self.assertEqual((stats['rows'], stats['duplicates']), (0, 12))
+        self.assertEqual((sink.rows, sink.duplicates), (12, 12))
+        self.assertEqual(sinks.PostgresSink(pg_api, 'insert').flush_size(5),
+                         1)
+        count = pg_api.query("SELECT COUNT(*) FROM track",
+                             verbose=False)[0][0]
+        self.assertEqual(count, 12)
+        pg_api.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
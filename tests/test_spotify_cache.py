@@ -0,0 +1,128 @@
+"""Unit tests for the persistent Spotify ID lookup cache."""
+import unittest
+import pathlib
+import sqlite3
+import tempfile
+import time
+from media_etl.db.spotify import (OFFLINE_ALBUM_IDS, OFFLINE_ARTIST_IDS,
+                                  SpotifyClient)
+from media_etl.db.spotify_cache import LookupCache, normalize
+
+
+class TestLookupCache(unittest.TestCase):
+    """Test case class for spotify_cache.py."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = pathlib.Path(self.temp_dir.name, 'lookup.sqlite')
+        self.cache = LookupCache(self.cache_path)
+
+    def test_normalize(self):
+        """Artist names match regardless of case and spacing."""
+        self.assertEqual(normalize('  Mazzy   STAR '), 'mazzy star')
+        self.assertEqual(self.cache.artist_key('Björk'),
+                         self.cache.artist_key('BJÖRK'))
+
+    def test_hits_and_misses(self):
+        """Counters track cache hits and misses."""
+        self.assertIsNone(self.cache.get_artist_id('Ravel'))
+        self.cache.put_artist_id('Ravel', '17hR0sYHpx7VYTMRfFUOmY')
+        self.assertEqual(self.cache.get_artist_id('ravel'),
+                         '17hR0sYHpx7VYTMRfFUOmY')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_persistent(self):
+        """Entries survive reopening the cache file."""
+        self.cache.put_album_id('a1', 'Debut', 'b1')
+        self.cache.close()
+        self.cache = LookupCache(self.cache_path)
+        self.assertEqual(self.cache.get_album_id('a1', 'debut'), 'b1')
+        self.assertIsNone(self.cache.get_album_id('a2', 'Debut'))
+
+    def test_albums(self):
+        """Discographies round-trip as album ID/name lists."""
+        self.assertIsNone(self.cache.get_albums('a1'))
+        self.cache.put_albums('a1', [{'id': 'b1', 'name': 'Debut',
+                                      'album_type': 'album'}])
+        self.assertEqual(self.cache.get_albums('a1'),
+                         [{'id': 'b1', 'name': 'Debut'}])
+
+    def test_ttl(self):
+        """Expired entries are dropped and reported as misses."""
+        self.cache.ttl = 0.01
+        self.cache.put_artist_id('Interpol', 'i1')
+        time.sleep(0.05)
+        self.assertIsNone(self.cache.get_artist_id('Interpol'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted above max_entries."""
+        self.cache.max_entries = 2
+        self.cache.put('k1', 'v1')
+        time.sleep(0.01)
+        self.cache.put('k2', 'v2')
+        time.sleep(0.01)
+        self.cache.get('k1')
+        self.cache.put('k3', 'v3')
+        self.assertIsNone(self.cache.get('k2'))
+        self.assertEqual(self.cache.get('k1'), 'v1')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_shared_file(self):
+        """Eviction counts entries written by other cache instances."""
+        other = LookupCache(self.cache_path, max_entries=3)
+        self.cache.max_entries = 3
+        self.cache.put_many({'k1': 'v1', 'k2': 'v2'})
+        other.put_many({'k3': 'v3', 'k4': 'v4'})
+        self.assertEqual(other.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['size'], 3)
+        other.close()
+
+    def test_batched_access(self):
+        """Hits are written with the next put or on close, not per get."""
+        self.cache.put('k1', 'v1')
+        accessed_query = "SELECT accessed FROM lookup WHERE key = 'k1'"
+        with sqlite3.connect(str(self.cache_path)) as conn:
+            accessed = conn.execute(accessed_query).fetchone()[0]
+            time.sleep(0.01)
+            self.assertEqual(self.cache.get('k1'), 'v1')
+            self.assertEqual(conn.execute(accessed_query).fetchone()[0],
+                             accessed)
+            self.cache.flush()
+            self.assertGreater(conn.execute(accessed_query).fetchone()[0],
+                               accessed)
+
+    def test_warm(self):
+        """Offline IDs pre-warm artist and album keys."""
+        count = self.cache.warm({'Björk': 'a1'}, {'Debut': 'b1'},
+                                {'Debut': 'Björk'})
+        self.assertEqual(count, 2)
+        self.assertEqual(self.cache.get_artist_id('Björk'), 'a1')
+        self.assertEqual(self.cache.get_album_id('a1', 'Debut'), 'b1')
+
+    def test_offline_not_cached(self):
+        """Offline client IDs are returned but never stored."""
+        client = SpotifyClient(pathlib.Path(self.temp_dir.name,
+                                            'missing.cfg'),
+                               pathlib.Path(self.temp_dir.name,
+                                            'client.sqlite'))
+        self.assertFalse(client.run_spotify())
+        name, title = next(iter(OFFLINE_ARTIST_IDS)), 'Debut'
+        self.assertEqual(client.get_artist_id(name),
+                         OFFLINE_ARTIST_IDS[name])
+        self.assertEqual(client.get_album_id('a1', title),
+                         OFFLINE_ALBUM_IDS[title])
+        self.assertEqual(client.cache.stats()['size'], 0)
+        client.warm_cache()
+        self.assertEqual(client.cache.get_artist_id(name),
+                         OFFLINE_ARTIST_IDS[name])
+        client.cache.close()
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
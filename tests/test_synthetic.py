@@ -0,0 +1,55 @@
+"""Unit tests to generate synthetic media libraries."""
+import unittest
+import pathlib
+import tempfile
+import pandas
+from media_etl.db import synthetic
+from media_etl.db.json_stream import SplitJsonReader
+
+
+class TestSynthetic(unittest.TestCase):
+    """Test case class for synthetic.py."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = pathlib.Path(self.temp_dir.name)
+
+    def test_generate_library(self):
+        """Rows split across files and read back by pandas and streaming."""
+        json_paths = synthetic.generate_library(
+            self.output_path, tracks=250, artists=10, albums_per_artist=3,
+            tracks_per_file=100)
+        self.assertEqual(len(json_paths), 3)
+        rows = [row for json_path in json_paths
+                for row in SplitJsonReader(json_path).iter_rows()]
+        self.assertEqual(len(rows), 250)
+        df = pandas.read_json(json_paths[-1], orient='split', dtype=False)
+        self.assertEqual(list(df.columns), synthetic.COLUMNS)
+        self.assertEqual(len(df), 50)
+        self.assertEqual(len(set(row[-4] for row in rows)), 250)
+
+    def test_deterministic(self):
+        """The same seed writes the same library."""
+        first = synthetic.generate_library(self.output_path, tracks=20,
+                                           artists=5, seed=7)[0]
+        expected = first.read_text(encoding='utf-8')
+        second = synthetic.generate_library(self.output_path, tracks=20,
+                                            artists=5, seed=7)[0]
+        self.assertEqual(second.read_text(encoding='utf-8'), expected)
+
+    def test_offline_ids(self):
+        """Every generated artist and album has an offline ID."""
+        synthetic.generate_library(self.output_path, tracks=50, artists=6,
+                                   albums_per_artist=2)
+        ids = synthetic.load_offline_ids(self.output_path)
+        self.assertEqual(len(ids['artist_ids']), 6)
+        self.assertEqual(len(ids['album_ids']), 12)
+        self.assertEqual(set(ids['album_artists'].values()),
+                         set(ids['artist_ids']))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Unit tests to transform media DataFrame chunks into table rows."""
+import unittest
+import datetime
+import os
+import pathlib
+import pandas
+from media_etl.db import postgres_insert_queries as sql
+from media_etl.db import transform
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class TestTransform(unittest.TestCase):
+    """Test case class for transform.py."""
+
+    def setUp(self):
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+        self.df = pandas.read_json(self.valid_json_file, orient='split',
+                                   dtype=False)
+
+    def test_table_rows(self):
+        """One tuple per row and table, in HEADERS column order."""
+        rows = transform.table_rows(self.df)
+        self.assertEqual(list(rows), list(sql.HEADERS))
+        for table, headers in sql.HEADERS.items():
+            self.assertEqual(len(rows[table]), len(self.df))
+            self.assertEqual(len(rows[table][0]), len(headers))
+        file_row = dict(zip(sql.FILE_HEADERS, rows[sql.FILE_META][0]))
+        self.assertEqual(file_row['file_size'], 14059520)
+        self.assertEqual(file_row['last_modified'],
+                         datetime.datetime(2020, 4, 11, 20, 37, 13, 521000))
+        album_row = dict(zip(sql.ALBUM_HEADERS, rows[sql.ALBUM][0]))
+        self.assertEqual((album_row['year'], album_row['album_gain']),
+                         (2013, -8.81))
+
+    def test_invalid_values(self):
+        """Unparseable or missing values become None."""
+        self.df.loc[0, 'year'] = 'unknown'
+        self.df.loc[1, 'track_gain'] = ''
+        self.df.loc[2, 'last_modified'] = None
+        self.df.loc[3, 'comment'] = None
+        rows = transform.table_rows(self.df)
+        self.assertIsNone(rows[sql.ALBUM][0][sql.ALBUM_HEADERS.index('year')])
+        self.assertIsNone(
+            rows[sql.TRACK][1][sql.TRACK_HEADERS.index('track_gain')])
+        self.assertIsNone(rows[sql.FILE_META][2][
+            sql.FILE_HEADERS.index('last_modified')])
+        self.assertIsNone(
+            rows[sql.TRACK][3][sql.TRACK_HEADERS.index('comment')])
+        self.assertIsInstance(rows[sql.TRACK][0][
+            sql.TRACK_HEADERS.index('track_number')], int)
+
+    def test_headers_map(self):
+        """Extra upsert columns such as source_id are projected too."""
+        self.df[sql.SOURCE_COLUMN] = 7
+        rows = transform.table_rows(self.df, sql.UPSERT_HEADERS)
+        self.assertEqual(rows[sql.TRACK][0][-1], 7)
+        self.assertEqual(transform.table_rows(self.df.iloc[:0])[sql.ARTIST],
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""Unit tests to watch a directory and load new media files."""
+import unittest
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+from media_etl.db import watch
+from media_etl.db.postgres_api import PostgresMedia
+
+BASE_DIR, SCRIPT_NAME = os.path.split(os.path.abspath(__file__))
+PARENT_PATH, CURR_DIR = os.path.split(BASE_DIR)
+
+
+class FailingApi:
+    """PostgresMedia stand-in whose first sync_file() of a file raises."""
+
+    def __init__(self):
+        self.calls = []
+
+    def sync_data(self, *args):
+        return {'status': True}
+
+    def sync_file(self, path, *args):
+        self.calls.append(path)
+        if self.calls.count(path) == 1:
+            raise RuntimeError('server went away')
+        return {'file': str(path), 'status': True, 'rows': 12}
+
+    def refresh_views(self):
+        return True
+
+
+class TestWatch(unittest.TestCase):
+    """Test case class for watch.py."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.watch_path = pathlib.Path(self.temp_dir.name)
+        self.valid_json_file = pathlib.Path(PARENT_PATH, 'data',
+                                            'input', 'media_lib.json')
+
+    def drop(self, name: str) -> pathlib.Path:
+        """Copy the sample library in as a partial file, then rename it."""
+        part_path = pathlib.Path(self.watch_path, f"{name}.part")
+        shutil.copyfile(self.valid_json_file, part_path)
+        return part_path.rename(pathlib.Path(self.watch_path, name))
+
+    def test_debouncer(self):
+        """Files are ready only after debounce seconds without changes."""
+        json_path = pathlib.Path(self.watch_path, 'a.json')
+        json_path.write_text('{"columns"')
+        debouncer = watch.Debouncer(debounce=2.0)
+        debouncer.touch([json_path], now=10.0)
+        self.assertEqual(debouncer.ready(now=11.0), [])
+        debouncer.touch([json_path], now=11.5)
+        self.assertEqual(debouncer.ready(now=13.0), [])
+        self.assertEqual(debouncer.ready(now=13.5), [(json_path, 10.0)])
+        self.assertEqual(len(debouncer), 0)
+        debouncer.touch([pathlib.Path(self.watch_path, 'gone.json')], now=0)
+        self.assertEqual(debouncer.ready(now=5.0), [])
+        self.assertEqual(len(debouncer), 0)
+
+    def test_debouncer_growing_file(self):
+        """A file still growing at the deadline is held back."""
+        json_path = pathlib.Path(self.watch_path, 'a.json')
+        json_path.write_text('{"columns"')
+        debouncer = watch.Debouncer(debounce=1.0)
+        debouncer.touch([json_path], now=0.0)
+        json_path.write_text('{"columns": []}')
+        self.assertEqual(debouncer.ready(now=2.0), [])
+        self.assertEqual(debouncer.ready(now=3.0), [(json_path, 0.0)])
+
+    def test_polling_source(self):
+        """New and modified source files are reported, others are not."""
+        baseline = pathlib.Path(self.watch_path, 'old.json')
+        baseline.write_text('{}')
+        source = watch.PollingSource(self.watch_path, interval=0.05)
+        pathlib.Path(self.watch_path, 'notes.txt').write_text('skip')
+        new_path = self.drop('new.json')
+        changed = set()
+        for _ in range(20):
+            changed |= source.changes(timeout=0.05)
+        self.assertEqual(changed, {new_path})
+        source.close()
+
+    @unittest.skipIf(watch.inotify_simple is None,
+                     "inotify_simple not installed")
+    def test_inotify_source(self):
+        """Files moved into new subdirectories are reported."""
+        source = watch.change_source(self.watch_path)
+        self.assertIsInstance(source, watch.InotifySource)
+        sub_path = pathlib.Path(self.watch_path, 'sub')
+        sub_path.mkdir()
+        self.assertEqual(source.changes(timeout=0.5), set())
+        new_path = pathlib.Path(sub_path, 'new.json')
+        new_path.write_text('{}')
+        changed = set()
+        for _ in range(5):
+            changed |= source.changes(timeout=0.1)
+        self.assertEqual(changed, {new_path})
+        source.close()
+
+    def test_watch_data(self):
+        """A file dropped while watching is loaded once it settles."""
+        pg_api = PostgresMedia(hostname='localhost',
+                               port_num=5432,
+                               username='run_admin_run',
+                               password='run_pass_run')
+        pg_api.drop_tables()
+        pg_api.create_tables()
+        stop_event = threading.Event()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(
+            pg_api.watch_data(self.watch_path, debounce=0.3,
+                              poll_interval=0.1, stop_event=stop_event,
+                              max_files=1, timeout=20)))
+        thread.start()
+        time.sleep(1.0)
+        json_path = self.drop('media_lib.json')
+        thread.join(timeout=30)
+        stop_event.set()
+        self.assertTrue(result['status'])
+        self.assertEqual((result['loaded'], result['rows']), (1, 12))
+        self.assertLess(result['latency'], 10)
+        self.assertTrue(pg_api.is_fresh('genre_summary'))
+        stats = pg_api.sync_file(json_path)
+        self.assertEqual((stats['status'], stats['rows']), (True, 0))
+        count = pg_api.query("SELECT COUNT(*) FROM filedata")[0][0]
+        self.assertEqual(count, 12)
+        pg_api.close()
+
+    def test_watch_failed_load(self):
+        """A load that raises is recorded and the file can load again."""
+        pg_api = FailingApi()
+        watcher = watch.Watcher(pg_api, self.watch_path, workers=1,
+                                debounce=0.2, poll_interval=0.1,
+                                use_inotify=False)
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(
+            watcher.run(max_files=2, timeout=20)))
+        thread.start()
+        time.sleep(0.5)
+        json_path = self.drop('media_lib.json')
+        while not watcher.results and thread.is_alive():
+            time.sleep(0.1)
+        os.utime(json_path, ns=(1, 1))
+        thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([r['status'] for r in watcher.results],
+                         [False, True])
+        self.assertEqual(result['failed'], [str(json_path)])
+        self.assertEqual((result['loaded'], result['rows']), (1, 12))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()